@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures how many activation emails per second are rendered, with the
+templates resolved per email by ``render_to_string`` and with an
+``EmailBundle``. Run by ::
+
+    python benchmarks/bench_mail.py --emails=2000 --html
+
+"""
+import os
+import sys
+import timeit
+from optparse import OptionParser
+
+# The test settings import their urls from the runtests directory.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "userena", "runtests"))
+os.environ['DJANGO_SETTINGS_MODULE'] = 'userena.runtests.settings'
+
+import django
+
+if django.VERSION >= (1, 7, 0):
+    django.setup()
+
+from django.template.loader import render_to_string
+
+from userena import settings as userena_settings
+from userena.mail import get_email_bundle, html_to_text
+
+TEMPLATE_NAME = 'userena/emails/activation_email'
+
+
+def render_separately(context):
+    subject = render_to_string(TEMPLATE_NAME + '_subject.txt', context)
+    if userena_settings.USERENA_HTML_EMAIL:
+        message_html = render_to_string(TEMPLATE_NAME + '_message.html', context)
+        return subject, html_to_text(message_html), message_html
+    return subject, render_to_string(TEMPLATE_NAME + '_message.txt', context), None
+
+
+def render_bundle(context):
+    subject, message_plain, message_html = get_email_bundle(TEMPLATE_NAME).render(context)
+    if not message_plain:
+        message_plain = html_to_text(message_html)
+    return subject, message_plain, message_html
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--emails', type='int', default=1000,
+                      help='Amount of emails rendered per run.')
+    parser.add_option('--repeat', type='int', default=3,
+                      help='Amount of runs, the fastest one is reported.')
+    parser.add_option('--html', action='store_true', default=False,
+                      help='Render HTML emails without a plain text template.')
+    options, args = parser.parse_args()
+
+    userena_settings.USERENA_HTML_EMAIL = options.html
+    userena_settings.USERENA_USE_PLAIN_TEMPLATE = not options.html
+    context = {'user': {'username': 'alice'}, 'without_usernames': False,
+               'protocol': 'https', 'activation_days': 7,
+               'activation_key': 'f' * 40,
+               'site': {'domain': 'example.com', 'name': 'example.com'}}
+
+    for name, render in (('render_to_string', render_separately),
+                         ('EmailBundle', render_bundle)):
+        seconds = min(timeit.repeat(lambda: render(context), number=options.emails,
+                                    repeat=options.repeat))
+        sys.stdout.write("%-16s %10.0f emails/s\n" % (name, options.emails / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the hot paths of userena and umessages.
+
+Every benchmark reports the latency percentiles, the queries per operation
+and the peak memory, and all results are written as JSON so runs of
+different commits can be compared. The test settings are used with an
+in-memory SQLite database, or with PostgreSQL when ``--postgres`` names a
+database (the ``PGHOST``, ``PGUSER`` and ``PGPASSWORD`` environment
+variables are used to connect). Run by ::
+
+    python benchmarks/run.py --output=before.json
+    python benchmarks/run.py --sizes=10000,100000,1000000 --only=check_permissions
+
+"""
+import gc
+import json
+import os
+import sys
+import timeit
+from optparse import OptionParser
+
+# The test settings import their urls from the runtests directory.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "userena", "runtests"))
+os.environ['DJANGO_SETTINGS_MODULE'] = 'userena.runtests.settings'
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python < 3.4, only the peak of the whole process is known.
+    tracemalloc = None
+    import resource
+
+parser = OptionParser()
+parser.add_option('--iterations', type='int', default=20,
+                  help='Amount of operations measured per benchmark.')
+parser.add_option('--sizes', default='10000',
+                  help='Comma separated amounts of users for the benchmarks '
+                       'of whole tables.')
+parser.add_option('--only', default='',
+                  help='Comma separated names of the benchmarks to run.')
+parser.add_option('--postgres', default='',
+                  help='Name of a PostgreSQL database to run against.')
+parser.add_option('--output', default='',
+                  help='File the JSON results are written to, stdout by default.')
+
+BENCHMARKS = []
+
+#: Part of the users whose activation expired in ``delete_expired_users``.
+EXPIRED_RATIO = 0.1
+
+
+def benchmark(func):
+    """ Registers a benchmark, which yields its measurements. """
+    BENCHMARKS.append(func)
+    return func
+
+
+def percentile(timings, percent):
+    """ Returns the ``percent`` percentile of the sorted ``timings``. """
+    index = int(round(percent / 100.0 * (len(timings) - 1)))
+    return timings[index]
+
+
+def measure(name, operation, iterations, setup=None, **params):
+    """
+    Runs ``operation`` ``iterations`` times and returns its measurements.
+    ``setup`` is called before every operation, outside of the measurement,
+    and returns the arguments of the operation.
+
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    timings, queries = [], []
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+    for i in range(iterations):
+        args = setup(i) if setup else ()
+        with CaptureQueriesContext(connection) as context:
+            start = timeit.default_timer()
+            operation(*args)
+            timings.append(timeit.default_timer() - start)
+        queries.append(len(context.captured_queries))
+    if tracemalloc is not None:
+        peak_memory = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    else: peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    timings.sort()
+    result = {'name': name,
+              'params': params,
+              'iterations': iterations,
+              'mean_ms': 1000 * sum(timings) / len(timings),
+              'p50_ms': 1000 * percentile(timings, 50),
+              'p90_ms': 1000 * percentile(timings, 90),
+              'p99_ms': 1000 * percentile(timings, 99),
+              'queries': float(sum(queries)) / len(queries),
+              'peak_memory_kb': peak_memory}
+    sys.stderr.write("%-36s %9.2f ms p50 %9.2f ms p99 %8.1f queries %10d kB\n" % (
+        name + ''.join(' %s=%s' % item for item in sorted(params.items())),
+        result['p50_ms'], result['p99_ms'], result['queries'], peak_memory))
+    return result
+
+
+def create_users(amount, **kwargs):
+    """ Generates ``amount`` users that sign in with ``swordfish``. """
+    from userena.generate import generate_users
+    if amount > 0:
+        generate_users(amount, password='swordfish', **kwargs)
+
+
+def fill_users(size, **kwargs):
+    """
+    Generates users until there are ``size``. Returns ``False``, with a
+    warning, when there are already more, because earlier benchmarks created
+    them.
+
+    """
+    from userena.utils import get_user_model
+    count = get_user_model().objects.count()
+    if count > size:
+        sys.stderr.write("Skipping size %d, there are already %d users.\n" % (size, count))
+        return False
+    create_users(size - count, **kwargs)
+    return True
+
+
+def signed_in_client(username):
+    from django.test.client import Client
+    client = Client()
+    client.login(username=username, password='swordfish')
+    return client
+
+
+@benchmark
+def signup(options):
+    from django.core import mail
+    from userena.models import UserenaSignup
+
+    def create_user(i):
+        mail.outbox = []
+        UserenaSignup.objects.create_user('signup%d' % i, 'signup%d@example.com' % i,
+                                          'swordfish')
+    yield measure('signup', create_user, options.iterations,
+                  setup=lambda i: (i, ))
+
+
+@benchmark
+def activation(options):
+    from userena.models import UserenaSignup
+
+    def setup(i):
+        user = UserenaSignup.objects.create_user('activation%d' % i,
+                                                 'activation%d@example.com' % i,
+                                                 'swordfish', send_email=False)
+        return (user.userena_signup.activation_key, )
+    yield measure('activation', UserenaSignup.objects.activate_user,
+                  options.iterations, setup=setup)
+
+
+@benchmark
+def signin(options):
+    from django.core.urlresolvers import reverse
+    from django.test.client import Client
+
+    yield measure('signin', lambda client: client.post(
+        reverse('userena_signin'),
+        data={'identification': 'user1', 'password': 'swordfish'}),
+        options.iterations, setup=lambda i: (Client(), ))
+
+
+@benchmark
+def profile_detail(options):
+    from django.core.urlresolvers import reverse
+
+    client = signed_in_client('user1')
+    url = reverse('userena_profile_detail', kwargs={'username': 'user2'})
+    yield measure('profile_detail', lambda: client.get(url), options.iterations)
+
+
+@benchmark
+def profile_list(options):
+    from django.core.urlresolvers import reverse
+    from userena import settings as userena_settings
+
+    userena_settings.USERENA_DISABLE_PROFILE_LIST = False
+    client = signed_in_client('user1')
+    url = reverse('userena_profile_list')
+    try:
+        yield measure('profile_list', lambda: client.get(url), options.iterations)
+    finally:
+        userena_settings.USERENA_DISABLE_PROFILE_LIST = True
+
+
+@benchmark
+def send_message(options):
+    from userena.contrib.umessages.models import Message
+    from userena.utils import get_user_model
+
+    User = get_user_model()
+    sender = User.objects.get(username='user1')
+    create_users(1000, prefix='recipient', active_ratio=1, expired_ratio=0,
+                 permissions=False)
+    recipients = list(User.objects.filter(username__startswith='recipient'))
+    for amount in (1, 10, 1000):
+        yield measure('send_message', lambda: Message.objects.send_message(
+            sender, recipients[:amount], 'Hello'),
+            options.iterations if amount < 1000 else max(1, options.iterations // 10),
+            recipients=amount)
+
+
+@benchmark
+def conversation(options):
+    from django.core.urlresolvers import reverse
+    from userena.contrib.umessages.models import Message
+    from userena.utils import get_user_model
+
+    User = get_user_model()
+    john, jane = User.objects.get(username='user1'), User.objects.get(username='user2')
+    for i in range(50):
+        Message.objects.send_message(john if i % 2 else jane,
+                                     [jane if i % 2 else john], 'Message %d' % i)
+    client = signed_in_client('user1')
+    url = reverse('userena_umessages_detail', kwargs={'username': 'user2'})
+    yield measure('conversation', lambda: client.get(url), options.iterations)
+
+
+@benchmark
+def inbox(options):
+    from django.core.urlresolvers import reverse
+    from userena.contrib.umessages.models import Message
+    from userena.utils import get_user_model
+
+    User = get_user_model()
+    user = User.objects.get(username='user1')
+    for contact in User.objects.filter(username__startswith='user').exclude(pk=user.pk)[:50]:
+        Message.objects.send_message(contact, [user], 'Hello')
+    client = signed_in_client('user1')
+    url = reverse('userena_umessages_list')
+    yield measure('inbox', lambda: client.get(url), options.iterations)
+
+
+@benchmark
+def check_permissions(options):
+    from userena.models import UserenaSignup
+    from userena.utils import get_user_model
+
+    for size in options.sizes:
+        if fill_users(size):
+            yield measure('check_permissions', UserenaSignup.objects.check_permissions,
+                          1, users=get_user_model().objects.count())
+
+
+@benchmark
+def delete_expired_users(options):
+    from userena.models import UserenaSignup
+    from userena.utils import get_user_model
+
+    # Every size gets its own expired users, because the previous size
+    # deleted them. Expired users of other benchmarks are deleted first.
+    for size in options.sizes:
+        UserenaSignup.objects.delete_expired_users()
+        # Less expired users when other benchmarks left no room for them.
+        expired = min(int(size * EXPIRED_RATIO),
+                      size - get_user_model().objects.count())
+        if expired <= 0:
+            sys.stderr.write("Skipping size %d, there are already %d users.\n" % (
+                size, get_user_model().objects.count()))
+            continue
+        fill_users(size - expired, expired_ratio=0)
+        create_users(expired, prefix='expired', active_ratio=0, expired_ratio=1)
+        yield measure('delete_expired_users', UserenaSignup.objects.delete_expired_users,
+                      1, users=get_user_model().objects.count(), expired=expired)
+
+
+def main():
+    options, args = parser.parse_args()
+    options.sizes = [int(size) for size in options.sizes.split(',') if size]
+    only = [name for name in options.only.split(',') if name]
+
+    from django.conf import settings
+    if options.postgres:
+        settings.DATABASES['default'] = {
+            'ENGINE': 'django.db.backends.postgresql_psycopg2',
+            'NAME': options.postgres,
+            'HOST': os.environ.get('PGHOST', ''),
+            'USER': os.environ.get('PGUSER', ''),
+            'PASSWORD': os.environ.get('PGPASSWORD', '')}
+    settings.EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+    settings.SILENCED_SYSTEM_CHECKS = ['1_6.W001']
+
+    import django
+    if django.VERSION >= (1, 7, 0):
+        django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        create_users(100, active_ratio=1, expired_ratio=0)
+        results = []
+        for func in BENCHMARKS:
+            if not only or func.__name__ in only:
+                results.extend(func(options))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    report = {'database': connection.vendor,
+              'django': django.get_version(),
+              'python': sys.version.split()[0],
+              'results': results}
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    else: sys.stdout.write(json.dumps(report, indent=2, sort_keys=True) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,25 @@
 import django.core.validators
 from django.contrib.auth.backends import ModelBackend
+from django.db.models import Q
 
-from userena.utils import get_user_model
+from userena import settings as userena_settings
+from userena.cache import USER_KEY, get_cache, get_profile_id_version
+from userena.utils import get_owner_perms, get_user_model
+
+_identification_max_length = []
+
+def get_identification_max_length():
+    """
+    Returns the maximum length of an email or username. Longer
+    identifications can't belong to any user.
+
+    """
+    if not _identification_max_length:
+        User = get_user_model()
+        _identification_max_length.append(
+            max(User._meta.get_field(name).max_length
+                for name in ('email', 'username')))
+    return _identification_max_length[0]
 
 class UserenaAuthenticationBackend(ModelBackend):
     """
@@ -30,21 +48,124 @@ class UserenaAuthenticationBackend(ModelBackend):
 
         """
         User = get_user_model()
-        try:
-            django.core.validators.validate_email(identification)
-            try: user = User.objects.get(email__iexact=identification)
-            except User.DoesNotExist: return None
-        except django.core.validators.ValidationError:
-            try: user = User.objects.get(username__iexact=identification)
-            except User.DoesNotExist: return None
+        if not identification or len(identification) > get_identification_max_length():
+            return None
+        if userena_settings.USERENA_AUTHENTICATION_SINGLE_QUERY:
+            user = self.get_user_by_identification(identification)
+            if user is None: return None
+        else:
+            try:
+                django.core.validators.validate_email(identification)
+                try: user = User.objects.get(email__iexact=identification)
+                except User.DoesNotExist: return None
+            except django.core.validators.ValidationError:
+                try: user = User.objects.get(username__iexact=identification)
+                except User.DoesNotExist: return None
         if check_password:
             if user.check_password(password):
                 return user
             return None
         else: return user
 
+    def get_user_by_identification(self, identification):
+        """
+        Returns the user with ``identification`` as email or username, looked
+        up with a single query over both columns.
+
+        When both match, an identification with an ``@`` prefers the user
+        with that email and others the user with that username. Remaining
+        ties go to the user with the lowest id.
+
+        :return: The :class:`User` or ``None``.
+
+        """
+        users = list(get_user_model().objects.filter(
+            Q(email__iexact=identification) | Q(username__iexact=identification)
+        ).order_by('pk'))
+        preferred = 'email' if '@' in identification else 'username'
+        identification = identification.lower()
+        for user in users:
+            if (getattr(user, preferred) or '').lower() == identification:
+                return user
+        return users[0] if users else None
+
     def get_user(self, user_id):
         User = get_user_model()
         try: return User.objects.get(pk=user_id)
         except User.DoesNotExist:
             return None
+
+
+class CachedUserenaAuthenticationBackend(UserenaAuthenticationBackend):
+    """
+    A :class:`UserenaAuthenticationBackend` that keeps the users it returns
+    from :meth:`get_user` in the cache for
+    ``USERENA_USER_CACHE_TIMEOUT`` seconds. This removes the query for the
+    user of every authenticated request.
+
+    A cached user is fetched again when it's saved or deleted, which includes
+    a change of the password, so sessions are still invalidated. Changes
+    which don't send ``post_save``, like ``QuerySet.update``, are only seen
+    after the timeout, so keep it short if you make those.
+
+    The password hash isn't cached. The user is cached with its password
+    deferred, together with the session hash Django uses to verify the
+    session.
+
+    """
+    def get_user(self, user_id):
+        cache = get_cache()
+        key = USER_KEY % user_id
+        version = get_profile_id_version(user_id)
+        entry = cache.get(key)
+        if entry is not None and entry[0] == version:
+            user, session_hash = entry[1], entry[2]
+            if session_hash is not None:
+                user.get_session_auth_hash = lambda: session_hash
+            return user
+
+        user = super(CachedUserenaAuthenticationBackend, self).get_user(user_id)
+        if user is not None:
+            try:
+                cached_user = get_user_model().objects.defer('password').get(pk=user.pk)
+            except get_user_model().DoesNotExist:
+                return user
+            session_hash = user.get_session_auth_hash() \
+                if hasattr(user, 'get_session_auth_hash') else None
+            cache.set(key, (version, cached_user, session_hash),
+                      userena_settings.USERENA_USER_CACHE_TIMEOUT)
+        return user
+
+
+class OwnerPermissionBackend(object):
+    """
+    Object permission backend that gives users the ``ASSIGNED_PERMISSIONS``
+    on their own user and profile, so they don't need a row in the
+    permission tables of guardian. Enable it together with
+    ``USERENA_IMPLICIT_OWNER_PERMISSIONS``, in front of guardian's
+    ``ObjectPermissionBackend``.
+
+    The ownership is read from the objects themselves, so a check doesn't
+    query the database.
+
+    """
+    supports_object_permissions = True
+    supports_anonymous_user = True
+    supports_inactive_user = True
+
+    def authenticate(self, **credentials):
+        return None
+
+    def has_perm(self, user_obj, perm, obj=None):
+        if obj is None:
+            return False
+        if '.' in perm:
+            app_label, perm = perm.split('.', 1)
+            if app_label != obj._meta.app_label:
+                return False
+        return perm in get_owner_perms(user_obj, obj)
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if obj is None:
+            return set()
+        return set(get_owner_perms(user_obj, obj))
@@ -0,0 +1,338 @@
+"""
+Versions of profiles kept in the cache.
+
+Every profile has a version, the time it last changed. It's bumped when the
+user or the profile is saved and when one of the ``profile_change``,
+``email_change`` or ``confirmation_complete`` signals is sent. The profile
+list has a version of its own, which is bumped when any profile changes.
+
+The versions are used to answer conditional GET requests of the profile
+views with ``304 Not Modified`` and to check the profiles cached by
+:func:`get_profile_by_username` and :func:`get_profile_by_id`. At the same time the profile page is purged
+from the CDN, see :mod:`userena.cdn`. Use a cache that is shared between all
+processes, otherwise a process can answer with an outdated version.
+
+The versions are only bumped while one of the features that uses them is
+enabled.
+
+"""
+import datetime
+import time
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.signals import post_save, post_delete
+from django.utils.six import text_type
+from django.utils.translation import get_language
+
+from userena import settings as userena_settings
+from userena import signals as userena_signals
+from userena.cdn import purge_profile
+from userena.compat import md5_constructor
+from userena.utils import connect_user_and_profile, get_profile_model, \
+    get_user_model, get_user_profile
+
+try:
+    from importlib import import_module
+except ImportError:
+    # Python 2.6
+    from django.utils.importlib import import_module
+
+PROFILE_VERSION_KEY = 'userena:profile_version:%s'
+PROFILE_LIST_VERSION_KEY = 'userena:profile_list_version'
+PROFILE_ID_VERSION_KEY = 'userena:profile_id_version:%s'
+PROFILE_KEY = 'userena:profile:%s'
+USERNAME_KEY = 'userena:username:%s'
+USER_KEY = 'userena:user:%s'
+
+#: Seconds a process may fetch a profile before others stop waiting for it.
+PROFILE_LOCK_TIMEOUT = 10
+#: Seconds between two looks in the cache while another process fetches.
+PROFILE_LOCK_WAIT = 0.05
+PROFILE_LOCK_RETRIES = 20
+
+
+def get_cache():
+    """ Returns the cache defined by ``USERENA_CACHE_ALIAS``. """
+    try:
+        from django.core.cache import caches
+    except ImportError:
+        # Django < 1.7
+        from django.core.cache import get_cache as get_django_cache
+        return get_django_cache(userena_settings.USERENA_CACHE_ALIAS)
+    return caches[userena_settings.USERENA_CACHE_ALIAS]
+
+
+def _hash(value):
+    return md5_constructor(value.encode('utf-8')).hexdigest()
+
+
+def _get_version(key):
+    """
+    Returns the version stored under ``key``. A missing version starts at
+    the current time, so an evicted version never causes a stale response.
+
+    """
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        version = time.time()
+        if not cache.add(key, version):
+            version = cache.get(key, version)
+    return version
+
+
+def get_profile_version(username):
+    """ Returns the version of the profile of ``username`` as a timestamp. """
+    return _get_version(PROFILE_VERSION_KEY % _hash(username.lower()))
+
+
+def get_profile_list_version():
+    """ Returns the version of the profile list as a timestamp. """
+    return _get_version(PROFILE_LIST_VERSION_KEY)
+
+
+def get_profile_id_version(user_id):
+    """ Returns the version of the profile of the user with ``user_id``. """
+    return _get_version(PROFILE_ID_VERSION_KEY % user_id)
+
+
+def bump_profile_version(username, user_id=None):
+    """ Marks the profile of ``username`` and the profile list as changed. """
+    cache = get_cache()
+    now = time.time()
+    versions = {PROFILE_VERSION_KEY % _hash(username.lower()): now,
+                PROFILE_LIST_VERSION_KEY: now}
+    if user_id is not None:
+        versions[PROFILE_ID_VERSION_KEY % user_id] = now
+    cache.set_many(versions)
+
+
+def profile_changed(user):
+    """
+    Bumps the version of the profile of ``user`` and purges its page from
+    the CDN.
+
+    """
+    bump_profile_version(user.username, user.pk)
+    purge_profile(user.username)
+
+
+def _fetch_profile(defer_password=False, **lookup):
+    """
+    Returns the profile matching ``lookup`` on the user, together with its
+    user, or ``None``. A user without a profile gets one.
+
+    :param defer_password:
+        Boolean that defines if the password hash of the user is left out,
+        so it's not written to the cache. It's fetched when it's used, and a
+        save of the user leaves it as it is.
+
+    """
+    profile_model = get_profile_model()
+    user_lookup = dict((key[len('user__'):], value)
+                       for key, value in lookup.items())
+    profiles = profile_model.objects.select_related('user')
+    users = get_user_model().objects.all()
+    if defer_password:
+        profiles = profiles.defer('user__password')
+        users = users.defer('password')
+    try:
+        return profiles.get(**lookup)
+    except profile_model.DoesNotExist:
+        try:
+            user = users.get(**user_lookup)
+        except get_user_model().DoesNotExist:
+            return None
+        return get_user_profile(user=user)
+
+
+def _get_cached_profile(key, get_version, lookup):
+    """
+    Returns the profile stored under ``key`` if its version is still
+    current, or fetches it with ``lookup``.
+
+    Only one process fetches a missing profile at a time. The others wait
+    for it to appear in the cache, and after ``PROFILE_LOCK_RETRIES`` they
+    go to the database themselves.
+
+    """
+    cache = get_cache()
+    timeout = userena_settings.USERENA_PROFILE_CACHE_TIMEOUT
+    for attempt in range(PROFILE_LOCK_RETRIES + 1):
+        entry = cache.get(key)
+        if entry is not None and entry[0] == get_version():
+            return entry[1]
+
+        if cache.add(key + ':lock', True, PROFILE_LOCK_TIMEOUT):
+            try:
+                # The version is read before the database, so a change
+                # in between makes the entry outdated instead of wrong.
+                version = get_version()
+                profile = _fetch_profile(defer_password=True, **lookup)
+                if profile is not None:
+                    cache.set(key, (version, profile), timeout)
+                return profile
+            finally:
+                cache.delete(key + ':lock')
+        time.sleep(PROFILE_LOCK_WAIT)
+    return _fetch_profile(**lookup)
+
+
+def get_profile_by_username(username):
+    """
+    Returns the profile, with its user, of ``username`` or ``None``.
+
+    The profile is cached for ``USERENA_PROFILE_CACHE_TIMEOUT`` seconds and
+    fetched again as soon as the user or the profile changes. Without a
+    timeout the profile is always fetched from the database.
+
+    Only the id of the user is cached by username, the profile itself is
+    cached by :func:`get_profile_by_id`. A user who is renamed no longer
+    matches the old username, so the old username isn't answered from the
+    cache.
+
+    :param username:
+        String containing the username, matched case-insensitive.
+
+    """
+    if not userena_settings.USERENA_PROFILE_CACHE_TIMEOUT:
+        return _fetch_profile(user__username__iexact=username)
+    cache = get_cache()
+    key = USERNAME_KEY % _hash(username.lower())
+    user_id = cache.get(key)
+    if user_id is not None:
+        profile = get_profile_by_id(user_id)
+        if profile is not None and \
+           profile.user.username.lower() == username.lower():
+            return profile
+
+    user_ids = get_user_model().objects.filter(username__iexact=username)\
+                                       .values_list('pk', flat=True)[:1]
+    if not user_ids:
+        return None
+    cache.set(key, user_ids[0], userena_settings.USERENA_PROFILE_CACHE_TIMEOUT)
+    return get_profile_by_id(user_ids[0])
+
+
+def get_profile_by_id(user_id):
+    """
+    Returns the profile, with its user, of the user with ``user_id`` or
+    ``None``. Cached like :func:`get_profile_by_username`.
+
+    """
+    if not userena_settings.USERENA_PROFILE_CACHE_TIMEOUT:
+        return _fetch_profile(user__pk=user_id)
+    return _get_cached_profile(PROFILE_KEY % ('id:%s' % user_id),
+                               lambda: get_profile_id_version(user_id),
+                               {'user__pk': user_id})
+
+
+def _viewer(request):
+    """ Part of the ETag that identifies who views the page. """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated():
+        return 'anonymous'
+    return text_type(user.pk)
+
+
+def _etag(*parts):
+    return _hash(':'.join(text_type(part) for part in parts))
+
+
+def profile_detail_etag(request, username, *args, **kwargs):
+    """ ETag of the ``profile_detail`` view. """
+    return _etag('detail', username.lower(), repr(get_profile_version(username)),
+                 _viewer(request), get_language())
+
+
+def profile_detail_last_modified(request, username, *args, **kwargs):
+    """
+    Last modification time of the ``profile_detail`` view. Only anonymous
+    viewers get one, because the time doesn't tell who viewed the page.
+    Signed in viewers are answered by the ETag.
+
+    """
+    if _viewer(request) != 'anonymous':
+        return None
+    return datetime.datetime.utcfromtimestamp(get_profile_version(username))
+
+
+def profile_list_etag(request, *args, **kwargs):
+    """ ETag of the ``ProfileListView``, which includes the query string. """
+    return _etag('list', repr(get_profile_list_version()), _viewer(request),
+                 get_language(), request.GET.urlencode())
+
+
+def profile_list_last_modified(request, *args, **kwargs):
+    """
+    Last modification time of the ``ProfileListView``, for anonymous
+    viewers like :func:`profile_detail_last_modified`.
+
+    """
+    if _viewer(request) != 'anonymous':
+        return None
+    return datetime.datetime.utcfromtimestamp(get_profile_list_version())
+
+
+def versions_enabled():
+    """
+    Returns ``True`` when the versions are used, by the profile cache,
+    conditional GET requests, the CDN or the
+    :class:`CachedUserenaAuthenticationBackend`. Otherwise there is no need
+    to bump them.
+
+    """
+    return bool(userena_settings.USERENA_PROFILE_CACHE_TIMEOUT or
+                userena_settings.USERENA_PROFILE_CONDITIONAL_GET or
+                userena_settings.USERENA_PROFILE_CDN_MAX_AGE or
+                _user_cache_enabled())
+
+
+_user_cache_backends = {}
+
+def _user_cache_enabled():
+    """ Returns ``True`` when the user of requests is cached. """
+    paths = tuple(settings.AUTHENTICATION_BACKENDS)
+    if paths not in _user_cache_backends:
+        from userena.backends import CachedUserenaAuthenticationBackend
+        enabled = False
+        for path in paths:
+            module_name, class_name = path.rsplit('.', 1)
+            backend = getattr(import_module(module_name), class_name)
+            if issubclass(backend, CachedUserenaAuthenticationBackend):
+                enabled = True
+        _user_cache_backends[paths] = enabled
+    return _user_cache_backends[paths]
+
+
+def user_changed(sender, user, **kwargs):
+    """ Receiver for the signals of userena that change a user. """
+    if versions_enabled():
+        profile_changed(user)
+
+
+def instance_changed(sender, instance, **kwargs):
+    """ Receiver for ``post_save`` and ``post_delete`` of users and profiles. """
+    if not versions_enabled():
+        return
+    if isinstance(instance, get_user_model()):
+        profile_changed(instance)
+    else:
+        try:
+            user = instance.user
+        except ObjectDoesNotExist:
+            # The user is deleted together with the profile.
+            bump_profile_version('', instance.user_id)
+        else:
+            profile_changed(user)
+
+
+connect_user_and_profile(post_save, instance_changed,
+                         dispatch_uid='userena.cache.instance_saved')
+connect_user_and_profile(post_delete, instance_changed,
+                         dispatch_uid='userena.cache.instance_deleted')
+for signal in (userena_signals.profile_change,
+               userena_signals.email_change,
+               userena_signals.confirmation_complete):
+    signal.connect(user_changed, dispatch_uid='userena.cache.user_changed')
@@ -0,0 +1,81 @@
+"""
+Support for caching profile pages in a CDN or a caching proxy.
+
+When ``USERENA_PROFILE_CDN_MAX_AGE`` is set, anonymous views of open
+profiles are marked as public and everything else as private. A purger,
+defined by ``USERENA_PROFILE_PURGER``, is asked to remove the page of a
+profile from the CDN whenever the profile changes.
+
+"""
+from django.core.urlresolvers import reverse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from userena import settings as userena_settings
+
+try:
+    from importlib import import_module
+except ImportError:
+    # Python 2.6
+    from django.utils.importlib import import_module
+
+
+class BasePurger(object):
+    """
+    Base class of purgers. Subclasses remove the supplied paths from the CDN
+    and should never raise, because they are called while saving profiles.
+
+    """
+    def purge(self, paths):
+        """
+        Removes ``paths`` from the CDN.
+
+        :param paths:
+            List of absolute paths, without the domain, of the pages to purge.
+
+        """
+        raise NotImplementedError
+
+
+class NullPurger(BasePurger):
+    """ Purger that does nothing, for development and tests. """
+    def purge(self, paths):
+        pass
+
+
+_purgers = {}
+
+def get_purger():
+    """ Returns an instance of the class in ``USERENA_PROFILE_PURGER``. """
+    path = userena_settings.USERENA_PROFILE_PURGER
+    if path not in _purgers:
+        module_name, class_name = path.rsplit('.', 1)
+        _purgers[path] = getattr(import_module(module_name), class_name)()
+    return _purgers[path]
+
+
+def purge_profile(username):
+    """ Purges the pages of the profile of ``username`` from the CDN. """
+    if userena_settings.USERENA_PROFILE_CDN_MAX_AGE is None:
+        return
+    get_purger().purge([reverse('userena_profile_detail',
+                                kwargs={'username': username})])
+
+
+def patch_profile_cache_headers(request, response, profile):
+    """
+    Adds the ``Cache-Control`` and ``Vary`` headers to the ``response`` of
+    the ``profile`` page.
+
+    Only pages of open profiles viewed by an anonymous user are the same for
+    everyone, so only those are marked as public.
+
+    """
+    max_age = userena_settings.USERENA_PROFILE_CDN_MAX_AGE
+    if max_age is None:
+        return response
+    if profile.privacy == 'open' and not request.user.is_authenticated():
+        patch_cache_control(response, public=True, max_age=max_age)
+    else:
+        patch_cache_control(response, private=True)
+    patch_vary_headers(response, ('Cookie',))
+    return response
@@ -0,0 +1,194 @@
+"""
+Generation of synthetic messages for load testing.
+
+Like :mod:`userena.generate` everything is written with bulk inserts and
+drawn from a random generator with a fixed seed. The ``email_sent`` signal
+isn't sent, so no digests are queued.
+
+"""
+import datetime
+import random
+
+import django
+from django.db import connections, reset_queries, router
+from django.db.models import F, Max
+
+from userena.contrib.umessages.models import Message, MessageContact, MessageRecipient
+from userena.generate import get_active_user_ids
+from userena.utils import get_datetime_now
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod '
+         'tempor incididunt ut labore et dolore magna aliqua enim ad minim '
+         'veniam quis nostrud exercitation ullamco laboris nisi aliquip ex ea '
+         'commodo consequat').split()
+
+
+def generate_messages(amount, users=None, seed=0, sender_skew=3.0,
+                      group_ratio=0.1, max_group_size=10, read_ratio=0.7,
+                      deleted_ratio=0.05, days=365, batch_size=1000):
+    """
+    Generates messages between users, together with their recipients and
+    the contacts between the users.
+
+    :param amount:
+        Integer with the amount of messages to generate.
+
+    :param users:
+        List with the ids of the users that send and receive the messages.
+        Defaults to all active users.
+
+    :param seed:
+        The seed of the random generator.
+
+    :param sender_skew:
+        Float of at least ``1`` for the power law of the senders. With ``1``
+        every user sends about as many messages, the higher the skew the more
+        of the messages are sent by a few users.
+
+    :param group_ratio:
+        Float with the part of the messages sent to a group, of 2 up to
+        ``max_group_size`` recipients. The others have one recipient.
+
+    :param read_ratio:
+        Float with the part of the received messages that is read.
+
+    :param deleted_ratio:
+        Float with the part of the sent and received messages that is
+        deleted by the sender or recipient.
+
+    :param days:
+        Integer with the amount of days the messages are spread over.
+
+    :param batch_size:
+        Integer with the amount of messages inserted at once.
+
+    """
+    rng = random.Random(seed)
+    if users is None:
+        users = get_active_user_ids()
+    if len(users) < 2:
+        raise ValueError("At least two users are needed to generate messages.")
+    # Which users send the most messages is random too.
+    senders = list(users)
+    rng.shuffle(senders)
+    max_group_size = min(max_group_size, len(users) - 1)
+
+    now = get_datetime_now()
+    first_sent_at = now - datetime.timedelta(days=days)
+    interval = days * 86400.0 / max(amount, 1)
+    first_pk = last_pk = Message.objects.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+
+    for start in range(0, amount, batch_size):
+        messages, recipients = [], []
+        for number in range(start, min(start + batch_size, amount)):
+            sender = senders[int(len(senders) * rng.random() ** sender_skew)]
+            size = rng.randint(2, max_group_size) \
+                if max_group_size > 1 and rng.random() < group_ratio else 1
+            group = set()
+            while len(group) < size:
+                user = users[rng.randrange(len(users))]
+                if user != sender:
+                    group.add(user)
+
+            sent_at = first_sent_at + datetime.timedelta(seconds=number * interval)
+            messages.append(Message(
+                sender_id=sender,
+                body=' '.join(rng.choice(WORDS) for i in range(rng.randint(3, 30))),
+                sent_at=sent_at,
+                sender_deleted_at=sent_at if rng.random() < deleted_ratio else None))
+            recipients.append([(
+                user,
+                min(sent_at + datetime.timedelta(seconds=rng.randint(60, 86400)), now)
+                    if rng.random() < read_ratio else None,
+                sent_at if rng.random() < deleted_ratio else None)
+                for user in sorted(group)])
+        # ``bulk_create`` sets the ``sent_at`` of the instances to now.
+        sent_ats = [message.sent_at for message in messages]
+        Message.objects.bulk_create(messages)
+
+        # The ids are handed out in the order the messages are inserted.
+        message_pks = list(Message.objects.filter(pk__gt=last_pk)
+                                          .order_by('pk')
+                                          .values_list('pk', flat=True))
+        last_pk = message_pks[-1]
+        _update_sent_at(message_pks, sent_ats)
+        MessageRecipient.objects.bulk_create([
+            MessageRecipient(message_id=message_pk, user_id=user,
+                             read_at=read_at, deleted_at=deleted_at)
+            for message_pk, group in zip(message_pks, recipients)
+            for user, read_at, deleted_at in group])
+        reset_queries()
+
+    generate_contacts(sorted(users), first_pk, batch_size=batch_size)
+
+
+def _update_sent_at(message_pks, sent_ats):
+    """
+    Sets the ``sent_at`` of the messages with ``message_pks``, which
+    ``bulk_create`` replaced with now because of its ``auto_now_add``.
+
+    """
+    if django.VERSION < (1, 8, 0):
+        for message_pk, sent_at in zip(message_pks, sent_ats):
+            Message.objects.filter(pk=message_pk).update(sent_at=sent_at)
+        return
+
+    from django.db.models import Case, DateTimeField, When
+    ops = connections[router.db_for_write(Message)].ops
+    # Every message has three parameters, keep within the limit of the
+    # database.
+    size = max(ops.bulk_batch_size(['pk', 'pk', 'sent_at'], message_pks), 1)
+    for start in range(0, len(message_pks), size):
+        pks = message_pks[start:start + size]
+        Message.objects.filter(pk__in=pks).update(sent_at=Case(
+            *[When(pk=message_pk, then=sent_at)
+              for message_pk, sent_at in zip(pks, sent_ats[start:start + size])],
+            output_field=DateTimeField()))
+
+
+def generate_contacts(users, first_pk=0, batch_size=1000):
+    """
+    Creates or updates the contacts between ``users`` from the messages
+    after ``first_pk``, with the latest message between each pair of users.
+
+    :param users:
+        Sorted list with the ids of the users.
+
+    """
+    recipients = MessageRecipient.objects.filter(message__pk__gt=first_pk)
+    for start in range(0, len(users), batch_size):
+        low, high = users[start], users[min(start + batch_size, len(users)) - 1]
+
+        # Every pair of users is handled in the batch of its lowest id.
+        latest = {}
+        for sender, user, message in \
+            list(recipients.filter(message__sender__gte=low,
+                                   message__sender__lte=high,
+                                   user__gt=F('message__sender'))
+                           .values_list('message__sender', 'user')
+                           .annotate(latest=Max('message'))) + \
+            list(recipients.filter(user__gte=low, user__lte=high,
+                                   message__sender__gt=F('user'))
+                           .values_list('message__sender', 'user')
+                           .annotate(latest=Max('message'))):
+            pair = (min(sender, user), max(sender, user))
+            if pair not in latest or message > latest[pair][2]:
+                latest[pair] = (sender, user, message)
+        if not latest:
+            continue
+
+        existing = MessageContact.objects.filter(um_from_user__gte=low,
+                                                 um_from_user__lte=high) | \
+                   MessageContact.objects.filter(um_to_user__gte=low,
+                                                 um_to_user__lte=high)
+        for pk, from_user, to_user in existing.values_list('pk', 'um_from_user',
+                                                           'um_to_user'):
+            contact = latest.pop((min(from_user, to_user), max(from_user, to_user)), None)
+            if contact is not None:
+                MessageContact.objects.filter(pk=pk).update(latest_message=contact[2])
+
+        MessageContact.objects.bulk_create([
+            MessageContact(um_from_user_id=sender, um_to_user_id=user,
+                           latest_message_id=message)
+            for sender, user, message in sorted(latest.values())])
+        reset_queries()
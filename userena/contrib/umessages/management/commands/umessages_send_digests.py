@@ -0,0 +1,35 @@
+from django.core.management.base import NoArgsCommand, BaseCommand
+from optparse import make_option
+from django.utils.encoding import smart_text
+
+from userena.contrib.umessages.models import MessageNotification
+
+class Command(NoArgsCommand):
+    """
+    Send every user one email with the messages they received since the
+    last digest.
+
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('--window',
+            action='store',
+            type='int',
+            dest='window',
+            default=None,
+            help='Seconds notifications are collected before a digest is sent.'),
+        make_option('--batch-size',
+            action='store',
+            type='int',
+            dest='batch_size',
+            default=500,
+            help='Amount of digests sent at once.'),
+        )
+
+    help = 'Send the digests of new messages.'
+    def handle_noargs(self, **options):
+        sent, failed = MessageNotification.objects.send_digests(
+            window=options['window'], batch_size=options['batch_size'])
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write("Sent %s digests\n" % sent)
+            for user, e in failed:
+                self.stdout.write("WARNING: %s: %s\n" % (smart_text(user), e))
@@ -1,7 +1,12 @@
+from django.contrib.sites.models import Site
 from django.db import models
-from django.db.models import Q
+from django.db.models import Count, Min, Q
 
+from userena import settings as userena_settings
 from userena.contrib.umessages import signals
+from userena.instrumentation import timed
+from userena.mail import get_email_bundle, send_mass_mail
+from userena.utils import get_datetime_now, get_protocol, get_user_model
 
 import datetime
 
@@ -52,12 +57,15 @@ class MessageContactManager(models.Manager):
             The :class:`User` which to get the contacts for.
 
         """
-        contacts = self.filter(Q(um_from_user=user) | Q(um_to_user=user))
+        contacts = self.filter(Q(um_from_user=user) | Q(um_to_user=user))\
+                       .select_related('um_from_user', 'um_to_user',
+                                       'latest_message')
         return contacts
 
 class MessageManager(models.Manager):
     """ Manager for the :class:`Message` model. """
 
+    @timed('umessages.manager.send_message')
     def send_message(self, sender, um_to_user_list, body):
         """
         Send a message from a user, to a user.
@@ -94,6 +102,7 @@ class MessageManager(models.Manager):
 class MessageRecipientManager(models.Manager):
     """ Manager for the :class:`MessageRecipient` model. """
 
+    @timed('umessages.manager.count_unread_messages_for')
     def count_unread_messages_for(self, user):
         """
         Returns the amount of unread messages for this user
@@ -111,6 +120,7 @@ class MessageRecipientManager(models.Manager):
 
         return unread_total
 
+    @timed('umessages.manager.count_unread_messages_between')
     def count_unread_messages_between(self, um_to_user, um_from_user):
         """
         Returns the amount of unread messages between two users
@@ -131,3 +141,109 @@ class MessageRecipientManager(models.Manager):
                                    deleted_at__isnull=True).count()
 
         return unread_total
+
+    @timed('umessages.manager.count_unread_messages_by_sender')
+    def count_unread_messages_by_sender(self, user, senders):
+        """
+        Returns the amount of unread messages from each of the senders, like
+        :func:`count_unread_messages_between` but in a single query.
+
+        :param user:
+            A Django :class:`User` for who the messages are for.
+
+        :param senders:
+            List of Django :class:`User` from whom the messages originate.
+
+        :return:
+            Dictionary with the id of every sender that has unread messages
+            as key and the amount as value.
+
+        """
+        counts = self.filter(message__sender__in=senders,
+                             user=user,
+                             read_at__isnull=True,
+                             deleted_at__isnull=True)\
+                     .values_list('message__sender')\
+                     .annotate(unread=Count('pk'))\
+                     .order_by()
+        return dict(counts)
+
+class MessageNotificationManager(models.Manager):
+    """ Manager for the :class:`MessageNotification` model. """
+
+    def send_digests(self, window=None, batch_size=500):
+        """
+        Sends every user with a notification older than ``window`` seconds
+        one email with all their queued messages, and removes the
+        notifications. Messages the user has read or deleted in the meantime
+        are left out of the digest.
+
+        :param window:
+            Integer with the seconds notifications are collected before a
+            digest is sent, ``USERENA_UMESSAGES_DIGEST_WINDOW`` by default.
+
+        :param batch_size:
+            Integer with the amount of users whose digests are sent at once.
+
+        :return:
+            Tuple containing the amount of sent digests and a list of
+            ``(user, exception)`` tuples for the digests that failed. Their
+            notifications are kept for the next run.
+
+        """
+        if window is None:
+            window = userena_settings.USERENA_UMESSAGES_DIGEST_WINDOW
+        due_before = get_datetime_now() - datetime.timedelta(seconds=window)
+        due_users = self.values('user')\
+                        .annotate(oldest=Min('created_at'))\
+                        .filter(oldest__lte=due_before)\
+                        .order_by('user')
+
+        from userena.contrib.umessages.models import MessageRecipient
+        bundle = get_email_bundle('umessages/emails/digest')
+        site = Site.objects.get_current()
+        sent, failed = 0, []
+        last_user_id = 0
+        while True:
+            user_ids = [row['user'] for row in
+                        due_users.filter(user__gt=last_user_id)[:batch_size]]
+            if not user_ids:
+                break
+            last_user_id = user_ids[-1]
+
+            notifications = list(self.filter(user__in=user_ids)
+                                     .select_related('message__sender')
+                                     .order_by('message__sent_at'))
+            if not notifications:
+                continue
+            unread = set(MessageRecipient.objects.filter(
+                user__in=user_ids,
+                message__in=self.filter(user__in=user_ids).values('message'),
+                read_at__isnull=True,
+                deleted_at__isnull=True).values_list('user', 'message'))
+
+            messages = {}
+            for notification in notifications:
+                if (notification.user_id, notification.message_id) in unread:
+                    messages.setdefault(notification.user_id, []).append(notification.message)
+
+            users = list(get_user_model().objects.filter(pk__in=list(messages))
+                                                 .exclude(email='')
+                                                 .order_by('pk'))
+            datatuple = []
+            for user in users:
+                context = {'user': user,
+                           'messages': messages[user.pk],
+                           'protocol': get_protocol(),
+                           'site': site}
+                datatuple.append(bundle.render(context) + ([user.email], ))
+
+            batch_sent, batch_failed = send_mass_mail(datatuple)
+            failed_user_ids = set(users[index].pk for index, e in batch_failed)
+            failed.extend((users[index], e) for index, e in batch_failed)
+            # Notifications queued while sending are kept for the next digest.
+            self.filter(user__in=[user_id for user_id in user_ids
+                                  if user_id not in failed_user_ids],
+                        pk__lte=max(n.pk for n in notifications)).delete()
+            sent += batch_sent
+        return sent, failed
@@ -1,10 +1,15 @@
 from django.db import models
+from django.db.models import Q
 from django.utils.encoding import python_2_unicode_compatible
+from django.utils.six import text_type
 from django.utils.translation import ugettext_lazy as _
 
+from userena import settings as userena_settings
 from userena.utils import truncate_words
+from userena.contrib.umessages import signals
 from userena.contrib.umessages.managers import (MessageManager, MessageContactManager,
-                                                MessageRecipientManager)
+                                                MessageRecipientManager,
+                                                MessageNotificationManager)
 from userena.utils import user_model_label
 
 
@@ -135,12 +140,10 @@ class Message(models.Model):
             Boolean indicating if any users are saved.
 
         """
-        created = False
-        for user in um_to_user_list:
-            MessageRecipient.objects.create(user=user,
-                                            message=self)
-            created = True
-        return created
+        recipients = [MessageRecipient(user=user, message=self)
+                      for user in um_to_user_list]
+        MessageRecipient.objects.bulk_create(recipients)
+        return bool(recipients)
 
     def update_contacts(self, um_to_user_list):
         """
@@ -153,10 +156,67 @@ class Message(models.Model):
             A boolean if a user is contact is updated.
 
         """
-        updated = False
-        for user in um_to_user_list:
-            MessageContact.objects.update_contact(self.sender,
-                                                  user,
-                                                  self)
-            updated = True
-        return updated
+        users = list(um_to_user_list)
+        if not users:
+            return False
+
+        # Contacts are unique in both directions.
+        contacts = MessageContact.objects.filter(
+            Q(um_from_user=self.sender, um_to_user__in=users) |
+            Q(um_from_user__in=users, um_to_user=self.sender))
+        existing = set()
+        for um_from_user, um_to_user in contacts.values_list('um_from_user',
+                                                             'um_to_user'):
+            existing.add(um_to_user if um_from_user == self.sender_id
+                         else um_from_user)
+        if existing:
+            contacts.update(latest_message=self)
+        MessageContact.objects.bulk_create([
+            MessageContact(um_from_user=self.sender, um_to_user=user,
+                           latest_message=self)
+            for user in users if user.pk not in existing])
+        return True
+
+
+@python_2_unicode_compatible
+class MessageNotification(models.Model):
+    """
+    A message a recipient still has to be notified of. The notifications of
+    a user are sent together in a digest by
+    :meth:`MessageNotificationManager.send_digests`.
+
+    """
+    user = models.ForeignKey(user_model_label,
+                             verbose_name=_("recipient"))
+
+    message = models.ForeignKey('Message',
+                                verbose_name=_("message"))
+
+    created_at = models.DateTimeField(_("created at"),
+                                      auto_now_add=True)
+
+    objects = MessageNotificationManager()
+
+    class Meta:
+        verbose_name = _("notification")
+        verbose_name_plural = _("notifications")
+
+    def __str__(self):
+        return text_type(self.message)
+
+
+def queue_notifications(sender, msg, **kwargs):
+    """
+    Receiver for the ``email_sent`` signal that queues a notification for
+    every recipient of ``msg`` with a single query, when
+    ``USERENA_UMESSAGES_DIGEST`` is enabled.
+
+    """
+    if not userena_settings.USERENA_UMESSAGES_DIGEST:
+        return
+    MessageNotification.objects.bulk_create(
+        [MessageNotification(user_id=user_id, message=msg) for user_id in
+         MessageRecipient.objects.filter(message=msg).values_list('user', flat=True)])
+
+signals.email_sent.connect(queue_notifications,
+                           dispatch_uid='umessages.models.queue_notifications')
@@ -5,4 +5,5 @@ if django.VERSION < (1, 6):
     from .test_forms import *
     from .test_managers import *
     from .test_models import *
+    from .test_queries import *
     from .test_views import *
@@ -1,8 +1,14 @@
+from django.core import mail
+from django.core.management import call_command
 from django.test import TestCase
 
+from userena import settings as userena_settings
 from userena.contrib.umessages.models import (Message, MessageContact,
-                                              MessageRecipient)
-from userena.utils import get_user_model
+                                              MessageRecipient,
+                                              MessageNotification)
+from userena.utils import get_datetime_now, get_user_model
+
+import datetime
 
 User = get_user_model()
 
@@ -17,6 +23,19 @@ class MessageManagerTests(TestCase):
 
         messages = Message.objects.get_conversation_between(user_1, user_2)
 
+    def test_send_message_contacts(self):
+        """ Existing contacts get the latest message, in both directions """
+        john, jane, arie = User.objects.filter(pk__in=[1, 2, 3]).order_by('pk')
+        message = Message.objects.send_message(jane, [john, arie], 'Hello')
+
+        contacts = MessageContact.objects.get_contacts_for(jane)
+        self.failUnlessEqual(sorted(contact.opposite_user(jane).pk
+                                    for contact in contacts),
+                             [john.pk, arie.pk])
+        for contact in contacts:
+            self.failUnlessEqual(contact.latest_message, message)
+        self.failUnlessEqual(message.recipients.count(), 2)
+
 class MessageRecipientManagerTest(TestCase):
     fixtures = ['users', 'messages']
 
@@ -39,6 +58,17 @@ class MessageRecipientManagerTest(TestCase):
 
         self.failUnlessEqual(unread_messages, 1)
 
+    def test_count_unread_messages_by_sender(self):
+        """ The unread messages are counted for every sender at once """
+        john, jane, arie = User.objects.filter(pk__in=[1, 2, 3]).order_by('pk')
+        Message.objects.send_message(arie, [jane], 'Hello')
+        Message.objects.send_message(arie, [jane], 'Hello again')
+
+        with self.assertNumQueries(1):
+            counts = MessageRecipient.objects.count_unread_messages_by_sender(
+                jane, [john, arie])
+        self.failUnlessEqual(counts, {john.pk: 1, arie.pk: 2})
+
 class MessageContactManagerTest(TestCase):
     fixtures = ['users', 'messages']
 
@@ -54,3 +84,64 @@ class MessageContactManagerTest(TestCase):
         self.failUnlessEqual(contacts[0].um_to_user,
                              jane)
 
+    def test_get_contacts_for_related(self):
+        """ The users and latest message come with the contacts """
+        john = User.objects.get(pk=1)
+        with self.assertNumQueries(1):
+            for contact in MessageContact.objects.get_contacts_for(john):
+                contact.um_from_user, contact.um_to_user, contact.latest_message
+
+
+class MessageNotificationManagerTest(TestCase):
+    fixtures = ['users', 'messages']
+
+    def setUp(self):
+        userena_settings.USERENA_UMESSAGES_DIGEST = True
+
+    def tearDown(self):
+        userena_settings.USERENA_UMESSAGES_DIGEST = False
+
+    def age_notifications(self, seconds):
+        MessageNotification.objects.update(
+            created_at=get_datetime_now() - datetime.timedelta(seconds=seconds))
+
+    def test_queue_notifications(self):
+        """ A notification is queued for every recipient """
+        john, jane, arie = User.objects.filter(pk__in=[1, 2, 3]).order_by('pk')
+        Message.objects.send_message(john, [jane, arie], 'Hello')
+        self.failUnlessEqual(
+            sorted(MessageNotification.objects.values_list('user', flat=True)),
+            [jane.pk, arie.pk])
+
+        userena_settings.USERENA_UMESSAGES_DIGEST = False
+        Message.objects.send_message(john, [jane], 'Hello again')
+        self.failUnlessEqual(MessageNotification.objects.count(), 2)
+
+    def test_send_digests(self):
+        """ The queued messages of a user are sent in one email """
+        john, jane, arie = User.objects.filter(pk__in=[1, 2, 3]).order_by('pk')
+        for body in ('First', 'Second', 'Third'):
+            Message.objects.send_message(john, [jane, arie], body)
+        # Arie already read the second message.
+        MessageRecipient.objects.filter(user=arie, message__body='Second')\
+                                .update(read_at=get_datetime_now())
+
+        # Nothing is sent within the window.
+        self.failUnlessEqual(MessageNotification.objects.send_digests(window=60),
+                             (0, []))
+        self.age_notifications(120)
+        Message.objects.send_message(arie, [jane], 'Fourth')
+
+        call_command('umessages_send_digests', window=60, batch_size=1,
+                     verbosity=0)
+        self.failUnlessEqual(sorted(m.to[0] for m in mail.outbox),
+                             [arie.email, jane.email])
+        digests = dict((m.to[0], m.body) for m in mail.outbox)
+        for body in ('First', 'Second', 'Third', 'Fourth'):
+            self.failUnless(body in digests[jane.email])
+        self.failIf('Second' in digests[arie.email])
+        self.failUnless('Third' in digests[arie.email])
+        subjects = dict((m.to[0], m.subject) for m in mail.outbox)
+        self.failUnless('4 new messages' in subjects[jane.email])
+        self.failUnless('2 new messages' in subjects[arie.email])
+        self.failIf(MessageNotification.objects.exists())
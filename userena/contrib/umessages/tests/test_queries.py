@@ -0,0 +1,39 @@
+from django.test import TestCase
+
+from userena.contrib.umessages.models import Message
+from userena.tests.query_budgets import QueryBudgetMixin
+
+
+class MessagesQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """ Query budgets of the views in ``umessages/urls.py`` """
+    fixtures = ['users', 'profiles']
+
+    def setUp(self):
+        super(MessagesQueryBudgetTests, self).setUp()
+        self.client.login(username='john', password='blowfish')
+
+    def test_compose(self):
+        self.assertQueryBudget('userena_umessages_compose')
+        self.assertQueryBudget('userena_umessages_compose_to',
+                               recipients='contact0+contact1')
+        self.assertQueryBudget('userena_umessages_compose', method='post',
+                               data={'to': ', '.join('contact%d' % i for i in range(10)),
+                                     'body': 'Hello'})
+
+    def test_reply(self):
+        parent = Message.objects.get(body='Group reply')
+        self.assertQueryBudget('userena_umessages_reply', parent_id=parent.pk)
+
+    def test_detail(self):
+        self.assertQueryBudget('userena_umessages_detail', username='contact0')
+
+    def test_list(self):
+        self.assertQueryBudget('userena_umessages_list')
+
+    def test_remove(self):
+        message_pks = list(Message.objects.filter(body__startswith='Hello')
+                                          .values_list('pk', flat=True)[:10])
+        self.assertQueryBudget('userena_umessages_remove', method='post',
+                               data={'message_pks': message_pks})
+        self.assertQueryBudget('userena_umessages_unremove', method='post',
+                               data={'message_pks': message_pks})
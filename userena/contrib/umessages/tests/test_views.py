@@ -78,6 +78,22 @@ class MessagesViewsTests(TestCase):
         self.assertEqual(response.context['form'].initial['to'],
                          [jane, john])
 
+    def test_compose_reply(self):
+        """ A ``GET`` to the reply view """
+        self.client.login(username='jane', password='blowfish')
+        response = self.client.get(reverse('userena_umessages_reply',
+                                           kwargs={'parent_id': 1}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['form'].initial['to'],
+                         [User.objects.get(username='john')])
+
+        # Only the sender and recipients can reply.
+        self.client.login(username='arie', password='blowfish')
+        response = self.client.get(reverse('userena_umessages_reply',
+                                           kwargs={'parent_id': 1}))
+        self.assertEqual(response.status_code, 404)
+
     def test_message_detail(self):
         """ A ``GET`` to the detail view """
         self._test_login('userena_umessages_detail',
@@ -189,6 +205,11 @@ class MessagesViewsTests(TestCase):
 
         self.assertTemplateUsed(response, "umessages/message_list.html")
 
+        # Jane has an unread message from john.
+        self.client.login(username="jane", password="blowfish")
+        response = self.client.get(reverse("userena_umessages_list"))
+        self.assertContains(response, "(1 new)")
+
     def test_message_detail(self):
         """ ``GET`` to a detail page between two users """
         self._test_login("userena_umessages_detail",
@@ -1,6 +1,7 @@
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
 from django.core.urlresolvers import reverse
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
 from django.contrib import messages
 from django.utils.translation import ugettext as _
@@ -12,9 +13,10 @@ from userena.contrib.umessages.models import Message, MessageRecipient, MessageC
 from userena.contrib.umessages.forms import ComposeForm
 from userena.utils import get_datetime_now, get_user_model
 from userena import settings as userena_settings
+from userena.instrumentation import TimedViewMixin, timed
 
 
-class MessageListView(ListView):
+class MessageListView(TimedViewMixin, ListView):
     """
 
     Returns the message list for this user. This is a list contacts
@@ -27,12 +29,27 @@ class MessageListView(ListView):
     template_name='umessages/message_list.html'
     extra_context={}
     context_object_name = 'message_list'
+    timing_name = 'umessages.view.message_list'
 
     def get_context_data(self, **kwargs):
         context = super(MessageListView, self).get_context_data(**kwargs)
+        self._set_unread_counts(context['object_list'])
         context.update(self.extra_context)
         return context
 
+    def _set_unread_counts(self, contacts):
+        """
+        Adds the amount of unread messages from the other user as
+        ``unread_count`` to each of the ``contacts``, with one query.
+
+        """
+        user = self.request.user
+        contacts = list(contacts)
+        counts = MessageRecipient.objects.count_unread_messages_by_sender(
+            user, [contact.opposite_user(user) for contact in contacts])
+        for contact in contacts:
+            contact.unread_count = counts.get(contact.opposite_user(user).pk, 0)
+
     def get_queryset(self):
         return MessageContact.objects.get_contacts_for(self.request.user)
 
@@ -44,9 +61,12 @@ class MessageDetailListView(MessageListView):
 
     """
     template_name='umessages/message_detail.html'
+    timing_name='umessages.view.message_detail'
 
     def get_context_data(self, **kwargs):
-        context = super(MessageDetailListView, self).get_context_data(**kwargs)
+        # The messages of a conversation have no unread counts.
+        context = super(MessageListView, self).get_context_data(**kwargs)
+        context.update(self.extra_context)
         context['recipient'] = self.recipient
         return context
 
@@ -68,10 +88,11 @@ class MessageDetailListView(MessageListView):
         unread_list.update(read_at=now)
 
 
+@timed('umessages.view.message_compose')
 @login_required
 def message_compose(request, recipients=None, compose_form=ComposeForm,
                     success_url=None, template_name="umessages/message_form.html",
-                    recipient_filter=None, extra_context=None):
+                    recipient_filter=None, extra_context=None, parent_id=None):
     """
     Compose a new message
 
@@ -79,6 +100,10 @@ def message_compose(request, recipients=None, compose_form=ComposeForm,
         String containing the usernames to whom the message is send to. Can be
         multiple username by seperating them with a ``+`` sign.
 
+    :param parent_id:
+        Id of the message that is replied to. The sender and the other
+        recipients of that message become the recipients.
+
     :param compose_form:
         The form that is used for getting neccesary information. Defaults to
         :class:`ComposeForm`.
@@ -111,6 +136,15 @@ def message_compose(request, recipients=None, compose_form=ComposeForm,
         recipients = [u for u in get_user_model().objects.filter(username__in=username_list)]
         initial_data["to"] = recipients
 
+    if parent_id:
+        parent = get_object_or_404(Message.objects.select_related('sender'),
+                                   pk=parent_id)
+        participants = [parent.sender] + list(parent.recipients.all())
+        if request.user not in participants:
+            raise Http404
+        recipients = [u for u in participants if u != request.user]
+        initial_data["to"] = recipients
+
     form = compose_form(initial=initial_data)
     if request.method == "POST":
         form = compose_form(request.POST)
@@ -141,6 +175,7 @@ def message_compose(request, recipients=None, compose_form=ComposeForm,
     extra_context["recipients"] = recipients
     return render(request, template_name, extra_context)
 
+@timed('umessages.view.message_remove')
 @login_required
 @require_http_methods(["POST"])
 def message_remove(request, undo=False):
@@ -175,30 +210,25 @@ def message_remove(request, undo=False):
                 valid_message_pk_list.add(valid_pk)
 
         # Delete all the messages, if they belong to the user.
-        now = get_datetime_now()
-        changed_message_list = set()
-        for pk in valid_message_pk_list:
-            message = get_object_or_404(Message, pk=pk)
-
-            # Check if the user is the owner
-            if message.sender == request.user:
-                if undo:
-                    message.sender_deleted_at = None
-                else:
-                    message.sender_deleted_at = now
-                message.save()
-                changed_message_list.add(message.pk)
-
-            # Check if the user is a recipient of the message
-            if request.user in message.recipients.all():
-                mr = message.messagerecipient_set.get(user=request.user,
-                                                      message=message)
-                if undo:
-                    mr.deleted_at = None
-                else:
-                    mr.deleted_at = now
-                mr.save()
-                changed_message_list.add(message.pk)
+        deleted_at = None if undo else get_datetime_now()
+        senders = dict(Message.objects.filter(pk__in=valid_message_pk_list)
+                                      .values_list('pk', 'sender'))
+        if len(senders) != len(valid_message_pk_list):
+            raise Http404
+
+        changed_message_list = set(pk for pk, sender in senders.items()
+                                   if sender == request.user.pk)
+        if changed_message_list:
+            Message.objects.filter(pk__in=changed_message_list)\
+                           .update(sender_deleted_at=deleted_at)
+
+        # Check if the user is a recipient of the messages
+        received = MessageRecipient.objects.filter(message__in=valid_message_pk_list,
+                                                   user=request.user)
+        received_pks = set(received.values_list('message', flat=True))
+        if received_pks:
+            received.update(deleted_at=deleted_at)
+            changed_message_list |= received_pks
 
         # Send messages
         if (len(changed_message_list) > 0) and userena_settings.USERENA_USE_MESSAGES:
@@ -1,9 +1,14 @@
 from django.http import HttpResponsePermanentRedirect
+from django.utils.cache import patch_vary_headers
 from django.utils.decorators import available_attrs
 from django.conf import settings
 from django.utils.functional import wraps
+from django.views.decorators.http import condition
 
 from userena import settings as userena_settings
+from userena.utils import get_profile_or_404, get_profile_perms
+
+from guardian.utils import get_403_or_None
 
 
 def secure_required(view_func):
@@ -27,3 +32,62 @@ def secure_required(view_func):
                 return HttpResponsePermanentRedirect(secure_url)
         return view_func(request, *args, **kwargs)
     return wraps(view_func, assigned=available_attrs(view_func))(_wrapped_view)
+
+
+def profile_permission_required(perm):
+    """
+    Decorator for views with a ``username`` argument that require the user to
+    have the object permission ``perm`` on the profile of ``username``.
+
+    Works like ``permission_required_or_403`` of guardian, but the profile
+    and the permissions are looked up with :func:`get_profile_or_404` and
+    :func:`get_profile_perms`, so the view can reuse them without querying
+    the database again.
+
+    :param perm:
+        String with the codename of the permission, e.g. ``change_profile``.
+
+    """
+    def decorator(view_func):
+        def _wrapped_view(request, username, *args, **kwargs):
+            profile = get_profile_or_404(request, username)
+            if perm not in get_profile_perms(request, profile):
+                # Give other authentication backends a chance.
+                response = get_403_or_None(request, perms=[perm], obj=profile,
+                                           return_403=True)
+                if response:
+                    return response
+            return view_func(request, username, *args, **kwargs)
+        return wraps(view_func, assigned=available_attrs(view_func))(_wrapped_view)
+    return decorator
+
+
+def profile_condition(etag_func=None, last_modified_func=None, check_func=None):
+    """
+    Decorator that answers conditional GET requests with ``304 Not
+    Modified``, like the ``condition`` decorator of Django, but only when
+    ``USERENA_PROFILE_CONDITIONAL_GET`` is enabled.
+
+    The responses vary on the ``Cookie`` header, because the ETag depends on
+    the user who views the page.
+
+    :param check_func:
+        Function that is called with the arguments of the view before the
+        conditions are evaluated. It raises :class:`Http404` or
+        :class:`PermissionDenied` when the page may not be shown, so a
+        missing or hidden profile is never answered with a 304.
+
+    """
+    def decorator(view_func):
+        conditional_view = condition(etag_func=etag_func,
+                                     last_modified_func=last_modified_func)(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if not userena_settings.USERENA_PROFILE_CONDITIONAL_GET:
+                return view_func(request, *args, **kwargs)
+            if check_func is not None:
+                check_func(request, *args, **kwargs)
+            response = conditional_view(request, *args, **kwargs)
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return wraps(view_func, assigned=available_attrs(view_func))(_wrapped_view)
+    return decorator
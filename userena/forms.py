@@ -4,10 +4,13 @@ from __future__ import unicode_literals
 from django import forms
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth import authenticate
+from django.core.files.uploadedfile import UploadedFile
 
 from userena import settings as userena_settings
 from userena.compat import sha_constructor
 from userena.models import UserenaSignup
+from userena.mugshots import validate_mugshot, downscale_mugshot
+from userena.throttle import allow_signin, signin_failed
 from userena.utils import get_profile_model, get_user_model
 
 import random
@@ -159,6 +162,7 @@ class AuthenticationForm(forms.Form):
     def __init__(self, *args, **kwargs):
         """ A custom init because we need to change the label if no usernames is used """
         super(AuthenticationForm, self).__init__(*args, **kwargs)
+        self.user_cache = None
         # Dirty hack, somehow the label doesn't get translated without declaring
         # it again here.
         self.fields['remember_me'].label = _('Remember me for %(days)s') % {'days': _(userena_settings.USERENA_REMEMBER_ME_DAYS[0])}
@@ -171,15 +175,22 @@ class AuthenticationForm(forms.Form):
         Checks for the identification and password.
 
         If the combination can't be found will raise an invalid sign in error.
+        The authenticated user is stored in ``user_cache``. Attempts over the
+        limits of ``USERENA_SIGNIN_THROTTLE`` are rejected before the user is
+        looked up. Only failed attempts count for the identification.
 
         """
         identification = self.cleaned_data.get('identification')
         password = self.cleaned_data.get('password')
 
         if identification and password:
+            if not allow_signin(identification=identification):
+                raise forms.ValidationError(_("Too many signin attempts. Please try again later."))
             user = authenticate(identification=identification, password=password)
             if user is None:
+                signin_failed(identification)
                 raise forms.ValidationError(_("Please enter a correct username or email and password. Note that both fields are case-sensitive."))
+            self.user_cache = user
         return self.cleaned_data
 
 class ChangeEmailForm(forms.Form):
@@ -244,6 +255,18 @@ class EditProfileForm(forms.ModelForm):
         model = get_profile_model()
         exclude = ['user']
 
+    def clean_mugshot(self):
+        """
+        Validate that a new mugshot isn't too large before it's decoded and
+        downscale large JPEG images while decoding them.
+
+        """
+        mugshot = self.cleaned_data.get('mugshot')
+        if isinstance(mugshot, UploadedFile):
+            image = validate_mugshot(mugshot)
+            mugshot = downscale_mugshot(mugshot, image)
+        return mugshot
+
     def save(self, force_insert=False, force_update=False, commit=True):
         profile = super(EditProfileForm, self).save(commit=commit)
         # Save first and last name
@@ -0,0 +1,143 @@
+"""
+Generation of synthetic users for load testing.
+
+Everything is written with bulk inserts and drawn from a random generator
+with a fixed seed, so the same arguments generate the same data. Signals
+aren't sent, no emails are sent and the caches aren't touched. Messages
+between the generated users are generated by
+:mod:`userena.contrib.umessages.generate`.
+
+"""
+import datetime
+import random
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import reset_queries
+from django.db.models import Max
+
+from guardian.models import UserObjectPermission
+
+from userena import settings as userena_settings
+from userena.compat import sha_constructor
+from userena.managers import get_assigned_permissions
+from userena.models import UserenaSignup
+from userena.utils import get_datetime_now, get_profile_model, get_user_model
+
+
+def generate_users(amount, seed=0, prefix='user', password='userena',
+                   active_ratio=0.8, expired_ratio=0.1, permissions=None,
+                   days=365, batch_size=1000):
+    """
+    Generates users with their profile, signup and object permissions.
+
+    The users are named ``prefix`` followed by a number above the highest
+    existing user id, so generating more users never collides with earlier
+    runs.
+
+    :param amount:
+        Integer with the amount of users to generate.
+
+    :param seed:
+        The seed of the random generator.
+
+    :param password:
+        String containing the password of all users. It's hashed once.
+
+    :param active_ratio:
+        Float with the part of the users that is activated. The others are
+        waiting for their activation.
+
+    :param expired_ratio:
+        Float with the part of the users whose activation expired, which is
+        taken from the users that aren't activated.
+
+    :param permissions:
+        Boolean that defines if the object permissions are inserted.
+        Defaults to ``True`` unless ``USERENA_IMPLICIT_OWNER_PERMISSIONS``
+        is enabled.
+
+    :param days:
+        Integer with the amount of days in which the activated users joined.
+
+    :param batch_size:
+        Integer with the amount of users inserted at once.
+
+    :return: List with the ids of the activated users.
+
+    """
+    if permissions is None:
+        permissions = not userena_settings.USERENA_IMPLICIT_OWNER_PERMISSIONS
+    rng = random.Random(seed)
+    User = get_user_model()
+    profile_model = get_profile_model()
+    privacy_choices = [choice[0] for choice in profile_model.PRIVACY_CHOICES]
+    assigned_permissions = get_assigned_permissions() if permissions else []
+    password = make_password(password)
+    now = get_datetime_now()
+    activation_days = userena_settings.USERENA_ACTIVATION_DAYS
+
+    last_pk = max(User.objects.aggregate(last_pk=Max('pk'))['last_pk'] or 0, 0)
+    offset = last_pk + 1
+    activated = []
+    for start in range(offset, offset + amount, batch_size):
+        users, states = [], {}
+        for number in range(start, min(start + batch_size, offset + amount)):
+            username = '%s%d' % (prefix, number)
+            draw = rng.random()
+            if draw < active_ratio:
+                state = 'active'
+                date_joined = now - datetime.timedelta(seconds=rng.randint(0, days * 86400))
+            elif draw < active_ratio + expired_ratio:
+                state = 'expired'
+                date_joined = now - datetime.timedelta(days=activation_days + 1,
+                                                       seconds=rng.randint(0, days * 86400))
+            else:
+                state = 'pending'
+                date_joined = now - datetime.timedelta(seconds=rng.randint(0, activation_days * 86400))
+            states[username] = state
+            users.append(User(username=username,
+                              email='%s@example.com' % username,
+                              password=password,
+                              is_active=state == 'active',
+                              date_joined=date_joined,
+                              last_login=date_joined))
+        User.objects.bulk_create(users)
+
+        users = list(User.objects.filter(pk__gt=last_pk).order_by('pk'))
+        last_pk = users[-1].pk
+        activated.extend(user.pk for user in users
+                         if states[user.username] == 'active')
+
+        profile_model.objects.bulk_create([
+            profile_model(user=user, privacy=rng.choice(privacy_choices))
+            for user in users])
+        UserenaSignup.objects.bulk_create([UserenaSignup(
+            user=user,
+            activation_key=userena_settings.USERENA_ACTIVATED
+                if states[user.username] == 'active'
+                else sha_constructor(('%s%s' % (seed, user.username)).encode('utf-8')).hexdigest())
+            for user in users])
+
+        if assigned_permissions:
+            profiles = dict(profile_model.objects.filter(user__pk__gte=users[0].pk,
+                                                         user__pk__lte=last_pk)
+                                                 .values_list('user', 'pk'))
+            UserObjectPermission.objects.bulk_create([
+                UserObjectPermission(user=user,
+                                     permission=permission,
+                                     content_type=content_type,
+                                     object_pk=str(profiles[user.pk] if model == 'profile' else user.pk))
+                for user in users
+                for model, content_type, permission in assigned_permissions])
+        # With ``DEBUG`` enabled every query is kept in memory.
+        reset_queries()
+    return activated
+
+
+def get_active_user_ids():
+    """ Returns the ids of all active users, except the anonymous user. """
+    return list(get_user_model().objects.filter(is_active=True)
+                                        .exclude(pk=getattr(settings, 'ANONYMOUS_USER_ID', None))
+                                        .order_by('pk')
+                                        .values_list('pk', flat=True))
@@ -0,0 +1,104 @@
+"""
+Locally generated identicons.
+
+An identicon is a symmetric 5x5 pattern in a single color, both derived from
+the MD5 hash of an email address, just like the ``identicon`` default of
+Gravatar. Identicons are rendered as SVG, saved once in the default storage
+and served from there, so no request leaves your site to display them.
+
+"""
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from userena import settings as userena_settings
+from userena.compat import md5_constructor
+from userena.utils import cache_mugshot_url, mugshot_url_cache
+
+SVG_TEMPLATE = ('<svg xmlns="http://www.w3.org/2000/svg" '
+                'width="%(size)s" height="%(size)s" viewBox="-0.5 -0.5 6 6">'
+                '<rect x="-0.5" y="-0.5" width="6" height="6" fill="#f0f0f0"/>'
+                '<g fill="%(color)s">%(cells)s</g></svg>')
+
+CELL_TEMPLATE = '<rect x="%d" y="%d" width="1" height="1"/>'
+
+
+def get_email_hash(email):
+    """ Returns the MD5 hex digest of a lowercased email address. """
+    return md5_constructor(email.strip().lower().encode('utf-8')).hexdigest()
+
+
+def render_identicon(email_hash, size=80):
+    """
+    Renders the identicon for an email hash as SVG.
+
+    The first 15 digits of the hash fill the left three columns of the
+    pattern, which are mirrored to the right. The last six digits define
+    the color.
+
+    :param email_hash:
+        String with the MD5 hex digest of the email address.
+
+    :param size:
+        Integer with the width and height of the image in pixels.
+
+    :return: String containing the SVG document.
+
+    """
+    cells = []
+    for index in range(15):
+        if int(email_hash[index], 16) % 2:
+            continue
+        column, row = divmod(index, 5)
+        cells.append(CELL_TEMPLATE % (column, row))
+        if column != 2:
+            cells.append(CELL_TEMPLATE % (4 - column, row))
+
+    color = '#%s' % email_hash[-6:]
+    return SVG_TEMPLATE % {'size': size,
+                           'color': color,
+                           'cells': ''.join(cells)}
+
+
+def get_identicon_url(email, size=None, storage=None):
+    """
+    Returns the URI of the identicon for an email address.
+
+    The identicon is rendered and saved to ``USERENA_IDENTICON_PATH`` the
+    first time it's requested. After that the URI is served from the mugshot
+    URI cache without touching the storage.
+
+    :param email:
+        String containing the email address of the user.
+
+    :param size:
+        Integer with the size in pixels. Defaults to
+        ``USERENA_MUGSHOT_SIZE``.
+
+    :param storage:
+        Storage the identicons are saved in. Defaults to the
+        ``default_storage`` of Django.
+
+    """
+    if size is None:
+        size = userena_settings.USERENA_MUGSHOT_SIZE
+    if storage is None:
+        storage = default_storage
+
+    email_hash = get_email_hash(email)
+    name = '%(path)s%(hash)s_%(size)s.svg' % {
+        'path': userena_settings.USERENA_IDENTICON_PATH,
+        'hash': email_hash,
+        'size': size}
+
+    identicon_url = mugshot_url_cache.get(name)
+    if identicon_url is None:
+        if not storage.exists(name):
+            svg = render_identicon(email_hash, size)
+            saved_name = storage.save(name, ContentFile(svg.encode('utf-8')))
+            if saved_name != name:
+                # A concurrent request saved the same identicon first, the
+                # name is a hash so its file is the same.
+                storage.delete(saved_name)
+        identicon_url = storage.url(name)
+        cache_mugshot_url(name, identicon_url, storage)
+    return identicon_url
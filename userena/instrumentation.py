@@ -0,0 +1,219 @@
+"""
+Timing of the hot paths of userena.
+
+The manager methods, the rendering and sending of emails and the views are
+wrapped by :func:`timed`. Every call records its duration and the amount of
+queries it ran and passes them to the sinks in
+``USERENA_INSTRUMENTATION_SINKS``. Without sinks the wrappers call through
+directly, so the instrumentation costs nothing when it's disabled.
+
+The queries are counted with the debug cursor of the default database,
+which is enabled while a timed call runs.
+
+"""
+import logging
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.utils.decorators import available_attrs
+from django.utils.functional import wraps
+
+from userena import settings as userena_settings
+from userena import signals as userena_signals
+
+try:
+    from importlib import import_module
+except ImportError:
+    # Python 2.6
+    from django.utils.importlib import import_module
+
+logger = logging.getLogger('userena.instrumentation')
+
+
+class BaseSink(object):
+    """
+    Base class of sinks. Subclasses pass a timing on and should never raise,
+    because they are called in the middle of requests.
+
+    """
+    def record(self, name, duration, queries):
+        """
+        Passes on a timing.
+
+        :param name:
+            String containing the dotted name of the timed call, for example
+            ``userena.manager.activate_user``.
+
+        :param duration:
+            Float with the seconds the call took.
+
+        :param queries:
+            Integer with the amount of queries the call ran.
+
+        """
+        raise NotImplementedError
+
+
+class SignalSink(BaseSink):
+    """ Sends the :data:`userena.signals.timing` signal. """
+    def record(self, name, duration, queries):
+        userena_signals.timing.send(sender=None, name=name,
+                                    duration=duration, queries=queries)
+
+
+class LoggingSink(BaseSink):
+    """ Logs every timing to the ``userena.instrumentation`` logger. """
+    def record(self, name, duration, queries):
+        logger.info("%s took %.2f ms and %d queries", name,
+                    duration * 1000, queries)
+
+
+class StatsdSink(BaseSink):
+    """
+    Sends every timing as a statsd timer to ``USERENA_STATSD_HOST`` and
+    ``USERENA_STATSD_PORT`` over UDP. The amount of queries is sent as the
+    timer ``<name>.queries``, so its percentiles are kept too.
+
+    """
+    def __init__(self):
+        self.address = (userena_settings.USERENA_STATSD_HOST,
+                        userena_settings.USERENA_STATSD_PORT)
+        self.prefix = userena_settings.USERENA_STATSD_PREFIX
+        self.socket = None
+
+    def record(self, name, duration, queries):
+        name = self.prefix + name
+        self.send("%s:%.3f|ms\n%s.queries:%d|ms" % (name, duration * 1000,
+                                                     name, queries))
+
+    def send(self, data):
+        """ Sends the statsd ``data`` in one datagram, ignoring any error. """
+        try:
+            if self.socket is None:
+                self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.socket.sendto(data.encode('utf-8'), self.address)
+        except (socket.error, UnicodeError):
+            pass
+
+
+class MemoryStatsdSink(StatsdSink):
+    """ :class:`StatsdSink` that keeps the datagrams in ``packets``, for tests. """
+    def __init__(self):
+        super(MemoryStatsdSink, self).__init__()
+        self.packets = []
+
+    def send(self, data):
+        self.packets.append(data)
+
+
+_sinks = {}
+
+def get_sinks():
+    """ Returns instances of the classes in ``USERENA_INSTRUMENTATION_SINKS``. """
+    paths = tuple(userena_settings.USERENA_INSTRUMENTATION_SINKS)
+    if paths not in _sinks:
+        sinks = []
+        for path in paths:
+            module_name, class_name = path.rsplit('.', 1)
+            sinks.append(getattr(import_module(module_name), class_name)())
+        _sinks[paths] = sinks
+    return _sinks[paths]
+
+
+_state = threading.local()
+
+
+class Timing(object):
+    """
+    Duration and queries of a timed call, which can be measured in parts.
+    The outermost running timing turns the debug cursor on and off.
+
+    """
+    def __init__(self, name):
+        self.name = name
+        self.duration = 0
+        self.queries = 0
+
+    def start(self):
+        self.depth = getattr(_state, 'depth', 0)
+        if not self.depth:
+            self.use_debug_cursor = connection.use_debug_cursor
+            connection.use_debug_cursor = True
+            self.first_query = len(connection.queries)
+        _state.depth = self.depth + 1
+        self.start_queries = len(connection.queries)
+        self.start_time = time.time()
+
+    def stop(self):
+        self.duration += time.time() - self.start_time
+        self.queries += len(connection.queries) - self.start_queries
+        _state.depth = self.depth
+        if not self.depth:
+            connection.use_debug_cursor = self.use_debug_cursor
+            if not (self.use_debug_cursor or settings.DEBUG):
+                # The queries are only kept for the count.
+                del connection.queries[self.first_query:]
+
+    def record(self):
+        """ Passes the timing to the sinks. """
+        for sink in get_sinks():
+            sink.record(self.name, self.duration, self.queries)
+
+
+def _time_rendering(response, timing):
+    """
+    Continues ``timing`` while the template of ``response`` is rendered,
+    which happens after the view returned.
+
+    """
+    render = response.render
+    def _render():
+        if response.is_rendered:
+            return render()
+        timing.start()
+        try:
+            return render()
+        finally:
+            timing.stop()
+            timing.record()
+    response.render = _render
+
+
+def timed(name):
+    """
+    Decorator that records the duration and the queries of every call of
+    the decorated function as ``name``. A ``TemplateResponse`` returned by
+    a view is timed until it's rendered.
+
+    """
+    def decorator(func):
+        def _wrapped(*args, **kwargs):
+            if not userena_settings.USERENA_INSTRUMENTATION_SINKS:
+                return func(*args, **kwargs)
+
+            timing = Timing(name)
+            timing.start()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                timing.stop()
+            if getattr(result, 'is_rendered', True):
+                timing.record()
+            else:
+                _time_rendering(result, timing)
+            return result
+        return wraps(func, assigned=available_attrs(func))(_wrapped)
+    return decorator
+
+
+class TimedViewMixin(object):
+    """ Mixin for class-based views that times the view as ``timing_name``. """
+    timing_name = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super(TimedViewMixin, cls).as_view(**initkwargs)
+        return timed(cls.timing_name)(view)
@@ -1,14 +1,115 @@
 # -*- coding: utf-8 -*-
 import re
+from multiprocessing.pool import ThreadPool
 
+from django.conf import settings
+from django.template import Context
+from django.template.loader import get_template
 from django.utils.six.moves import StringIO
 from django.utils.translation import ugettext as _
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
 
 from html2text import html2text
 
-def send_mail(subject, message_plain, message_html, email_from, email_to,
-              custom_headers={}, attachments=()):
+from userena import settings as userena_settings
+from userena.instrumentation import timed
+from userena.compat import md5_constructor
+from userena.utils import LRUCache
+
+html2text_cache = LRUCache(userena_settings.USERENA_HTML2TEXT_CACHE_SIZE)
+_email_bundles = {}
+
+
+def html_to_text(message_html):
+    """
+    Returns the plain text version of ``message_html`` made by ``html2text``.
+    The result is cached by the hash of the HTML in a :class:`LRUCache` of
+    ``USERENA_HTML2TEXT_CACHE_SIZE`` items.
+    """
+    key = md5_constructor(message_html.encode('utf-8')).hexdigest()
+    message_plain = html2text_cache.get(key)
+    if message_plain is None:
+        message_plain = html2text(message_html)
+        html2text_cache.set(key, message_plain)
+    return message_plain
+
+
+class EmailBundle(object):
+    """
+    The subject, plain text and HTML templates of one kind of email, named
+    ``<name>_subject<suffix>.txt``, ``<name>_message<suffix>.txt`` and
+    ``<name>_message<suffix>.html``.
+
+    The templates are loaded the first time they are needed and kept for the
+    lifetime of the process, so changed templates need a restart. With
+    ``DEBUG`` enabled they are loaded for every email instead. Use
+    :func:`get_email_bundle` to share the bundles.
+
+    """
+    def __init__(self, name, suffix=''):
+        self.subject_template_name = '%s_subject%s.txt' % (name, suffix)
+        self.plain_template_name = '%s_message%s.txt' % (name, suffix)
+        self.html_template_name = '%s_message%s.html' % (name, suffix)
+        self._templates = {}
+
+    def get_template(self, template_name):
+        """ Returns the compiled template ``template_name``. """
+        if settings.DEBUG:
+            return get_template(template_name)
+        try:
+            return self._templates[template_name]
+        except KeyError:
+            template = self._templates[template_name] = get_template(template_name)
+            return template
+
+    @timed('userena.mail.render')
+    def render(self, context):
+        """
+        Renders the templates of the email with a single ``context``.
+
+        The HTML template is only rendered when ``USERENA_HTML_EMAIL`` is
+        enabled and the plain text template when the HTML version is missing
+        or ``USERENA_USE_PLAIN_TEMPLATE`` is enabled.
+
+        :return:
+            Tuple containing the subject, the plain text message, or ``None``,
+            and the HTML message, or ``None``.
+
+        """
+        context = Context(context)
+        subject = self.get_template(self.subject_template_name).render(context)
+        subject = ''.join(subject.splitlines())
+
+        if userena_settings.USERENA_HTML_EMAIL:
+            message_html = self.get_template(self.html_template_name).render(context)
+        else:
+            message_html = None
+
+        if (not userena_settings.USERENA_HTML_EMAIL or not message_html or
+            userena_settings.USERENA_USE_PLAIN_TEMPLATE):
+            message_plain = self.get_template(self.plain_template_name).render(context)
+        else:
+            message_plain = None
+        return subject, message_plain, message_html
+
+    def send(self, context, email_to, email_from=None, connection=None):
+        """ Renders the email with ``context`` and sends it to ``email_to``. """
+        subject, message_plain, message_html = self.render(context)
+        send_mail(subject, message_plain, message_html,
+                  email_from or settings.DEFAULT_FROM_EMAIL, email_to,
+                  connection=connection)
+
+
+def get_email_bundle(name, suffix=''):
+    """ Returns the :class:`EmailBundle` of ``name``, created once per process. """
+    try:
+        return _email_bundles[(name, suffix)]
+    except KeyError:
+        bundle = _email_bundles[(name, suffix)] = EmailBundle(name, suffix)
+        return bundle
+
+def build_message(subject, message_plain, message_html, email_from, email_to,
+                  custom_headers={}, attachments=(), connection=None):
     """
     Build the email as a multipart message containing
     a multipart alternative for text (plain, HTML) plus
@@ -18,7 +119,7 @@ def send_mail(subject, message_plain, message_html, email_from, email_to,
         raise ValueError(_("Either message_plain or message_html should be not None"))
 
     if not message_plain:
-        message_plain = html2text(message_html)
+        message_plain = html_to_text(message_html)
 
     message = {}
 
@@ -30,11 +131,104 @@ def send_mail(subject, message_plain, message_html, email_from, email_to,
         message['attachments'] = attachments
     if custom_headers:
         message['headers'] = custom_headers
+    if connection is not None:
+        message['connection'] = connection
 
     msg = EmailMultiAlternatives(**message)
     if message_html:
         msg.attach_alternative(message_html, "text/html")
-    msg.send()
+    return msg
+
+
+@timed('userena.mail.send')
+def send_mail(subject, message_plain, message_html, email_from, email_to,
+              custom_headers={}, attachments=(), connection=None):
+    """
+    Build the email with :func:`build_message` and send it. Pass an opened
+    ``connection`` to send several emails over the same connection.
+    """
+    build_message(subject, message_plain, message_html, email_from, email_to,
+                  custom_headers, attachments, connection).send()
+
+
+def _send_messages(messages):
+    """
+    Sends ``messages`` over a single connection. A failing message doesn't
+    stop the others, the connection is opened again after the failure.
+
+    :return: List of ``(index, exception)`` tuples of the failed messages.
+
+    """
+    failed = []
+    connection = get_connection()
+    try:
+        for index, message in messages:
+            try:
+                connection.open()
+                message.connection = connection
+                message.send()
+            except Exception as e:
+                failed.append((index, e))
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+    finally:
+        connection.close()
+    return failed
+
+
+@timed('userena.mail.send_mass')
+def send_mass_mail(datatuple, email_from=None, connections=None):
+    """
+    Sends many emails over a few reused connections.
+
+    :param datatuple:
+        Iterable of ``(subject, message_plain, message_html, email_to)``
+        tuples, built into messages with :func:`build_message`.
+
+    :param email_from:
+        String with the sender, ``DEFAULT_FROM_EMAIL`` by default.
+
+    :param connections:
+        Integer with the amount of connections the emails are sent over in
+        parallel threads, ``USERENA_MAIL_CONNECTIONS`` by default.
+
+    :return:
+        Tuple containing the amount of sent emails and a list of
+        ``(index, exception)`` tuples for the emails that failed, where
+        ``index`` is the position of the email in ``datatuple``.
+
+    """
+    email_from = email_from or settings.DEFAULT_FROM_EMAIL
+    connections = connections or userena_settings.USERENA_MAIL_CONNECTIONS
+
+    messages, failed = [], []
+    total = 0
+    for index, (subject, message_plain, message_html, email_to) in enumerate(datatuple):
+        try:
+            messages.append((index, build_message(subject, message_plain,
+                                                  message_html, email_from,
+                                                  email_to)))
+        except Exception as e:
+            failed.append((index, e))
+        total += 1
+
+    connections = max(1, min(connections, len(messages)))
+    chunks = [messages[i::connections] for i in range(connections)]
+    if connections > 1:
+        pool = ThreadPool(connections)
+        try:
+            results = pool.map(_send_messages, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    else: results = [_send_messages(chunk) for chunk in chunks]
+
+    for chunk_failed in results:
+        failed.extend(chunk_failed)
+    failed.sort(key=lambda failure: failure[0])
+    return total - len(failed), failed
 
 
 def wrap_attachment():
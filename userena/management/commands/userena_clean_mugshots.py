@@ -0,0 +1,34 @@
+from django.core.management.base import NoArgsCommand, BaseCommand, CommandError
+from optparse import make_option
+
+from userena.mugshots import clean_mugshots
+
+class Command(NoArgsCommand):
+    """
+    Delete the mugshots and thumbnails that are no longer used by a profile.
+
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('--min-age',
+            action='store',
+            type='int',
+            dest='min_age',
+            default=3600,
+            help='Seconds a mugshot must be unmodified before it is deleted.'),
+        make_option('--dry-run',
+            action='store_true',
+            dest='dry_run',
+            default=False,
+            help='Only list the mugshots that would be deleted.'),
+        )
+
+    help = 'Delete the mugshots that are not used by any profile.'
+    def handle_noargs(self, **options):
+        try:
+            deleted = clean_mugshots(min_age=options['min_age'],
+                                     dry_run=options['dry_run'])
+        except ValueError as e:
+            raise CommandError(e)
+        if int(options.get('verbosity', 1)) > 0:
+            for name in deleted:
+                self.stdout.write("Deleted %s\n" % name)
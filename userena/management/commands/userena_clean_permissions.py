@@ -0,0 +1,30 @@
+from django.core.management.base import NoArgsCommand, BaseCommand
+from optparse import make_option
+
+from userena.models import UserenaSignup
+
+class Command(NoArgsCommand):
+    """
+    Delete the object permissions on users and profiles that no longer exist.
+
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+            action='store',
+            type='int',
+            dest='batch_size',
+            default=1000,
+            help='Amount of rows checked and deleted at once.'),
+        make_option('--dry-run',
+            action='store_true',
+            dest='dry_run',
+            default=False,
+            help='Only count the rows that would be deleted.'),
+        )
+
+    help = 'Delete the permissions on deleted users and profiles.'
+    def handle_noargs(self, **options):
+        deleted = UserenaSignup.objects.clean_permissions(
+            batch_size=options['batch_size'], dry_run=options['dry_run'])
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write("Deleted %s permissions\n" % deleted)
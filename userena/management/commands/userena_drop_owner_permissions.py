@@ -0,0 +1,35 @@
+from django.core.management.base import NoArgsCommand, BaseCommand, CommandError
+from optparse import make_option
+
+from userena.models import UserenaSignup
+from userena import settings as userena_settings
+
+class Command(NoArgsCommand):
+    """
+    Delete the permission rows of owners that are given implicitly by the
+    ``OwnerPermissionBackend``.
+
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+            action='store',
+            type='int',
+            dest='batch_size',
+            default=1000,
+            help='Amount of rows deleted at once.'),
+        make_option('--dry-run',
+            action='store_true',
+            dest='dry_run',
+            default=False,
+            help='Only count the rows that would be deleted.'),
+        )
+
+    help = 'Delete the object permissions users have on their own user and profile.'
+    def handle_noargs(self, **options):
+        if not userena_settings.USERENA_IMPLICIT_OWNER_PERMISSIONS:
+            raise CommandError("Enable USERENA_IMPLICIT_OWNER_PERMISSIONS and "
+                               "the OwnerPermissionBackend first.")
+        dropped = UserenaSignup.objects.drop_owner_permissions(
+            batch_size=options['batch_size'], dry_run=options['dry_run'])
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write("Deleted %s permissions\n" % dropped)
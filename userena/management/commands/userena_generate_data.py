@@ -0,0 +1,130 @@
+from django.conf import settings
+from django.core.management.base import NoArgsCommand, BaseCommand, CommandError
+from optparse import make_option
+
+from userena.generate import generate_users, get_active_user_ids
+
+class Command(NoArgsCommand):
+    """
+    Generate users, and messages between them, for load testing.
+
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('--users',
+            action='store',
+            type='int',
+            dest='users',
+            default=1000,
+            help='Amount of users to generate.'),
+        make_option('--messages',
+            action='store',
+            type='int',
+            dest='messages',
+            default=0,
+            help='Amount of messages to generate, needs umessages.'),
+        make_option('--seed',
+            action='store',
+            type='int',
+            dest='seed',
+            default=0,
+            help='Seed of the random generator.'),
+        make_option('--prefix',
+            action='store',
+            dest='prefix',
+            default='user',
+            help='Prefix of the usernames.'),
+        make_option('--password',
+            action='store',
+            dest='password',
+            default='userena',
+            help='Password of all generated users.'),
+        make_option('--active-ratio',
+            action='store',
+            type='float',
+            dest='active_ratio',
+            default=0.8,
+            help='Part of the users that is activated.'),
+        make_option('--expired-ratio',
+            action='store',
+            type='float',
+            dest='expired_ratio',
+            default=0.1,
+            help='Part of the users whose activation expired.'),
+        make_option('--no-permissions',
+            action='store_false',
+            dest='permissions',
+            default=None,
+            help="Don't insert the object permissions of the users."),
+        make_option('--sender-skew',
+            action='store',
+            type='float',
+            dest='sender_skew',
+            default=3.0,
+            help='Power law of the senders, 1 gives every user as many messages.'),
+        make_option('--group-ratio',
+            action='store',
+            type='float',
+            dest='group_ratio',
+            default=0.1,
+            help='Part of the messages sent to a group.'),
+        make_option('--max-group-size',
+            action='store',
+            type='int',
+            dest='max_group_size',
+            default=10,
+            help='Maximum amount of recipients of a group message.'),
+        make_option('--read-ratio',
+            action='store',
+            type='float',
+            dest='read_ratio',
+            default=0.7,
+            help='Part of the received messages that is read.'),
+        make_option('--deleted-ratio',
+            action='store',
+            type='float',
+            dest='deleted_ratio',
+            default=0.05,
+            help='Part of the sent and received messages that is deleted.'),
+        make_option('--batch-size',
+            action='store',
+            type='int',
+            dest='batch_size',
+            default=1000,
+            help='Amount of rows inserted at once.'),
+        )
+
+    help = 'Generate users and messages for load testing.'
+    def handle_noargs(self, **options):
+        if options['messages'] and \
+           'userena.contrib.umessages' not in settings.INSTALLED_APPS:
+            raise CommandError("Add userena.contrib.umessages to "
+                               "INSTALLED_APPS to generate messages.")
+
+        users = generate_users(options['users'],
+                               seed=options['seed'],
+                               prefix=options['prefix'],
+                               password=options['password'],
+                               active_ratio=options['active_ratio'],
+                               expired_ratio=options['expired_ratio'],
+                               permissions=options['permissions'],
+                               batch_size=options['batch_size'])
+        verbosity = int(options.get('verbosity', 1))
+        if verbosity > 0:
+            self.stdout.write("Generated %s users\n" % options['users'])
+
+        if options['messages']:
+            from userena.contrib.umessages.generate import generate_messages
+            try:
+                generate_messages(options['messages'],
+                                  users=users if options['users'] else get_active_user_ids(),
+                                  seed=options['seed'],
+                                  sender_skew=options['sender_skew'],
+                                  group_ratio=options['group_ratio'],
+                                  max_group_size=options['max_group_size'],
+                                  read_ratio=options['read_ratio'],
+                                  deleted_ratio=options['deleted_ratio'],
+                                  batch_size=options['batch_size'])
+            except ValueError as e:
+                raise CommandError(e)
+            if verbosity > 0:
+                self.stdout.write("Generated %s messages\n" % options['messages'])
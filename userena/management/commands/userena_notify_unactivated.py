@@ -0,0 +1,36 @@
+from django.core.management.base import NoArgsCommand, BaseCommand
+from optparse import make_option
+from django.utils.encoding import smart_text
+
+from userena.models import UserenaSignup
+from userena import settings as userena_settings
+
+class Command(NoArgsCommand):
+    """
+    Remind the users that haven't activated their account
+    ``USERENA_ACTIVATION_NOTIFY_DAYS`` before it's deleted.
+
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+            action='store',
+            type='int',
+            dest='batch_size',
+            default=500,
+            help='Amount of reminders sent at once.'),
+        )
+
+    help = 'Remind users to activate their account before it expires.'
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        if not userena_settings.USERENA_ACTIVATION_NOTIFY:
+            if verbosity > 0:
+                self.stdout.write("USERENA_ACTIVATION_NOTIFY is disabled\n")
+            return
+
+        notified, failed = UserenaSignup.objects.notify_unactivated_users(
+            batch_size=options['batch_size'])
+        if verbosity > 0:
+            self.stdout.write("Reminded %s users\n" % notified)
+            for user, e in failed:
+                self.stdout.write("WARNING: %s: %s\n" % (smart_text(user), e))
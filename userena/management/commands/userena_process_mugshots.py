@@ -0,0 +1,40 @@
+from django.core.management.base import NoArgsCommand, BaseCommand
+from optparse import make_option
+
+from userena.mugshots import process_pending_mugshots
+
+class Command(NoArgsCommand):
+    """
+    Crop and resize the mugshots that were uploaded while
+    ``USERENA_MUGSHOT_DEFERRED`` is enabled.
+
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('--workers',
+            action='store',
+            type='int',
+            dest='workers',
+            default=1,
+            help='Amount of processes that resize the mugshots.'),
+        make_option('--batch-size',
+            action='store',
+            type='int',
+            dest='batch_size',
+            default=50,
+            help='Amount of mugshots that are read in memory at once.'),
+        make_option('--no-aliases',
+            action='store_false',
+            dest='aliases',
+            default=True,
+            help="Don't generate the thumbnail aliases of the mugshots."),
+        )
+
+    help = 'Process the mugshots waiting for processing.'
+    def handle_noargs(self, **options):
+        processed, failed = process_pending_mugshots(workers=options['workers'],
+                                                     batch_size=options['batch_size'],
+                                                     generate_aliases=options['aliases'])
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write("Processed %d mugshots\n" % len(processed))
+            for pk, error in failed:
+                self.stdout.write("Failed to process mugshot of profile %s: %s\n" % (pk, error))
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.signals import post_delete
+from django.contrib.sites.models import Site
 from django.db.models import Q
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth.models import UserManager, Permission, AnonymousUser
@@ -8,15 +10,24 @@ from django.conf import settings
 from django.utils.six import text_type
 
 from userena import settings as userena_settings
+from userena.instrumentation import timed
+from userena.mail import get_email_bundle, send_mass_mail
+from userena.mugshots import is_pending_mugshot
 from userena.utils import generate_sha1, get_profile_model, get_datetime_now, \
-    get_user_model, get_user_profile
+    get_protocol, get_user_model, get_user_profile, cache_mugshot_url, \
+    connect_user_and_profile, mugshot_url_cache
 from userena import signals as userena_signals
 from userena.compat import smart_text
 
+from guardian.models import UserObjectPermission, GroupObjectPermission
 from guardian.shortcuts import assign_perm, get_perms
+from easy_thumbnails.alias import aliases
+from easy_thumbnails.models import Source
+from easy_thumbnails.utils import get_storage_hash
 
 
 
+import datetime
 import re
 
 SHA1_RE = re.compile('^[a-f0-9]{40}$')
@@ -31,9 +42,41 @@ ASSIGNED_PERMISSIONS = {
          ('delete_user', 'Can delete user'))
 }
 
+def get_assigned_permissions():
+    """
+    Returns a list of ``(model, content type, permission)`` tuples of the
+    permissions userena assigns to a user on its user and profile, fetched
+    with one query.
+
+    """
+    content_types = dict(
+        (model, ContentType.objects.get_for_model(
+            get_profile_model() if model == 'profile' else get_user_model()))
+        for model in ASSIGNED_PERMISSIONS)
+    codenames = [codename for perms in ASSIGNED_PERMISSIONS.values()
+                 for codename, name in perms]
+    found = dict(((permission.content_type_id, permission.codename), permission)
+                 for permission in Permission.objects.filter(
+                     content_type__in=content_types.values(),
+                     codename__in=codenames))
+
+    permissions = []
+    for model, perms in ASSIGNED_PERMISSIONS.items():
+        content_type = content_types[model]
+        for codename, name in perms:
+            try:
+                permission = found[(content_type.pk, codename)]
+            except KeyError:
+                raise Permission.DoesNotExist(
+                    "Permission %s.%s does not exist." % (content_type.app_label,
+                                                          codename))
+            permissions.append((model, content_type, permission))
+    return permissions
+
 class UserenaManager(UserManager):
     """ Extra functionality for the Userena model. """
 
+    @timed('userena.manager.create_user')
     def create_user(self, username, email, password, active=False,
                     send_email=True):
         """
@@ -66,13 +109,16 @@ class UserenaManager(UserManager):
         new_user.is_active = active
         new_user.save()
 
-        # Give permissions to view and change profile
-        for perm in ASSIGNED_PERMISSIONS['profile']:
-            assign_perm(perm[0], new_user, get_user_profile(user=new_user))
-
-        # Give permissions to view and change itself
-        for perm in ASSIGNED_PERMISSIONS['user']:
-            assign_perm(perm[0], new_user, new_user)
+        if not userena_settings.USERENA_IMPLICIT_OWNER_PERMISSIONS:
+            # Give permissions to view and change profile and itself
+            profile = get_user_profile(user=new_user)
+            UserObjectPermission.objects.bulk_create([
+                UserObjectPermission(user=new_user,
+                                     permission=permission,
+                                     content_type=content_type,
+                                     object_pk=text_type(profile.pk if model == 'profile'
+                                                         else new_user.pk))
+                for model, content_type, permission in get_assigned_permissions()])
 
         userena_profile = self.create_userena_profile(new_user)
 
@@ -126,6 +172,7 @@ class UserenaManager(UserManager):
         except Exception:
             return False
 
+    @timed('userena.manager.activate_user')
     def activate_user(self, activation_key):
         """
         Activate an :class:`User` by supplying a valid ``activation_key``.
@@ -178,6 +225,7 @@ class UserenaManager(UserManager):
             return userena.activation_key_expired()
         raise self.model.DoesNotExist
 
+    @timed('userena.manager.confirm_email')
     def confirm_email(self, confirmation_key):
         """
         Confirm an email address by checking a ``confirmation_key``.
@@ -216,6 +264,68 @@ class UserenaManager(UserManager):
                 return user
         return False
 
+    def notify_unactivated_users(self, batch_size=500):
+        """
+        Reminds the users that haven't activated their account that it will
+        be deleted in ``USERENA_ACTIVATION_NOTIFY_DAYS``.
+
+        The users are read in batches of ``batch_size``, ordered by id, and
+        the reminders of a batch are sent with :func:`send_mass_mail`. Users
+        are marked with ``activation_notification_send`` right after their
+        batch is sent, so the reminders can be sent again after an
+        interruption without reminding anyone twice.
+
+        :return:
+            Tuple containing the amount of reminded users and a list of
+            ``(user, exception)`` tuples for the reminders that failed.
+
+        """
+        now = get_datetime_now()
+        activation_days = userena_settings.USERENA_ACTIVATION_DAYS
+        notify_days = userena_settings.USERENA_ACTIVATION_NOTIFY_DAYS
+        notify_from = now - datetime.timedelta(days=activation_days - notify_days)
+        expired_from = now - datetime.timedelta(days=activation_days)
+
+        due = self.filter(activation_notification_send=False,
+                          user__is_active=False,
+                          user__date_joined__lte=notify_from,
+                          user__date_joined__gt=expired_from)\
+                  .exclude(activation_key=userena_settings.USERENA_ACTIVATED)\
+                  .exclude(user__email='')\
+                  .select_related('user')\
+                  .order_by('pk')
+
+        bundle = get_email_bundle('userena/emails/activation_notify_email')
+        site = Site.objects.get_current()
+        notified, failed = 0, []
+        last_pk = 0
+        while True:
+            batch = list(due.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            datatuple = []
+            for signup in batch:
+                context = {'user': signup.user,
+                           'without_usernames': userena_settings.USERENA_WITHOUT_USERNAMES,
+                           'protocol': get_protocol(),
+                           'activation_days': activation_days,
+                           'notify_days': notify_days,
+                           'activation_key': signup.activation_key,
+                           'site': site}
+                datatuple.append(bundle.render(context) + ([signup.user.email], ))
+
+            sent, batch_failed = send_mass_mail(datatuple)
+            failed_indexes = set(index for index, e in batch_failed)
+            failed.extend((batch[index].user, e) for index, e in batch_failed)
+            self.filter(pk__in=[signup.pk for index, signup in enumerate(batch)
+                                if index not in failed_indexes])\
+                .update(activation_notification_send=True)
+            notified += sent
+        return notified, failed
+
+    @timed('userena.manager.delete_expired_users')
     def delete_expired_users(self):
         """
         Checks for expired users and delete's the ``User`` associated with
@@ -232,6 +342,7 @@ class UserenaManager(UserManager):
                 user.delete()
         return deleted_users
 
+    @timed('userena.manager.check_permissions')
     def check_permissions(self):
         """
         Checks that all permissions are set correctly for the users.
@@ -262,6 +373,10 @@ class UserenaManager(UserManager):
                                               codename=perm[0],
                                               content_type=model_content_type)
 
+        # Owners don't need rows when their permissions are implicit.
+        if userena_settings.USERENA_IMPLICIT_OWNER_PERMISSIONS:
+            return (changed_permissions, changed_users, warnings)
+
         # it is safe to rely on settings.ANONYMOUS_USER_ID since it is a
         # requirement of django-guardian
         for user in get_user_model().objects.exclude(id=settings.ANONYMOUS_USER_ID):
@@ -285,6 +400,105 @@ class UserenaManager(UserManager):
 
         return (changed_permissions, changed_users, warnings)
 
+    def drop_owner_permissions(self, batch_size=1000, dry_run=False):
+        """
+        Deletes the ``UserObjectPermission`` rows of ``ASSIGNED_PERMISSIONS``
+        that users have on their own user and profile. They are redundant
+        with ``USERENA_IMPLICIT_OWNER_PERMISSIONS``.
+
+        :param batch_size:
+            Integer with the amount of rows checked and deleted at once.
+
+        :param dry_run:
+            Boolean that defines if the rows are only counted, not deleted.
+
+        :return: Integer with the amount of deleted rows.
+
+        """
+        profile_model = get_profile_model()
+        content_types = {}
+        permission_ids = []
+        for model, perms in ASSIGNED_PERMISSIONS.items():
+            if model == 'profile':
+                model_obj = profile_model
+            else: model_obj = get_user_model()
+            content_types[model] = ContentType.objects.get_for_model(model_obj).pk
+            permission_ids.extend(Permission.objects.filter(
+                content_type=content_types[model],
+                codename__in=[perm[0] for perm in perms]).values_list('pk', flat=True))
+
+        rows = UserObjectPermission.objects.filter(permission__in=permission_ids)\
+                                           .order_by('pk')\
+                                           .values_list('pk', 'user', 'content_type', 'object_pk')
+        dropped = 0
+        last_pk = 0
+        while True:
+            batch = list(rows.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+
+            profile_pks = [object_pk for pk, user_id, content_type, object_pk in batch
+                           if content_type == content_types['profile']]
+            profile_owners = dict((text_type(pk), user_id) for pk, user_id in
+                                  profile_model.objects.filter(pk__in=profile_pks)
+                                                       .values_list('pk', 'user'))
+            redundant = []
+            for pk, user_id, content_type, object_pk in batch:
+                if content_type == content_types['user']:
+                    owner_id = object_pk
+                else: owner_id = text_type(profile_owners.get(object_pk))
+                if owner_id == text_type(user_id):
+                    redundant.append(pk)
+
+            if redundant and not dry_run:
+                UserObjectPermission.objects.filter(pk__in=redundant).delete()
+            dropped += len(redundant)
+        return dropped
+
+    def clean_permissions(self, batch_size=1000, dry_run=False):
+        """
+        Deletes the object permissions on users and profiles that don't exist
+        anymore. guardian refers to the objects with a generic ``object_pk``,
+        so these rows aren't deleted together with the object.
+
+        The rows are compared with the existing objects in batches, which
+        works on every database even though ``object_pk`` is a string.
+
+        :param batch_size:
+            Integer with the amount of rows checked and deleted at once.
+
+        :param dry_run:
+            Boolean that defines if the rows are only counted, not deleted.
+
+        :return: Integer with the amount of deleted rows.
+
+        """
+        deleted = 0
+        for model_obj in (get_user_model(), get_profile_model()):
+            content_type = ContentType.objects.get_for_model(model_obj)
+            for permission_model in (UserObjectPermission, GroupObjectPermission):
+                rows = permission_model.objects.filter(content_type=content_type)\
+                                               .order_by('pk')\
+                                               .values_list('pk', 'object_pk')
+                last_pk = 0
+                while True:
+                    batch = list(rows.filter(pk__gt=last_pk)[:batch_size])
+                    if not batch:
+                        break
+                    last_pk = batch[-1][0]
+
+                    existing = set(text_type(pk) for pk in model_obj.objects.filter(
+                        pk__in=[object_pk for pk, object_pk in batch]
+                    ).values_list('pk', flat=True))
+                    orphans = [pk for pk, object_pk in batch
+                               if object_pk not in existing]
+
+                    if orphans and not dry_run:
+                        permission_model.objects.filter(pk__in=orphans).delete()
+                    deleted += len(orphans)
+        return deleted
+
 class UserenaBaseProfileManager(models.Manager):
     """ Manager for :class:`UserenaProfile` """
     def get_visible_profiles(self, user=None):
@@ -311,3 +525,77 @@ class UserenaBaseProfileManager(models.Manager):
             profiles = profiles.exclude(Q(privacy='closed') | Q(privacy='registered'))
         else: profiles = profiles.exclude(Q(privacy='closed'))
         return profiles
+
+    def prefetch_mugshot_thumbnails(self, profiles, alias=None):
+        """
+        Loads the thumbnail metadata of the mugshots of ``profiles`` in two
+        queries and puts the URLs of the existing thumbnails in the mugshot
+        URI cache, so :meth:`UserenaBaseProfile.get_mugshot_url` doesn't query
+        the thumbnail tables for each profile.
+
+        :param profiles:
+            A page of profiles, either a list or a :class:`QuerySet`.
+
+        :param alias:
+            The ``easy_thumbnails`` alias of the thumbnails. Defaults to
+            ``USERENA_MUGSHOT_THUMBNAIL_ALIAS``.
+
+        :return: List of the profiles.
+
+        """
+        profiles = list(profiles)
+        alias = alias or userena_settings.USERENA_MUGSHOT_THUMBNAIL_ALIAS
+        if not alias:
+            return profiles
+
+        mugshots = {}
+        for profile in profiles:
+            mugshot = profile.mugshot
+            if mugshot and not is_pending_mugshot(mugshot.name) and \
+               mugshot_url_cache.get((mugshot.name, alias)) is None:
+                mugshots[mugshot.name] = mugshot
+        if not mugshots:
+            return profiles
+
+        storage = self.model._meta.get_field('mugshot').storage
+        sources = Source.objects.filter(storage_hash=get_storage_hash(storage),
+                                        name__in=list(mugshots))\
+                                .prefetch_related('thumbnails')
+        for source in sources:
+            mugshot = mugshots[source.name]
+            options = aliases.get(alias, target=mugshot.alias_target)
+            if not options:
+                continue
+            options = mugshot.get_options(options)
+            thumbnail_hash = get_storage_hash(mugshot.thumbnail_storage)
+            thumbnails = dict((thumbnail.name, thumbnail)
+                              for thumbnail in source.thumbnails.all()
+                              if thumbnail.storage_hash == thumbnail_hash)
+
+            # Same check as ``Thumbnailer.thumbnail_exists`` for the database
+            # cache: the thumbnail must not be older than its source.
+            for transparent in (False, True):
+                name = mugshot.get_thumbnail_name(options, transparent=transparent)
+                thumbnail = thumbnails.get(name)
+                if thumbnail and thumbnail.modified and \
+                   source.modified <= thumbnail.modified:
+                    cache_mugshot_url((source.name, alias),
+                                      mugshot.thumbnail_storage.url(name),
+                                      mugshot.thumbnail_storage)
+                    break
+        return profiles
+
+
+def delete_object_permissions(sender, instance, **kwargs):
+    """
+    Receiver for ``post_delete`` that deletes the object permissions on a
+    deleted user or profile, so they don't stay behind as orphans.
+
+    """
+    content_type = ContentType.objects.get_for_model(instance)
+    for permission_model in (UserObjectPermission, GroupObjectPermission):
+        permission_model.objects.filter(content_type=content_type,
+                                        object_pk=text_type(instance.pk)).delete()
+
+connect_user_and_profile(post_delete, delete_object_permissions,
+                         dispatch_uid='userena.managers.delete_object_permissions')
@@ -4,7 +4,7 @@ from django.conf import settings
 
 from userena import settings as userena_settings
 from userena.compat import SiteProfileNotAvailable
-from userena.utils import get_user_profile
+from userena.cache import get_profile_by_id
 
 
 class UserenaLocaleMiddleware(object):
@@ -20,7 +20,7 @@ class UserenaLocaleMiddleware(object):
         if not lang_cookie:
             if request.user.is_authenticated():
                 try:
-                    profile = get_user_profile(user=request.user)
+                    profile = get_profile_by_id(request.user.pk)
                 except (ObjectDoesNotExist, SiteProfileNotAvailable):
                     profile = False
 
@@ -1,19 +1,24 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 from django.conf import settings
+from django.core.mail import get_connection
 from django.contrib.sites.models import Site
 from django.db import models
-from django.template.loader import render_to_string
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
-from easy_thumbnails.fields import ThumbnailerImageField
-from guardian.shortcuts import get_perms
 from userena import settings as userena_settings
 from userena.managers import UserenaManager, UserenaBaseProfileManager
+from userena.identicon import get_identicon_url
+from userena.mugshots import MugshotField, is_pending_mugshot
+from userena.storage import get_mugshot_storage
 from userena.utils import get_gravatar, generate_sha1, get_protocol, \
-    get_datetime_now, get_user_model, user_model_label
+    get_datetime_now, get_perms, get_user_model, user_model_label, \
+    cache_mugshot_url, mugshot_url_cache, check_owner_permission_backend
 import datetime
-from .mail import send_mail
+from .mail import get_email_bundle
+
+
+check_owner_permission_backend()
 
 
 PROFILE_PERMISSIONS = (
@@ -27,6 +32,9 @@ def upload_to_mugshot(instance, filename):
     under unique hash for the image. This is for privacy reasons so others
     can't just browse through the mugshot directory.
 
+    When ``USERENA_MUGSHOT_DEFERRED`` is enabled the path is prefixed with
+    ``USERENA_MUGSHOT_PENDING_PATH`` until the mugshot is processed.
+
     """
     extension = filename.split('.')[-1].lower()
     salt, hash = generate_sha1(instance.pk)
@@ -34,6 +42,8 @@ def upload_to_mugshot(instance, filename):
                                                     'id': instance.user.id,
                                                     'date': instance.user.date_joined,
                                                     'date_now': get_datetime_now().date()}
+    if userena_settings.USERENA_MUGSHOT_DEFERRED:
+        path = userena_settings.USERENA_MUGSHOT_PENDING_PATH + path
     return '%(path)s%(hash)s.%(extension)s' % {'path': path,
                                                'hash': hash[:10],
                                                'extension': extension}
@@ -127,54 +137,20 @@ class UserenaSignup(models.Model):
                   'confirmation_key': self.email_confirmation_key,
                   'site': Site.objects.get_current()}
 
-        # Email to the old address, if present
-        subject_old = render_to_string('userena/emails/confirmation_email_subject_old.txt',
-                                       context)
-        subject_old = ''.join(subject_old.splitlines())
-
-        if userena_settings.USERENA_HTML_EMAIL:
-            message_old_html = render_to_string('userena/emails/confirmation_email_message_old.html',
-                                                context)
-        else:
-            message_old_html = None
-
-        if (not userena_settings.USERENA_HTML_EMAIL or not message_old_html or
-            userena_settings.USERENA_USE_PLAIN_TEMPLATE):
-            message_old = render_to_string('userena/emails/confirmation_email_message_old.txt',
-                                       context)
-        else:
-            message_old = None
-
-        if self.user.email:
-            send_mail(subject_old,
-                      message_old,
-                      message_old_html,
-                      settings.DEFAULT_FROM_EMAIL,
-                    [self.user.email])
-
-        # Email to the new address
-        subject_new = render_to_string('userena/emails/confirmation_email_subject_new.txt',
-                                       context)
-        subject_new = ''.join(subject_new.splitlines())
-
-        if userena_settings.USERENA_HTML_EMAIL:
-            message_new_html = render_to_string('userena/emails/confirmation_email_message_new.html',
-                                                context)
-        else:
-            message_new_html = None
-
-        if (not userena_settings.USERENA_HTML_EMAIL or not message_new_html or
-            userena_settings.USERENA_USE_PLAIN_TEMPLATE):
-            message_new = render_to_string('userena/emails/confirmation_email_message_new.txt',
-                                       context)
-        else:
-            message_new = None
-
-        send_mail(subject_new,
-                  message_new,
-                  message_new_html,
-                  settings.DEFAULT_FROM_EMAIL,
-                  [self.email_unconfirmed, ])
+        # Both emails are sent over the same connection.
+        connection = get_connection()
+        connection.open()
+        try:
+            # Email to the old address, if present
+            if self.user.email:
+                get_email_bundle('userena/emails/confirmation_email', '_old')\
+                    .send(context, [self.user.email], connection=connection)
+
+            # Email to the new address
+            get_email_bundle('userena/emails/confirmation_email', '_new')\
+                .send(context, [self.email_unconfirmed, ], connection=connection)
+        finally:
+            connection.close()
 
     def activation_key_expired(self):
         """
@@ -211,29 +187,8 @@ class UserenaSignup(models.Model):
                   'activation_key': self.activation_key,
                   'site': Site.objects.get_current()}
 
-        subject = render_to_string('userena/emails/activation_email_subject.txt',
-                                   context)
-        subject = ''.join(subject.splitlines())
-
-
-        if userena_settings.USERENA_HTML_EMAIL:
-            message_html = render_to_string('userena/emails/activation_email_message.html',
-                                            context)
-        else:
-            message_html = None
-
-        if (not userena_settings.USERENA_HTML_EMAIL or not message_html or
-            userena_settings.USERENA_USE_PLAIN_TEMPLATE):
-            message = render_to_string('userena/emails/activation_email_message.txt',
-                                   context)
-        else:
-            message = None
-
-        send_mail(subject,
-                  message,
-                  message_html,
-                  settings.DEFAULT_FROM_EMAIL,
-                  [self.user.email, ])
+        get_email_bundle('userena/emails/activation_email')\
+            .send(context, [self.user.email, ])
 
 
 @python_2_unicode_compatible
@@ -249,11 +204,14 @@ class UserenaBaseProfile(models.Model):
                                  userena_settings.USERENA_MUGSHOT_SIZE),
                         'crop': userena_settings.USERENA_MUGSHOT_CROP_TYPE}
 
-    mugshot = ThumbnailerImageField(_('mugshot'),
-                                    blank=True,
-                                    upload_to=upload_to_mugshot,
-                                    resize_source=MUGSHOT_SETTINGS,
-                                    help_text=_('A personal image displayed in your profile.'))
+    # Deferred mugshots are resized by the ``userena_process_mugshots``
+    # command instead of during the upload.
+    mugshot = MugshotField(_('mugshot'),
+                           blank=True,
+                           upload_to=upload_to_mugshot,
+                           storage=get_mugshot_storage(),
+                           resize_source=MUGSHOT_SETTINGS,
+                           help_text=_('A personal image displayed in your profile.'))
 
     privacy = models.CharField(_('privacy'),
                                max_length=15,
@@ -293,16 +251,41 @@ class UserenaBaseProfile(models.Model):
         The mugshot can be a uploaded image or a Gravatar.
 
         Gravatar functionality will only be used when
-        ``USERENA_MUGSHOT_GRAVATAR`` is set to ``True``.
+        ``USERENA_MUGSHOT_GRAVATAR`` is set to ``True``. When
+        ``USERENA_MUGSHOT_LOCAL_IDENTICON`` is ``True`` an identicon generated
+        by userena is used instead.
 
         :return:
             ``None`` when Gravatar is not used and no default image is supplied
             by ``USERENA_MUGSHOT_DEFAULT``.
 
+        The URL of an uploaded mugshot is cached by file name, because asking
+        a remote storage for it can be expensive. A new upload gets a new
+        file name and with that a new URL. Signed URL's are only cached for
+        ``USERENA_MUGSHOT_CACHE_TIMEOUT``. When
+        ``USERENA_MUGSHOT_THUMBNAIL_ALIAS`` is set the URL of that thumbnail
+        of the mugshot is returned.
+
         """
-        # First check for a mugshot and if any return that.
-        if self.mugshot:
-            return self.mugshot.url
+        # First check for a mugshot and if any return that. Mugshots which
+        # still have to be processed are replaced by the default mugshot.
+        if self.mugshot and not is_pending_mugshot(self.mugshot.name):
+            alias = userena_settings.USERENA_MUGSHOT_THUMBNAIL_ALIAS
+            cache_key = (self.mugshot.name, alias) if alias else self.mugshot.name
+            mugshot_url = mugshot_url_cache.get(cache_key)
+            if mugshot_url is None:
+                if alias:
+                    thumbnail = self.mugshot[alias]
+                    mugshot_url, storage = thumbnail.url, thumbnail.storage
+                else:
+                    mugshot_url, storage = self.mugshot.url, self.mugshot.storage
+                cache_mugshot_url(cache_key, mugshot_url, storage)
+            return mugshot_url
+
+        # Use a locally generated identicon instead of Gravatar.
+        if userena_settings.USERENA_MUGSHOT_LOCAL_IDENTICON:
+            return get_identicon_url(self.user.email,
+                                     userena_settings.USERENA_MUGSHOT_SIZE)
 
         # Use Gravatar if the user wants to.
         if userena_settings.USERENA_MUGSHOT_GRAVATAR:
@@ -388,7 +371,7 @@ class UserenaBaseProfile(models.Model):
         and isinstance(user, get_user_model()):
             return True
 
-        # Checks done by guardian for owner and admins.
+        # Checks done by guardian and the owner permissions for owner and admins.
         elif 'view_profile' in get_perms(user, self):
             return True
 
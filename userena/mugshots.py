@@ -0,0 +1,391 @@
+"""
+Processing of uploaded mugshots.
+
+When ``USERENA_MUGSHOT_DEFERRED`` is enabled, uploaded mugshots are saved
+unprocessed under ``USERENA_MUGSHOT_PENDING_PATH``. Until they are processed
+the profile displays the default mugshot. The ``userena_process_mugshots``
+command crops and resizes the pending mugshots in a pool of worker processes
+and pre-generates the thumbnail aliases. It has to be run, for ex. as a
+cronjob, or the uploaded mugshots are never displayed.
+
+Unused mugshot files are removed by the ``userena_clean_mugshots`` command.
+
+Uploads are checked against the size limits in the ``USERENA_MUGSHOT_MAX_*``
+settings before the image is decoded.
+
+"""
+import datetime
+import itertools
+import multiprocessing
+import os
+import posixpath
+
+from django import forms
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.template.defaultfilters import filesizeformat
+from django.utils.six import BytesIO
+from django.utils.translation import ugettext as _
+from easy_thumbnails.fields import ThumbnailerImageField
+from easy_thumbnails.files import Thumbnailer, generate_all_aliases
+from easy_thumbnails.models import Thumbnail
+from PIL import Image
+
+from userena import settings as userena_settings
+from userena.cache import profile_changed, versions_enabled
+from userena.storage import ContentHashStorageMixin
+from userena.utils import get_profile_model
+
+
+class MugshotField(ThumbnailerImageField):
+    """
+    :class:`ThumbnailerImageField` that doesn't resize the uploaded image
+    while ``USERENA_MUGSHOT_DEFERRED`` is enabled. The setting is read for
+    every upload.
+
+    """
+    def _get_resize_source(self):
+        if userena_settings.USERENA_MUGSHOT_DEFERRED:
+            return None
+        return self._resize_source
+
+    def _set_resize_source(self, options):
+        self._resize_source = options
+
+    resize_source = property(_get_resize_source, _set_resize_source)
+
+    def deconstruct(self):
+        # Migrations don't need to know about the deferral.
+        name, path, args, kwargs = super(MugshotField, self).deconstruct()
+        return name, 'easy_thumbnails.fields.ThumbnailerImageField', args, kwargs
+
+
+class MugshotUploadHandler(FileUploadHandler):
+    """
+    Upload handler that stops reading a ``mugshot`` upload as soon as it
+    exceeds ``USERENA_MUGSHOT_MAX_BYTES``, instead of storing the complete
+    file first.
+
+    Add it in front of the ``FILE_UPLOAD_HANDLERS`` in your settings.
+
+    """
+    def new_file(self, field_name, *args, **kwargs):
+        super(MugshotUploadHandler, self).new_file(field_name, *args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.field_name == 'mugshot':
+            max_bytes = userena_settings.USERENA_MUGSHOT_MAX_BYTES
+            self.received += len(raw_data)
+            if max_bytes and self.received > max_bytes:
+                raise StopUpload(connection_reset=True)
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def validate_mugshot(upload):
+    """
+    Validates the size of an uploaded mugshot before it's decoded.
+
+    Only the header of the image is read to check the dimensions against
+    ``USERENA_MUGSHOT_MAX_DIMENSION`` and ``USERENA_MUGSHOT_MAX_PIXELS``.
+
+    :param upload:
+        The :class:`UploadedFile` of the mugshot.
+
+    :return: The opened, but not decoded, PIL :class:`Image`.
+
+    """
+    max_bytes = userena_settings.USERENA_MUGSHOT_MAX_BYTES
+    if max_bytes and upload.size > max_bytes:
+        raise forms.ValidationError(_('The image is too large, it must be '
+                                      'smaller than %(size)s.') %
+                                    {'size': filesizeformat(max_bytes)})
+
+    upload.seek(0)
+    try:
+        image = Image.open(upload)
+    except Exception:
+        raise forms.ValidationError(_('Upload a valid image.'))
+
+    width, height = image.size
+    max_dimension = userena_settings.USERENA_MUGSHOT_MAX_DIMENSION
+    max_pixels = userena_settings.USERENA_MUGSHOT_MAX_PIXELS
+    if (max_dimension and max(width, height) > max_dimension) or \
+       (max_pixels and width * height > max_pixels):
+        raise forms.ValidationError(_('The image is too large, it has '
+                                      '%(width)sx%(height)s pixels.') %
+                                    {'width': width, 'height': height})
+    return image
+
+
+def downscale_mugshot(upload, image):
+    """
+    Downscales a large JPEG mugshot while decoding it.
+
+    JPEG images can be decoded at 1/2, 1/4 or 1/8 of their size with the
+    draft mode of PIL. This keeps the memory of the decoder bounded, so the
+    resizing of the mugshot doesn't need the full image in memory.
+
+    :param upload:
+        The :class:`UploadedFile` of the mugshot.
+
+    :param image:
+        The PIL :class:`Image` returned by :func:`validate_mugshot`.
+
+    :return:
+        A smaller :class:`UploadedFile` or the original ``upload`` when the
+        image can't be downscaled.
+
+    """
+    target = userena_settings.USERENA_MUGSHOT_SIZE * 2
+    if image.format != 'JPEG' or max(image.size) < target * 2:
+        upload.seek(0)
+        return upload
+
+    image.draft('RGB', (target, target))
+    image.load()
+    data = BytesIO()
+    save_kwargs = {'quality': 95}
+    if image.info.get('exif'):
+        save_kwargs['exif'] = image.info['exif']
+    image.save(data, 'JPEG', **save_kwargs)
+    return SimpleUploadedFile(upload.name, data.getvalue(),
+                              content_type='image/jpeg')
+
+
+def is_pending_mugshot(name):
+    """
+    Returns ``True`` when the mugshot ``name`` still has to be processed,
+    also when ``USERENA_MUGSHOT_DEFERRED`` was disabled since its upload.
+
+    """
+    return bool(name) and \
+        name.startswith(userena_settings.USERENA_MUGSHOT_PENDING_PATH)
+
+
+def delete_replaced_mugshot(storage, name):
+    """
+    Deletes the mugshot ``name`` from ``storage`` after it was replaced.
+
+    A content-addressed storage can share the file with other profiles, also
+    with an upload of the same image that isn't saved to its profile yet, so
+    it's left to the ``userena_clean_mugshots`` command.
+
+    :return: Boolean ``True`` if the file was deleted.
+
+    """
+    if isinstance(storage, ContentHashStorageMixin):
+        return False
+    storage.delete(name)
+    return True
+
+
+def process_mugshot(name, data, options):
+    """
+    Crops and resizes a mugshot.
+
+    This function doesn't touch the database or the storage, so it can run in
+    a separate process.
+
+    :param name:
+        String containing the file name of the mugshot.
+
+    :param data:
+        The bytes of the uploaded image.
+
+    :param options:
+        Dictionary with the ``easy_thumbnails`` options used to process the
+        image, normally :attr:`UserenaBaseProfile.MUGSHOT_SETTINGS`.
+
+    :return:
+        Tuple containing the extension and the bytes of the processed image.
+
+    """
+    options = dict(options)
+    thumbnailer = Thumbnailer(ContentFile(data), name)
+    if 'quality' not in options:
+        options['quality'] = thumbnailer.thumbnail_quality
+    thumbnail = thumbnailer.generate_thumbnail(options)
+    return os.path.splitext(thumbnail.name)[1], thumbnail.read()
+
+
+def _process_mugshot_job(job):
+    """ Unpacks a job for :func:`process_mugshot` in a worker process. """
+    pk, name, data, options = job
+    try:
+        extension, data = process_mugshot(name, data, options)
+    except Exception as e:
+        return pk, name, None, e
+    return pk, name, extension, data
+
+
+def process_pending_mugshots(workers=1, batch_size=50, generate_aliases=True):
+    """
+    Processes all pending mugshots.
+
+    The images are read from the storage in batches of ``batch_size``,
+    processed by ``workers`` processes and written back under their final
+    name. The profile only points to the processed mugshot when the user
+    didn't upload another one in the meantime.
+
+    :param workers:
+        Integer with the amount of worker processes. ``1`` processes the
+        mugshots in the current process.
+
+    :param batch_size:
+        Integer with the amount of mugshots read in memory at once.
+
+    :param generate_aliases:
+        Boolean that defines if the ``easy_thumbnails`` aliases of the
+        processed mugshots are generated.
+
+    :return:
+        Tuple containing a list of processed profile ids and a list of
+        ``(profile id, error)`` tuples for the mugshots that failed.
+
+    """
+    profile_model = get_profile_model()
+    field = profile_model._meta.get_field('mugshot')
+    storage = field.storage
+    pending_path = userena_settings.USERENA_MUGSHOT_PENDING_PATH
+
+    pending = profile_model.objects.filter(mugshot__startswith=pending_path)\
+                                   .order_by('pk')\
+                                   .values_list('pk', 'mugshot')
+
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    processed, failed = [], []
+    last_pk = 0
+    try:
+        while True:
+            batch = list(pending.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+
+            jobs = []
+            for pk, name in batch:
+                try:
+                    with storage.open(name) as raw:
+                        data = raw.read()
+                except (IOError, OSError) as e:
+                    failed.append((pk, e))
+                    continue
+                jobs.append((pk, name, data, profile_model.MUGSHOT_SETTINGS))
+
+            if pool is not None:
+                results = pool.map(_process_mugshot_job, jobs)
+            else: results = [_process_mugshot_job(job) for job in jobs]
+
+            for pk, name, extension, data in results:
+                if extension is None:
+                    failed.append((pk, data))
+                    continue
+                final_name = os.path.splitext(name[len(pending_path):])[0] + extension
+                final_name = storage.save(final_name, ContentFile(data))
+                updated = profile_model.objects.filter(pk=pk, mugshot=name)\
+                                               .update(mugshot=final_name)
+                delete_replaced_mugshot(storage, name)
+                if not updated:
+                    # A new mugshot was uploaded while processing this one.
+                    delete_replaced_mugshot(storage, final_name)
+                    continue
+                processed.append(pk)
+
+                bump_version = versions_enabled()
+                if not (bump_version or generate_aliases):
+                    continue
+                profile = profile_model.objects.select_related('user').get(pk=pk)
+                if bump_version:
+                    profile_changed(profile.user)
+                if generate_aliases:
+                    generate_all_aliases(profile.mugshot, include_global=True)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return processed, failed
+
+
+def _walk_storage(storage, path):
+    """ Yields the names of all files below ``path`` in ``storage``. """
+    try:
+        directories, files = storage.listdir(path)
+    except (IOError, OSError):
+        return
+    for filename in files:
+        yield posixpath.join(path, filename)
+    for directory in directories:
+        for name in _walk_storage(storage, posixpath.join(path, directory)):
+            yield name
+
+
+def _modified_before(storage, name, threshold):
+    """ Returns ``True`` if ``name`` was last modified before ``threshold``. """
+    try:
+        return storage.modified_time(name) < threshold
+    except NotImplementedError:
+        return True
+    except (IOError, OSError):
+        # The file is already gone.
+        return False
+
+
+def clean_mugshots(min_age=3600, batch_size=500, dry_run=False):
+    """
+    Deletes the mugshots which aren't used by any profile, together with
+    their thumbnails.
+
+    Only the fixed directory in front of ``USERENA_MUGSHOT_PATH`` and its
+    pending counterpart are searched. Thumbnails which are stored next to the
+    mugshots are skipped.
+
+    :param min_age:
+        Integer with the amount of seconds a file must be unmodified before
+        it's deleted, so uploads which aren't saved to a profile yet are kept.
+
+    :param batch_size:
+        Integer with the amount of file names looked up at once.
+
+    :param dry_run:
+        Boolean that defines if the files are only listed, not deleted.
+
+    :return: List of the deleted file names.
+
+    """
+    directory = userena_settings.USERENA_MUGSHOT_PATH.split('%')[0]
+    directory = directory[:directory.rfind('/') + 1]
+    if not directory:
+        raise ValueError("USERENA_MUGSHOT_PATH doesn't start with a fixed "
+                         "directory to clean.")
+
+    profile_model = get_profile_model()
+    field = profile_model._meta.get_field('mugshot')
+    storage = field.storage
+    threshold = datetime.datetime.now() - datetime.timedelta(seconds=min_age)
+
+    names = itertools.chain(
+        _walk_storage(storage, directory),
+        _walk_storage(storage, userena_settings.USERENA_MUGSHOT_PENDING_PATH + directory))
+
+    deleted = []
+    while True:
+        batch = list(itertools.islice(names, batch_size))
+        if not batch:
+            break
+        used = set(profile_model.objects.filter(mugshot__in=batch)
+                                        .values_list('mugshot', flat=True))
+        used.update(Thumbnail.objects.filter(name__in=batch)
+                                     .values_list('name', flat=True))
+        for name in batch:
+            if name in used or not _modified_before(storage, name, threshold):
+                continue
+            if not dry_run:
+                # Deleting through the field file removes the thumbnails too.
+                field.attr_class(profile_model(), field, name).delete(save=False)
+            deleted.append(name)
+    return deleted
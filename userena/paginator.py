@@ -0,0 +1,183 @@
+import json
+
+from django.core.paginator import Paginator, Page, EmptyPage, PageNotAnInteger
+from django.db import connections
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that asks the database for an estimated row count instead of
+    running a full ``COUNT(*)``.
+
+    The estimate is only available on PostgreSQL. An unfiltered queryset
+    reads it from the planner statistics in ``pg_class``, a filtered queryset
+    from the rows the planner expects in the ``EXPLAIN`` of its query. Small
+    results, other databases and non-queryset object lists fall back to an
+    exact count.
+
+    """
+    #: Below this amount of estimated rows an exact count is cheap enough.
+    exact_below = 10000
+
+    def _get_count(self):
+        if self._count is None:
+            self._count = self._get_estimated_count()
+            if self._count is None:
+                self._count = super(EstimatedCountPaginator, self)._get_count()
+        return self._count
+    count = property(_get_count)
+
+    def _get_estimated_count(self):
+        model = getattr(self.object_list, 'model', None)
+        if model is None:
+            return None
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql':
+            return None
+        cursor = connection.cursor()
+        query = self.object_list.query
+        if query.where.children or getattr(query, 'having', None):
+            # The table estimate includes the rows the filters leave out.
+            sql, params = query.sql_with_params()
+            cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = cursor.fetchone()[0]
+            if not isinstance(plan, list):
+                plan = json.loads(plan)
+            estimate = plan[0]['Plan']['Plan Rows']
+        else:
+            cursor.execute("SELECT reltuples FROM pg_class WHERE relname = %s",
+                           [model._meta.db_table])
+            row = cursor.fetchone()
+            estimate = row[0] if row else 0
+        if estimate < self.exact_below:
+            return None
+        return int(estimate)
+
+
+class UncountedPage(Page):
+    """ A :class:`Page` which knows if there is a next page without a count """
+    def __init__(self, object_list, number, paginator, has_next):
+        super(UncountedPage, self).__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+    def end_index(self):
+        return self.start_index() + len(self.object_list) - 1 \
+            if self.object_list else 0
+
+
+class UncountedPaginator(Paginator):
+    """
+    Paginator that never counts the rows of the ``object_list``.
+
+    Every page fetches one row more than ``per_page`` to know if there is a
+    next page. ``count`` and ``num_pages`` are ``None``, so templates should
+    only display the current page number.
+
+    """
+    count = None
+    num_pages = None
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        object_list = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not object_list and not (number == 1 and self.allow_empty_first_page):
+            raise EmptyPage('That page contains no results')
+        has_next = len(object_list) > self.per_page
+        return UncountedPage(object_list[:self.per_page], number, self, has_next)
+
+    @property
+    def page_range(self):
+        return []
+
+
+class CursorPage(Page):
+    """
+    A page of a :class:`CursorPaginator`.
+
+    Instead of a page number the page knows the ``cursor`` it started after
+    and the ``next_cursor`` that should be supplied to fetch the next page.
+
+    """
+    def __init__(self, object_list, cursor, next_cursor, paginator):
+        super(CursorPage, self).__init__(object_list, None, paginator)
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+
+    def __repr__(self):
+        return '<Page after %s>' % self.cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.cursor is not None
+
+    def start_index(self):
+        return None
+
+    def end_index(self):
+        return None
+
+
+class CursorPaginator(object):
+    """
+    Keyset paginator for querysets ordered by a single unique, indexed column.
+
+    Pages are selected with ``WHERE <field> > <cursor> ORDER BY <field>
+    LIMIT <per_page + 1>``, which costs the same on the first page as on the
+    millionth. No ``COUNT(*)`` is ever done.
+
+    :param object_list:
+        A :class:`QuerySet` to paginate.
+
+    :param per_page:
+        Integer with the amount of objects on a page.
+
+    :param field:
+        Name of the column the queryset is ordered by. Defaults to ``pk``.
+
+    """
+    count = None
+    num_pages = None
+    page_range = []
+
+    def __init__(self, object_list, per_page, field='pk'):
+        self.object_list = object_list.order_by(field)
+        self.per_page = int(per_page)
+        self.field = field
+
+    def validate_cursor(self, cursor):
+        """ Returns the cursor as integer or ``None`` for the first page """
+        if cursor in (None, ''):
+            return None
+        try:
+            return int(cursor)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That cursor is not an integer')
+
+    def page(self, cursor=None):
+        """ Returns the :class:`CursorPage` with the objects after ``cursor`` """
+        cursor = self.validate_cursor(cursor)
+        object_list = self.object_list
+        if cursor is not None:
+            object_list = object_list.filter(**{'%s__gt' % self.field: cursor})
+        object_list = list(object_list[:self.per_page + 1])
+
+        next_cursor = None
+        if len(object_list) > self.per_page:
+            object_list = object_list[:self.per_page]
+            next_cursor = getattr(object_list[-1], self.field)
+        return CursorPage(object_list, cursor, next_cursor, self)
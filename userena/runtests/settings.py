@@ -120,6 +120,7 @@ INSTALLED_APPS = (
     'django.contrib.staticfiles',
     'django.contrib.admin',
     'django.contrib.admindocs',
+    'easy_thumbnails',
     'guardian',
     'userena',
     'userena.contrib.umessages',
@@ -65,6 +65,14 @@ USERENA_MUGSHOT_GRAVATAR_SECURE = getattr(settings,
                                           'USERENA_MUGSHOT_GRAVATAR_SECURE',
                                           _USERENA_USE_HTTPS)
 
+USERENA_MUGSHOT_LOCAL_IDENTICON = getattr(settings,
+                                          'USERENA_MUGSHOT_LOCAL_IDENTICON',
+                                          False)
+
+USERENA_IDENTICON_PATH = getattr(settings,
+                                 'USERENA_IDENTICON_PATH',
+                                 'identicons/')
+
 USERENA_MUGSHOT_DEFAULT = getattr(settings,
                                   'USERENA_MUGSHOT_DEFAULT',
                                   'identicon')
@@ -77,10 +85,94 @@ USERENA_MUGSHOT_CROP_TYPE = getattr(settings,
                                     'USERENA_MUGSHOT_CROP_TYPE',
                                     'smart')
 
+USERENA_MUGSHOT_CACHE_SIZE = getattr(settings,
+                                     'USERENA_MUGSHOT_CACHE_SIZE',
+                                     1024)
+
+USERENA_MUGSHOT_CACHE_TIMEOUT = getattr(settings,
+                                        'USERENA_MUGSHOT_CACHE_TIMEOUT',
+                                        None)
+
 USERENA_MUGSHOT_PATH = getattr(settings,
                                'USERENA_MUGSHOT_PATH',
                                'mugshots/')
 
+USERENA_MUGSHOT_THUMBNAIL_ALIAS = getattr(settings,
+                                          'USERENA_MUGSHOT_THUMBNAIL_ALIAS',
+                                          None)
+
+USERENA_MUGSHOT_STORAGE = getattr(settings,
+                                  'USERENA_MUGSHOT_STORAGE',
+                                  None)
+
+USERENA_MUGSHOT_MAX_BYTES = getattr(settings,
+                                    'USERENA_MUGSHOT_MAX_BYTES',
+                                    10 * 1024 * 1024)
+
+USERENA_MUGSHOT_MAX_DIMENSION = getattr(settings,
+                                        'USERENA_MUGSHOT_MAX_DIMENSION',
+                                        10000)
+
+USERENA_MUGSHOT_MAX_PIXELS = getattr(settings,
+                                     'USERENA_MUGSHOT_MAX_PIXELS',
+                                     50000000)
+
+USERENA_MUGSHOT_DEFERRED = getattr(settings,
+                                   'USERENA_MUGSHOT_DEFERRED',
+                                   False)
+
+USERENA_MUGSHOT_PENDING_PATH = getattr(settings,
+                                       'USERENA_MUGSHOT_PENDING_PATH',
+                                       'pending/')
+
+USERENA_CACHE_ALIAS = getattr(settings,
+                              'USERENA_CACHE_ALIAS',
+                              'default')
+
+USERENA_PROFILE_CACHE_TIMEOUT = getattr(settings,
+                                        'USERENA_PROFILE_CACHE_TIMEOUT',
+                                        None)
+
+USERENA_SIGNIN_THROTTLE = getattr(settings,
+                                  'USERENA_SIGNIN_THROTTLE',
+                                  False)
+
+USERENA_SIGNIN_THROTTLE_IDENTIFICATION = getattr(settings,
+                                                 'USERENA_SIGNIN_THROTTLE_IDENTIFICATION',
+                                                 (5, 300))
+
+USERENA_SIGNIN_THROTTLE_IP = getattr(settings,
+                                     'USERENA_SIGNIN_THROTTLE_IP',
+                                     (100, 300))
+
+USERENA_SIGNIN_THROTTLE_IP_HEADER = getattr(settings,
+                                            'USERENA_SIGNIN_THROTTLE_IP_HEADER',
+                                            'REMOTE_ADDR')
+
+USERENA_IMPLICIT_OWNER_PERMISSIONS = getattr(settings,
+                                             'USERENA_IMPLICIT_OWNER_PERMISSIONS',
+                                             False)
+
+USERENA_AUTHENTICATION_SINGLE_QUERY = getattr(settings,
+                                              'USERENA_AUTHENTICATION_SINGLE_QUERY',
+                                              False)
+
+USERENA_USER_CACHE_TIMEOUT = getattr(settings,
+                                     'USERENA_USER_CACHE_TIMEOUT',
+                                     300)
+
+USERENA_PROFILE_CONDITIONAL_GET = getattr(settings,
+                                          'USERENA_PROFILE_CONDITIONAL_GET',
+                                          False)
+
+USERENA_PROFILE_CDN_MAX_AGE = getattr(settings,
+                                      'USERENA_PROFILE_CDN_MAX_AGE',
+                                      None)
+
+USERENA_PROFILE_PURGER = getattr(settings,
+                                 'USERENA_PROFILE_PURGER',
+                                 'userena.cdn.NullPurger')
+
 USERENA_DEFAULT_PRIVACY = getattr(settings,
                                   'USERENA_DEFAULT_PRIVACY',
                                   'registered')
@@ -89,6 +181,22 @@ USERENA_DISABLE_PROFILE_LIST = getattr(settings,
                                        'USERENA_DISABLE_PROFILE_LIST',
                                        False)
 
+USERENA_PROFILE_LIST_CURSOR = getattr(settings,
+                                      'USERENA_PROFILE_LIST_CURSOR',
+                                      False)
+
+USERENA_PROFILE_LIST_MAX_PAGE = getattr(settings,
+                                        'USERENA_PROFILE_LIST_MAX_PAGE',
+                                        None)
+
+USERENA_PROFILE_LIST_COUNT = getattr(settings,
+                                     'USERENA_PROFILE_LIST_COUNT',
+                                     'exact')
+
+USERENA_PROFILE_LIST_FIELDS = getattr(settings,
+                                      'USERENA_PROFILE_LIST_FIELDS',
+                                      ())
+
 USERENA_DISABLE_SIGNUP = getattr(settings,
                                  'USERENA_DISABLE_SIGNUP',
                                  False)
@@ -117,6 +225,26 @@ USERENA_HTML_EMAIL = getattr(settings, 'USERENA_HTML_EMAIL', False)
 
 USERENA_USE_PLAIN_TEMPLATE = getattr(settings, 'USERENA_USE_PLAIN_TEMPLATE', not USERENA_HTML_EMAIL)
 
+USERENA_MAIL_CONNECTIONS = getattr(settings, 'USERENA_MAIL_CONNECTIONS', 1)
+
+USERENA_HTML2TEXT_CACHE_SIZE = getattr(settings, 'USERENA_HTML2TEXT_CACHE_SIZE', 128)
+
+USERENA_UMESSAGES_DIGEST = getattr(settings, 'USERENA_UMESSAGES_DIGEST', False)
+
+USERENA_UMESSAGES_DIGEST_WINDOW = getattr(settings,
+                                          'USERENA_UMESSAGES_DIGEST_WINDOW',
+                                          3600)
+
+USERENA_INSTRUMENTATION_SINKS = getattr(settings,
+                                        'USERENA_INSTRUMENTATION_SINKS',
+                                        ())
+
+USERENA_STATSD_HOST = getattr(settings, 'USERENA_STATSD_HOST', 'localhost')
+
+USERENA_STATSD_PORT = getattr(settings, 'USERENA_STATSD_PORT', 8125)
+
+USERENA_STATSD_PREFIX = getattr(settings, 'USERENA_STATSD_PREFIX', '')
+
 USERENA_REGISTER_PROFILE = getattr(settings, 'USERENA_REGISTER_PROFILE', True)
 
 USERENA_REGISTER_USER = getattr(settings, 'USERENA_REGISTER_USER', True)
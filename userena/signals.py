@@ -8,3 +8,5 @@ email_change = Signal(providing_args=["user","prev_email","new_email"])
 profile_change = Signal(providing_args=["user",])
 account_signin = Signal(providing_args=["user",])
 account_signout = Signal(providing_args=["user",])
+signin_throttled = Signal(providing_args=["kind", "value"])
+timing = Signal(providing_args=["name", "duration", "queries"])
@@ -0,0 +1,62 @@
+"""
+Content-addressed storage for mugshots.
+
+Files saved in a :class:`ContentHashStorageMixin` storage are named by the
+SHA1 hash of their bytes. Identical mugshots are therefore stored only once
+and share their thumbnails. A file can be used by more than one profile, so
+files are never deleted when a profile changes its mugshot. The
+``userena_clean_mugshots`` command removes the files no profile refers to.
+
+"""
+import hashlib
+import posixpath
+
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage, get_storage_class
+
+from userena import settings as userena_settings
+
+
+class ContentHashStorageMixin(object):
+    """
+    Storage mixin that replaces the file name with the hash of the content,
+    keeping the directory and the extension. A file that is already stored
+    isn't written again.
+
+    """
+    def get_content_hash(self, content):
+        """ Returns the SHA1 hex digest of ``content``. """
+        content_hash = hashlib.sha1()
+        for chunk in content.chunks():
+            content_hash.update(chunk)
+        return content_hash.hexdigest()
+
+    def save(self, name, content, *args, **kwargs):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content)
+
+        dirname, filename = posixpath.split(name.replace('\\', '/'))
+        extension = posixpath.splitext(filename)[1].lower()
+        name = posixpath.join(dirname, self.get_content_hash(content) + extension)
+        if self.exists(name):
+            return name
+        return super(ContentHashStorageMixin, self).save(name, content,
+                                                         *args, **kwargs)
+
+
+class ContentHashFileSystemStorage(ContentHashStorageMixin, FileSystemStorage):
+    """ A :class:`FileSystemStorage` with content-addressed file names. """
+    pass
+
+
+def get_mugshot_storage():
+    """
+    Returns an instance of the storage class in ``USERENA_MUGSHOT_STORAGE``
+    or ``None`` to use the default storage.
+
+    """
+    if not userena_settings.USERENA_MUGSHOT_STORAGE:
+        return None
+    return get_storage_class(userena_settings.USERENA_MUGSHOT_STORAGE)()
@@ -2,8 +2,16 @@ import django
 
 if django.VERSION < (1, 6):
     from .test_backends import *
+    from .test_cache import *
+    from .test_cdn import *
     from .test_commands import *
+    from .test_identicon import *
+    from .test_instrumentation import *
+    from .test_mail import *
     from .test_privacy import *
+    from .test_queries import *
+    from .test_storage import *
+    from .test_throttle import *
     from .tests_decorators import *
     from .tests_forms import *
     from .tests_managers import *
@@ -0,0 +1,147 @@
+"""
+Query budgets of the views of userena and umessages.
+
+Every named URL in ``userena/urls.py`` and ``umessages/urls.py`` has a
+maximum amount of queries in :data:`QUERY_BUDGETS`. The budgets are measured
+with :func:`create_budget_fixtures`, where john has 50 contacts with a
+conversation each and takes part in group messages. A view that goes over
+its budget fails with the captured SQL, which shows the added queries.
+
+Raise a budget only when the extra queries are intended.
+
+"""
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.utils import translation
+
+from userena.contrib.umessages.models import Message
+from userena.models import UserenaSignup
+from userena.utils import get_profile_model, get_user_model
+
+try:
+    from django.test.utils import CaptureQueriesContext
+except ImportError:  # pragma: no cover
+    # Django < 1.6
+    class CaptureQueriesContext(object):
+        def __init__(self, connection):
+            self.connection = connection
+
+        def __enter__(self):
+            self.use_debug_cursor = self.connection.use_debug_cursor
+            self.connection.use_debug_cursor = True
+            self.initial_queries = len(self.connection.queries)
+            return self
+
+        def __exit__(self, *exc_info):
+            self.connection.use_debug_cursor = self.use_debug_cursor
+            self.captured_queries = self.connection.queries[self.initial_queries:]
+
+CONTACTS = 50
+
+QUERY_BUDGETS = {
+    # userena/urls.py
+    # A valid signup, which creates the user, profile, permissions and signup.
+    'userena_signup': 10,
+    'userena_signin': 13,
+    'userena_signout': 5,
+    'userena_password_reset': 1,
+    'userena_password_reset_done': 0,
+    'userena_password_reset_confirm': 1,
+    'userena_password_reset_complete': 0,
+    'userena_signup_complete': 2,
+    # Activates and signs in, which writes the session.
+    'userena_activate': 18,
+    # An expired key with USERENA_ACTIVATION_RETRY on.
+    'userena_activate_retry': 6,
+    'userena_email_change': 6,
+    'userena_email_change_complete': 6,
+    'userena_email_confirm_complete': 5,
+    'userena_email_confirm': 4,
+    'userena_disabled': 2,
+    'userena_password_change': 6,
+    'userena_password_change_complete': 5,
+    'userena_profile_edit': 5,
+    'userena_profile_detail': 4,
+    'userena_profile_list_paginated': 5,
+    'userena_profile_list': 5,
+
+    # userena/contrib/umessages/urls.py
+    # Sending to 10 recipients.
+    'userena_umessages_compose': 8,
+    'userena_umessages_compose_to': 4,
+    'userena_umessages_reply': 5,
+    'userena_umessages_detail': 6,
+    # Removing 10 messages.
+    'userena_umessages_remove': 6,
+    'userena_umessages_unremove': 6,
+    'userena_umessages_list': 7,
+}
+
+
+def create_budget_fixtures():
+    """
+    Creates ``CONTACTS`` users with a profile, each of them with a
+    conversation with john, and group messages between them. Requires the
+    ``users`` and ``profiles`` fixtures.
+
+    :return: List of the created users.
+
+    """
+    User = get_user_model()
+    profile_model = get_profile_model()
+    password = make_password('blowfish')
+
+    User.objects.bulk_create([User(username='contact%d' % i,
+                                   email='contact%d@example.com' % i,
+                                   password=password)
+                              for i in range(CONTACTS)])
+    contacts = list(User.objects.filter(username__startswith='contact')
+                                .order_by('pk'))
+    profile_model.objects.bulk_create([profile_model(user=user, privacy='open')
+                                       for user in contacts])
+    UserenaSignup.objects.bulk_create([UserenaSignup(user=user) for user in contacts])
+
+    john, jane = User.objects.get(username='john'), User.objects.get(username='jane')
+    for i, contact in enumerate(contacts):
+        Message.objects.send_message(contact, [john], 'Hello %d' % i)
+        if i % 2:
+            Message.objects.send_message(john, [contact], 'Reply %d' % i)
+    Message.objects.send_message(john, contacts[:10], 'Group message')
+    Message.objects.send_message(contacts[0], [john, jane] + contacts[1:10],
+                                 'Group reply')
+    return contacts
+
+
+class QueryBudgetMixin(object):
+    """ Checks the amount of queries of a view against its budget. """
+
+    def setUp(self):
+        cache.clear()
+        self.contacts = create_budget_fixtures()
+
+    def tearDown(self):
+        # The locale middleware activates the language of john's profile.
+        translation.deactivate()
+
+    def assertQueryBudget(self, url_name, method='get', data=None, **kwargs):
+        """
+        Requests ``url_name``, reversed with ``kwargs``, and fails with the
+        captured SQL if it takes more queries than its budget.
+
+        """
+        url = reverse(url_name, kwargs=kwargs or None)
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, data or {})
+        self.failUnless(response.status_code in (200, 302),
+                        "%s responded with %d" % (url_name, response.status_code))
+
+        budget = QUERY_BUDGETS[url_name]
+        queries = context.captured_queries
+        if len(queries) > budget:
+            self.fail("%s took %d queries, its budget is %d:\n%s" % (
+                url_name, len(queries), budget,
+                '\n'.join('%d. %s' % (i, query['sql'])
+                          for i, query in enumerate(queries, 1))))
+        return response
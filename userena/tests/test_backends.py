@@ -1,8 +1,21 @@
+from django.core.exceptions import ImproperlyConfigured
 from django.test import TestCase
+from django.test.utils import override_settings
 from django.contrib.auth import authenticate
 
-from userena.backends import UserenaAuthenticationBackend
-from userena.utils import get_user_model
+from django.core.urlresolvers import reverse
+
+from userena.backends import (UserenaAuthenticationBackend,
+                              CachedUserenaAuthenticationBackend,
+                              OwnerPermissionBackend)
+from userena.cache import USER_KEY, get_cache
+from userena import settings as userena_settings
+from userena.models import UserenaSignup
+from userena.utils import (get_perms, get_user_model, get_user_profile,
+                           check_owner_permission_backend)
+
+from guardian.models import UserObjectPermission
+from guardian.shortcuts import remove_perm
 
 User = get_user_model()
 
@@ -58,6 +71,45 @@ class UserenaAuthenticationBackendTests(TestCase):
                                            password='blowfish')
         self.failUnless(isinstance(result, User))
 
+    def test_single_query(self):
+        """ Email and username are looked up in one query """
+        userena_settings.USERENA_AUTHENTICATION_SINGLE_QUERY = True
+        with self.assertNumQueries(1):
+            result = self.backend.authenticate(identification='JOHN@example.com',
+                                               check_password=False)
+        self.failUnlessEqual(result.username, 'john')
+        self.failUnlessEqual(self.backend.authenticate(identification='john',
+                                                       password='blowfish'),
+                             result)
+
+        # A username that looks like an email address can sign in.
+        jane = User.objects.get(username='jane')
+        jane.username = 'john@example.com'
+        jane.save()
+        result = self.backend.authenticate(identification='john@example.com',
+                                           check_password=False)
+        self.failUnlessEqual(result.pk, 1)
+
+        jane.username = 'jane@example.org'
+        jane.save()
+        result = self.backend.authenticate(identification='jane@example.org',
+                                           password='blowfish')
+        self.failUnlessEqual(result.pk, jane.pk)
+
+        # Without an ``@`` the username is preferred over a lower id.
+        jane.email = 'arie'
+        jane.save()
+        self.failUnlessEqual(self.backend.get_user_by_identification('arie').pk, 3)
+        userena_settings.USERENA_AUTHENTICATION_SINGLE_QUERY = False
+
+    def test_invalid_identification(self):
+        """ Empty and too long identifications don't reach the database """
+        with self.assertNumQueries(0):
+            self.failUnless(self.backend.authenticate(identification='',
+                                                      password='blowfish') is None)
+            self.failUnless(self.backend.authenticate(identification='a' * 300,
+                                                      password='blowfish') is None)
+
     def test_get_user(self):
         """ Test that the user is returned """
         user = self.backend.get_user(1)
@@ -66,3 +118,129 @@ class UserenaAuthenticationBackendTests(TestCase):
         # None should be returned when false id.
         user = self.backend.get_user(99)
         self.failIf(user)
+
+
+class CachedUserenaAuthenticationBackendTests(TestCase):
+    """ Test the ``CachedUserenaAuthenticationBackend`` """
+    fixtures = ['users',]
+    backend = CachedUserenaAuthenticationBackend()
+
+    def setUp(self):
+        get_cache().clear()
+
+    @override_settings(AUTHENTICATION_BACKENDS=(
+        'userena.backends.CachedUserenaAuthenticationBackend', ))
+    def test_get_user(self):
+        """ The user is only fetched again when it changes """
+        with self.assertNumQueries(2):
+            user = self.backend.get_user(1)
+        with self.assertNumQueries(0):
+            cached_user = self.backend.get_user(1)
+            self.failUnlessEqual(cached_user, user)
+            if hasattr(user, 'get_session_auth_hash'):
+                # Django >= 1.7
+                self.failUnlessEqual(cached_user.get_session_auth_hash(),
+                                     user.get_session_auth_hash())
+
+        # The password hash isn't cached.
+        entry = get_cache().get(USER_KEY % 1)
+        self.failIf('password' in entry[1].__dict__)
+
+        # Changing the password invalidates the cached user.
+        user.set_password('swordfish')
+        user.save()
+        cached_user = self.backend.get_user(1)
+        self.failUnless(cached_user.check_password('swordfish'))
+
+        User.objects.get(pk=1).delete()
+        self.failUnless(self.backend.get_user(1) is None)
+
+
+@override_settings(AUTHENTICATION_BACKENDS=(
+    'userena.backends.UserenaAuthenticationBackend',
+    'userena.backends.OwnerPermissionBackend',
+    'guardian.backends.ObjectPermissionBackend',
+    'django.contrib.auth.backends.ModelBackend',
+))
+class OwnerPermissionBackendTests(TestCase):
+    """ Test the ``OwnerPermissionBackend`` """
+    fixtures = ['users', 'profiles']
+    backend = OwnerPermissionBackend()
+
+    def setUp(self):
+        userena_settings.USERENA_IMPLICIT_OWNER_PERMISSIONS = True
+
+    def tearDown(self):
+        userena_settings.USERENA_IMPLICIT_OWNER_PERMISSIONS = False
+
+    def test_missing_backend(self):
+        """ The setting without the backend is refused """
+        check_owner_permission_backend()
+        with self.settings(AUTHENTICATION_BACKENDS=(
+            'userena.backends.UserenaAuthenticationBackend',
+            'guardian.backends.ObjectPermissionBackend',
+        )):
+            self.assertRaises(ImproperlyConfigured,
+                              check_owner_permission_backend)
+            userena_settings.USERENA_IMPLICIT_OWNER_PERMISSIONS = False
+            check_owner_permission_backend()
+
+    def test_disabled(self):
+        """ Without the setting revoked permissions are still enforced """
+        userena_settings.USERENA_IMPLICIT_OWNER_PERMISSIONS = False
+        jane = User.objects.get(username='jane')
+        profile = get_user_profile(user=jane)
+        profile.privacy = 'closed'
+        profile.save()
+        for perm in ('change_profile', 'view_profile'):
+            remove_perm(perm, jane, profile)
+
+        self.failIf(self.backend.has_perm(jane, 'change_profile', profile))
+        self.failIf('view_profile' in get_perms(jane, profile))
+        self.failIf(profile.can_view_profile(jane))
+
+        self.client.login(username='jane', password='blowfish')
+        for name in ('userena_profile_edit', 'userena_profile_detail'):
+            response = self.client.get(reverse(name,
+                                               kwargs={'username': 'jane'}))
+            self.failUnlessEqual(response.status_code, 403)
+
+    def test_has_perm(self):
+        """ Owners have the assigned permissions without a query """
+        john = User.objects.get(pk=1)
+        jane = User.objects.get(pk=2)
+        profile = get_user_profile(user=john)
+
+        with self.assertNumQueries(0):
+            self.failUnless(self.backend.has_perm(john, 'change_user', john))
+            self.failUnless(self.backend.has_perm(john, 'profiles.view_profile', profile))
+            self.failIf(self.backend.has_perm(john, 'auth.view_profile', profile))
+            self.failIf(self.backend.has_perm(john, 'add_user', john))
+            self.failIf(self.backend.has_perm(jane, 'change_user', john))
+            self.failIf(self.backend.has_perm(jane, 'view_profile', profile))
+            self.failIf(self.backend.has_perm(john, 'change_user'))
+
+        self.failUnlessEqual(self.backend.get_all_permissions(john, profile),
+                             set(['view_profile', 'change_profile', 'delete_profile']))
+
+        john.is_active = False
+        self.failIf(self.backend.has_perm(john, 'change_user', john))
+
+    def test_without_rows(self):
+        """ Users created without permission rows can still edit themselves """
+        user = UserenaSignup.objects.create_user('alice', 'alice@example.com',
+                                                 'swordfish', active=True,
+                                                 send_email=False)
+        self.failIf(UserObjectPermission.objects.filter(user=user).exists())
+
+        profile = get_user_profile(user=user)
+        self.failUnless(user.has_perm('change_user', user))
+        self.failUnless('view_profile' in get_perms(user, profile))
+        self.failUnless(profile.can_view_profile(user))
+
+        self.client.login(username='alice', password='swordfish')
+        for name in ('userena_email_change', 'userena_password_change',
+                     'userena_profile_edit'):
+            response = self.client.get(reverse(name,
+                                               kwargs={'username': 'alice'}))
+            self.failUnlessEqual(response.status_code, 200)
@@ -0,0 +1,112 @@
+from django.test import TestCase
+
+from userena import cache as userena_cache
+from userena import settings as userena_settings
+from userena.cache import get_cache, get_profile_by_id, get_profile_by_username
+from userena.utils import get_user_model, get_user_profile
+
+User = get_user_model()
+
+
+class ProfileCacheTests(TestCase):
+    """ Test the cache-aside profile store """
+    fixtures = ['users', 'profiles']
+
+    def setUp(self):
+        userena_settings.USERENA_PROFILE_CACHE_TIMEOUT = 300
+        get_cache().clear()
+
+    def tearDown(self):
+        userena_settings.USERENA_PROFILE_CACHE_TIMEOUT = None
+        get_cache().clear()
+
+    def test_get_profile_by_username(self):
+        """ Profiles are cached by lowercased username """
+        # The id of the user and the profile.
+        with self.assertNumQueries(2):
+            profile = get_profile_by_username('John')
+        with self.assertNumQueries(0):
+            self.failUnlessEqual(get_profile_by_username('john'), profile)
+            self.failUnlessEqual(profile.user.username, 'john')
+
+        # A change to the user or profile is picked up.
+        user = User.objects.get(username='john')
+        user.first_name = 'Johnny'
+        user.save()
+        self.failUnlessEqual(get_profile_by_username('john').user.first_name,
+                             'Johnny')
+
+        self.failUnless(get_profile_by_username('nobody') is None)
+
+    def test_password(self):
+        """ The password hash isn't cached, but saves keep it """
+        get_profile_by_username('john')
+        key = userena_cache.PROFILE_KEY % ('id:%s' % 1)
+        self.failIf('password' in get_cache().get(key)[1].user.__dict__)
+
+        profile = get_profile_by_username('john')
+        profile.user.first_name = 'Johnny'
+        profile.user.save()
+        self.failUnless(User.objects.get(username='john').check_password('blowfish'))
+
+    def test_rename(self):
+        """ A renamed user isn't found by the old username """
+        get_profile_by_username('john')
+        user = User.objects.get(username='john')
+        user.username = 'johnny'
+        user.save()
+        self.failUnless(get_profile_by_username('john') is None)
+        self.failUnlessEqual(get_profile_by_username('johnny').user.pk, user.pk)
+
+        # Another user can take the old username.
+        other = User.objects.create_user('john', 'other@example.com', 'swordfish')
+        self.failUnlessEqual(get_profile_by_username('john').user.pk, other.pk)
+
+    def test_get_profile_by_id(self):
+        """ Profiles are cached by user id """
+        with self.assertNumQueries(1):
+            profile = get_profile_by_id(1)
+        with self.assertNumQueries(0):
+            self.failUnlessEqual(get_profile_by_id(1), profile)
+
+        profile.about_me = 'Changed'
+        profile.save()
+        self.failUnlessEqual(get_profile_by_id(1).about_me, 'Changed')
+
+        User.objects.filter(pk=1).delete()
+        self.failUnless(get_profile_by_id(1) is None)
+
+    def test_disabled(self):
+        """ Without a timeout the database is always used """
+        userena_settings.USERENA_PROFILE_CACHE_TIMEOUT = None
+        get_profile_by_username('john')
+        with self.assertNumQueries(1):
+            get_profile_by_username('john')
+
+    def test_versions_disabled(self):
+        """ Saves don't touch the cache when no feature uses the versions """
+        userena_settings.USERENA_PROFILE_CACHE_TIMEOUT = None
+        User.objects.get(username='john').save()
+        self.failUnless(get_cache().get(userena_cache.PROFILE_LIST_VERSION_KEY) is None)
+
+        userena_settings.USERENA_PROFILE_CACHE_TIMEOUT = 300
+        User.objects.get(username='john').save()
+        self.failIf(get_cache().get(userena_cache.PROFILE_LIST_VERSION_KEY) is None)
+
+    def test_stampede(self):
+        """ Only one process fetches a missing profile """
+        key = userena_cache.PROFILE_KEY % ('id:%s' % 1)
+        get_cache().add(key + ':lock', True)
+        retries, wait = userena_cache.PROFILE_LOCK_RETRIES, userena_cache.PROFILE_LOCK_WAIT
+        userena_cache.PROFILE_LOCK_RETRIES, userena_cache.PROFILE_LOCK_WAIT = 2, 0
+
+        # Another process holds the lock, so the profile is fetched but not
+        # stored.
+        with self.assertNumQueries(1):
+            self.failUnlessEqual(get_profile_by_id(1).pk, 1)
+        self.failUnless(get_cache().get(key) is None)
+
+        get_cache().delete(key + ':lock')
+        get_profile_by_id(1)
+        self.failIf(get_cache().get(key) is None)
+        userena_cache.PROFILE_LOCK_RETRIES, userena_cache.PROFILE_LOCK_WAIT = retries, wait
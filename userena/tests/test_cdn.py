@@ -0,0 +1,68 @@
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from userena import settings as userena_settings
+from userena.cdn import BasePurger, get_purger
+from userena.utils import get_user_model, get_user_profile
+
+User = get_user_model()
+
+
+class RecordingPurger(BasePurger):
+    """ Purger that remembers the purged paths """
+    paths = []
+
+    def purge(self, paths):
+        self.paths.extend(paths)
+
+
+class CDNTests(TestCase):
+    """ Test the caching headers and purging of profile pages """
+    fixtures = ['users', 'profiles']
+
+    def setUp(self):
+        userena_settings.USERENA_PROFILE_CDN_MAX_AGE = 300
+        self.url = reverse('userena_profile_detail', kwargs={'username': 'john'})
+        self.profile = get_user_profile(user=User.objects.get(username='john'))
+        self.profile.privacy = 'open'
+        self.profile.save()
+
+    def tearDown(self):
+        userena_settings.USERENA_PROFILE_CDN_MAX_AGE = None
+        userena_settings.USERENA_PROFILE_PURGER = 'userena.cdn.NullPurger'
+
+    def test_public_profile(self):
+        """ Anonymous views of open profiles can be cached by everyone """
+        response = self.client.get(self.url)
+        self.failUnless('public' in response['Cache-Control'])
+        self.failUnless('max-age=300' in response['Cache-Control'])
+        self.failUnless('Cookie' in response['Vary'])
+
+    def test_private_profile(self):
+        """ Other views may only be cached by the browser """
+        self.client.login(username='jane', password='blowfish')
+        response = self.client.get(self.url)
+        self.failUnlessEqual(response['Cache-Control'], 'private')
+
+        self.client.logout()
+        self.profile.privacy = 'registered'
+        self.profile.save()
+        response = self.client.get(self.url)
+        self.failIf(response.has_header('Cache-Control') and
+                    'public' in response['Cache-Control'])
+
+    def test_disabled(self):
+        """ Without a max age no headers are added """
+        userena_settings.USERENA_PROFILE_CDN_MAX_AGE = None
+        response = self.client.get(self.url)
+        self.failIf(response.has_header('Cache-Control'))
+
+    def test_purge(self):
+        """ A changed profile is purged from the CDN """
+        userena_settings.USERENA_PROFILE_PURGER = \
+            'userena.tests.test_cdn.RecordingPurger'
+        purger = get_purger()
+        self.failUnless(isinstance(purger, RecordingPurger))
+
+        self.profile.save()
+        self.failUnlessEqual(purger.paths, [self.url])
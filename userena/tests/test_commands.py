@@ -2,19 +2,31 @@
 from __future__ import unicode_literals
 
 from django.test import TestCase
-from django.core.management import call_command
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command, CommandError
+from django.utils.six import BytesIO
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_delete
 
+from userena.contrib.umessages.models import Message, MessageContact, MessageRecipient
+from userena import cache as userena_cache
+from userena.cache import get_cache
 from userena.models import UserenaSignup
+from userena.storage import ContentHashFileSystemStorage
 from userena.managers import ASSIGNED_PERMISSIONS
 from userena import settings as userena_settings
-from userena.utils import get_profile_model, get_user_model
+from userena.utils import get_datetime_now, get_profile_model, get_user_model
 
-from guardian.shortcuts import remove_perm
+from guardian.shortcuts import assign_perm, remove_perm
 from guardian.models import UserObjectPermission
+from PIL import Image
 
 import datetime
+import shutil
+import tempfile
 
 User = get_user_model()
 
@@ -42,6 +54,34 @@ class CleanExpiredTests(TestCase):
 
         self.failUnlessEqual(User.objects.filter(username=self.user_info['username']).count(), 0)
 
+class NotifyUnactivatedTests(TestCase):
+    def create_user(self, username, days_ago, active=False):
+        user = UserenaSignup.objects.create_user(username, '%s@example.com' % username,
+                                                 'swordfish', active=active,
+                                                 send_email=False)
+        user.date_joined = get_datetime_now() - datetime.timedelta(days=days_ago)
+        user.save()
+        return user
+
+    def test_notify_unactivated(self):
+        due = [self.create_user('due%s' % i, 3) for i in range(3)]
+        self.create_user('new', 1)
+        self.create_user('expired', 8)
+        self.create_user('active', 3, active=True)
+
+        call_command('userena_notify_unactivated', batch_size=2, verbosity=0)
+        self.failUnlessEqual(sorted(m.to[0] for m in mail.outbox),
+                             [user.email for user in due])
+        self.failUnless('due0' in mail.outbox[0].body)
+        self.failUnlessEqual(
+            sorted(UserenaSignup.objects.filter(activation_notification_send=True)
+                   .values_list('user__username', flat=True)),
+            [user.username for user in due])
+
+        # Nobody is reminded twice.
+        call_command('userena_notify_unactivated', verbosity=0)
+        self.failUnlessEqual(len(mail.outbox), 3)
+
 class CheckPermissionTests(TestCase):
     user_info = {'username': 'alice',
                  'password': 'swordfish',
@@ -123,3 +163,265 @@ class CheckPermissionTests(TestCase):
         # run the command to check for the warning.
         call_command('check_permissions', test=True)
 
+
+class DropOwnerPermissionsTests(TestCase):
+    fixtures = ['users', 'profiles']
+
+    def tearDown(self):
+        userena_settings.USERENA_IMPLICIT_OWNER_PERMISSIONS = False
+
+    def test_drop_owner_permissions(self):
+        user = UserenaSignup.objects.create_user('alice', 'alice@example.com',
+                                                 'swordfish', send_email=False)
+        john = User.objects.get(pk=1)
+        assign_perm('view_profile', john, get_profile_model().objects.get(user=user))
+
+        # The rows are still needed without the setting.
+        self.assertRaises(CommandError, call_command,
+                          'userena_drop_owner_permissions')
+
+        userena_settings.USERENA_IMPLICIT_OWNER_PERMISSIONS = True
+        self.failUnlessEqual(
+            UserenaSignup.objects.drop_owner_permissions(dry_run=True), 5)
+        self.failUnlessEqual(UserObjectPermission.objects.filter(user=user).count(), 5)
+
+        call_command('userena_drop_owner_permissions', batch_size=2, verbosity=0)
+        self.failIf(UserObjectPermission.objects.filter(user=user).exists())
+
+        # Permissions on the objects of others are kept.
+        self.failUnlessEqual(UserObjectPermission.objects.filter(user=john).count(), 1)
+
+        # Nothing is needed anymore.
+        self.failUnlessEqual(UserenaSignup.objects.check_permissions()[1], [])
+
+class CleanPermissionsTests(TestCase):
+    fixtures = ['users', 'profiles']
+
+    def test_clean_permissions(self):
+        john = User.objects.get(pk=1)
+        jane_profile = get_profile_model().objects.get(user__pk=2)
+        for codename in ('view_profile', 'change_profile'):
+            assign_perm(codename, john, jane_profile)
+        # Point the permissions to profiles that don't exist anymore.
+        UserObjectPermission.objects.filter(user=john).update(object_pk='999')
+        assign_perm('view_profile', john, jane_profile)
+
+        call_command('userena_clean_permissions', dry_run=True, verbosity=0)
+        self.failUnlessEqual(UserObjectPermission.objects.filter(user=john).count(), 3)
+
+        call_command('userena_clean_permissions', batch_size=1, verbosity=0)
+        self.failUnlessEqual(list(UserObjectPermission.objects.filter(user=john)
+                                  .values_list('object_pk', flat=True)),
+                             [str(jane_profile.pk)])
+
+    def test_delete_user(self):
+        """ Deleting a user deletes the permissions of others on it """
+        user = UserenaSignup.objects.create_user('alice', 'alice@example.com',
+                                                 'swordfish', send_email=False)
+        john = User.objects.get(pk=1)
+        assign_perm('change_user', john, user)
+        assign_perm('view_profile', john, get_profile_model().objects.get(user=user))
+
+        user.delete()
+        self.failIf(UserObjectPermission.objects.filter(user=john).exists())
+        self.failUnlessEqual(UserenaSignup.objects.clean_permissions(), 0)
+
+    def test_delete_other_model(self):
+        """ Only deleting users and profiles looks for object permissions """
+        senders = [key[1] for key, receiver in post_delete.receivers
+                   if key[0] == 'userena.managers.delete_object_permissions']
+        self.failUnless(senders)
+        self.failIf(id(None) in senders)
+
+class GenerateDataTests(TestCase):
+    def messages(self):
+        return [(message.body, message.recipients.count())
+                for message in Message.objects.order_by('pk')]
+
+    def test_generate_data(self):
+        call_command('userena_generate_data', users=50, messages=200,
+                     batch_size=20, verbosity=0)
+
+        users = User.objects.filter(username__startswith='user')
+        self.failUnlessEqual(users.count(), 50)
+        self.failUnlessEqual(get_profile_model().objects.filter(user__in=users).count(), 50)
+        activated = UserenaSignup.objects.filter(activation_key=userena_settings.USERENA_ACTIVATED)
+        self.failUnless(0 < activated.count() < 50)
+        self.failUnlessEqual(UserObjectPermission.objects.count(), 50 * 5)
+        self.failUnless(users[0].check_password('userena'))
+
+        self.failUnlessEqual(Message.objects.count(), 200)
+        self.failIf(Message.objects.exclude(sender__is_active=True).exists())
+        self.failUnless(MessageRecipient.objects.filter(read_at__isnull=False).exists())
+
+        # The messages are spread over the past year, without touching the
+        # ``auto_now_add`` of the field.
+        self.failUnless(Message.objects.filter(
+            sent_at__lt=get_datetime_now() - datetime.timedelta(days=300)).exists())
+        self.failUnless(Message._meta.get_field('sent_at').auto_now_add)
+        sent_ats = list(Message.objects.order_by('pk')
+                                       .values_list('sent_at', flat=True))
+        self.failUnlessEqual(sent_ats, sorted(sent_ats))
+
+        # Every pair of users has one contact with their latest message.
+        pairs = {}
+        for message in Message.objects.prefetch_related('recipients'):
+            for user in message.recipients.all():
+                pair = tuple(sorted((message.sender_id, user.pk)))
+                pairs[pair] = max(pairs.get(pair, 0), message.pk)
+        contacts = dict((tuple(sorted((contact.um_from_user_id, contact.um_to_user_id))),
+                         contact.latest_message_id)
+                        for contact in MessageContact.objects.all())
+        self.failUnlessEqual(contacts, pairs)
+
+        # The same seed generates the same messages.
+        messages = self.messages()
+        Message.objects.all().delete()
+        call_command('userena_generate_data', users=0, messages=200, verbosity=0)
+        self.failUnlessEqual(self.messages(), messages)
+
+class ProcessMugshotsTests(TestCase):
+    fixtures = ['users', 'profiles']
+
+    def setUp(self):
+        userena_settings.USERENA_MUGSHOT_DEFERRED = True
+        self.field = get_profile_model()._meta.get_field('mugshot')
+        self.storage = self.field.storage
+        self.location = tempfile.mkdtemp()
+        self.field.storage = FileSystemStorage(location=self.location)
+
+    def tearDown(self):
+        self.field.storage = self.storage
+        shutil.rmtree(self.location)
+        userena_settings.USERENA_MUGSHOT_DEFERRED = False
+
+    def upload_mugshot(self, profile, size):
+        image = BytesIO()
+        Image.new('RGB', size, 'red').save(image, 'PNG')
+        name = userena_settings.USERENA_MUGSHOT_PENDING_PATH + 'mugshots/%s.png' % profile.pk
+        name = self.field.storage.save(name, ContentFile(image.getvalue()))
+        get_profile_model().objects.filter(pk=profile.pk).update(mugshot=name)
+        return name
+
+    def test_process_mugshots(self):
+        """ Pending mugshots are resized and replace the default mugshot """
+        profile_model = get_profile_model()
+        profile = profile_model.objects.get(pk=1)
+        pending_name = self.upload_mugshot(profile, (300, 200))
+
+        # The default mugshot is displayed while the mugshot is pending.
+        profile = profile_model.objects.get(pk=1)
+        self.failUnless('gravatar' in profile.get_mugshot_url())
+
+        get_cache().clear()
+        call_command('userena_process_mugshots', verbosity=0)
+
+        profile = profile_model.objects.get(pk=1)
+        self.failUnless(profile.mugshot.name.startswith('mugshots/'))
+        # Nothing uses the profile versions, so they aren't bumped.
+        self.failUnless(get_cache().get(userena_cache.PROFILE_LIST_VERSION_KEY) is None)
+        self.failIf(self.field.storage.exists(pending_name))
+        self.failUnlessEqual((profile.mugshot.width, profile.mugshot.height),
+                             (userena_settings.USERENA_MUGSHOT_SIZE,
+                              userena_settings.USERENA_MUGSHOT_SIZE))
+        self.failUnless(profile.get_mugshot_url().endswith(profile.mugshot.name))
+
+    def test_deferred_upload(self):
+        """ The deferral is read for every upload """
+        profile = get_profile_model().objects.get(pk=1)
+        image = BytesIO()
+        Image.new('RGB', (300, 200), 'red').save(image, 'PNG')
+
+        profile.mugshot.save('mugshot.png', ContentFile(image.getvalue()))
+        self.failUnless(profile.mugshot.name.startswith(
+            userena_settings.USERENA_MUGSHOT_PENDING_PATH))
+        self.failUnlessEqual((profile.mugshot.width, profile.mugshot.height),
+                             (300, 200))
+
+        userena_settings.USERENA_MUGSHOT_DEFERRED = False
+        profile.mugshot.save('mugshot.png', ContentFile(image.getvalue()))
+        self.failUnless(profile.mugshot.name.startswith('mugshots/'))
+        self.failUnlessEqual((profile.mugshot.width, profile.mugshot.height),
+                             (userena_settings.USERENA_MUGSHOT_SIZE,
+                              userena_settings.USERENA_MUGSHOT_SIZE))
+
+    def test_process_mugshots_workers(self):
+        """ Mugshots are processed by a pool of workers """
+        profile_model = get_profile_model()
+        for profile in profile_model.objects.all():
+            self.upload_mugshot(profile, (120, 160))
+
+        call_command('userena_process_mugshots', workers=2, batch_size=1,
+                     verbosity=0)
+
+        for profile in profile_model.objects.all():
+            self.failUnless(profile.mugshot.name.startswith('mugshots/'))
+
+
+    def test_process_mugshots_shared(self):
+        """ Shared mugshots are left to the cleanup """
+        self.field.storage = ContentHashFileSystemStorage(location=self.location)
+        profile_model = get_profile_model()
+        pending_name = self.upload_mugshot(profile_model.objects.get(pk=1),
+                                           (300, 200))
+        # Another upload of the same image, not saved to its profile yet.
+        self.failUnlessEqual(self.upload_mugshot(profile_model.objects.get(pk=2),
+                                                 (300, 200)), pending_name)
+        profile_model.objects.filter(pk=2).update(mugshot='')
+
+        call_command('userena_process_mugshots', verbosity=0)
+        self.failUnless(self.field.storage.exists(pending_name))
+
+        profile_model.objects.filter(pk=2).update(mugshot=pending_name)
+        self.failUnless(profile_model.objects.get(pk=2).mugshot.width)
+
+
+class CleanMugshotsTests(TestCase):
+    fixtures = ['users', 'profiles']
+
+    def setUp(self):
+        self.field = get_profile_model()._meta.get_field('mugshot')
+        self.storage = self.field.storage
+        self.location = tempfile.mkdtemp()
+        self.field.storage = ContentHashFileSystemStorage(location=self.location)
+
+    def tearDown(self):
+        self.field.storage = self.storage
+        shutil.rmtree(self.location)
+
+    def test_clean_mugshots(self):
+        """ Only the mugshots no profile refers to are deleted """
+        profile_model = get_profile_model()
+        storage = self.field.storage
+        used = storage.save('mugshots/a.png', ContentFile(b'used'))
+        unused = storage.save('mugshots/b.png', ContentFile(b'unused'))
+        profile_model.objects.all().update(mugshot=used)
+
+        # New files are kept until they are old enough.
+        call_command('userena_clean_mugshots', verbosity=0)
+        self.failUnless(storage.exists(unused))
+
+        call_command('userena_clean_mugshots', min_age=0, dry_run=True,
+                     verbosity=0)
+        self.failUnless(storage.exists(unused))
+
+        call_command('userena_clean_mugshots', min_age=0, verbosity=0)
+        self.failIf(storage.exists(unused))
+        self.failUnless(storage.exists(used))
+
+    def test_clean_mugshots_shared(self):
+        """ A mugshot used by more profiles stays until none uses it """
+        profile_model = get_profile_model()
+        storage = self.field.storage
+        name = storage.save('mugshots/a.png', ContentFile(b'shared'))
+        self.failUnlessEqual(storage.save('mugshots/b.png',
+                                          ContentFile(b'shared')), name)
+        profile_model.objects.all().update(mugshot=name)
+
+        profile_model.objects.filter(pk=1).update(mugshot='')
+        call_command('userena_clean_mugshots', min_age=0, verbosity=0)
+        self.failUnless(storage.exists(name))
+
+        profile_model.objects.all().update(mugshot='')
+        call_command('userena_clean_mugshots', min_age=0, verbosity=0)
+        self.failIf(storage.exists(name))
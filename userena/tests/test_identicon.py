@@ -0,0 +1,83 @@
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.test import TestCase
+
+from userena import identicon
+from userena import settings as userena_settings
+from userena.identicon import get_email_hash, get_identicon_url, render_identicon
+from userena.tests.profiles.models import Profile
+from userena.utils import mugshot_url_cache
+
+
+class IdenticonTests(TestCase):
+    """ Test the locally generated identicons """
+    fixtures = ['users', 'profiles']
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.storage = FileSystemStorage(location=self.location,
+                                         base_url='/media/')
+        mugshot_url_cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def test_render_identicon(self):
+        """ The same email always renders the same symmetric image """
+        email_hash = get_email_hash('Alice@Example.com ')
+        self.failUnlessEqual(email_hash, get_email_hash('alice@example.com'))
+
+        svg = render_identicon(email_hash, size=40)
+        self.failUnlessEqual(svg, render_identicon(email_hash, size=40))
+        self.failUnless('width="40"' in svg)
+        self.failUnless('fill="#%s"' % email_hash[-6:] in svg)
+        self.failIfEqual(svg, render_identicon(get_email_hash('bob@example.com'),
+                                               size=40))
+
+    def test_get_identicon_url(self):
+        """ The identicon is saved once and served from the storage """
+        url = get_identicon_url('alice@example.com', 80, storage=self.storage)
+        name = '%s%s_80.svg' % (userena_settings.USERENA_IDENTICON_PATH,
+                                get_email_hash('alice@example.com'))
+        self.failUnlessEqual(url, '/media/' + name)
+        self.failUnless(self.storage.exists(name))
+
+        # The next time the URL comes from the cache.
+        self.storage.delete(name)
+        self.failUnlessEqual(get_identicon_url('alice@example.com', 80,
+                                               storage=self.storage), url)
+        self.failIf(self.storage.exists(name))
+
+    def test_get_identicon_url_race(self):
+        """ An identicon saved by a concurrent request isn't saved twice """
+        name = '%s%s_80.svg' % (userena_settings.USERENA_IDENTICON_PATH,
+                                get_email_hash('alice@example.com'))
+        self.storage.save(name, ContentFile(b'<svg/>'))
+        # This request found no identicon before the other one saved it.
+        exists = self.storage.exists
+        checked = []
+        def exists_after_check(name):
+            checked.append(name)
+            return len(checked) > 1 and exists(name)
+        self.storage.exists = exists_after_check
+
+        url = get_identicon_url('alice@example.com', 80, storage=self.storage)
+        self.failUnlessEqual(url, '/media/' + name)
+        self.failUnlessEqual(self.storage.listdir(userena_settings.USERENA_IDENTICON_PATH),
+                             ([], [name.rsplit('/', 1)[-1]]))
+
+    def test_mugshot_url(self):
+        """ Profiles without a mugshot use the local identicon """
+        default_storage = identicon.default_storage
+        identicon.default_storage = self.storage
+        userena_settings.USERENA_MUGSHOT_LOCAL_IDENTICON = True
+
+        profile = Profile.objects.get(pk=1)
+        self.failUnlessEqual(profile.get_mugshot_url(),
+                             get_identicon_url(profile.user.email))
+
+        userena_settings.USERENA_MUGSHOT_LOCAL_IDENTICON = False
+        identicon.default_storage = default_storage
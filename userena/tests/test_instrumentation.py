@@ -0,0 +1,120 @@
+import logging
+import re
+
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+
+from userena import instrumentation
+from userena import settings as userena_settings
+from userena import signals as userena_signals
+from userena.contrib.umessages.models import Message
+from userena.models import UserenaSignup
+from userena.utils import get_user_model
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class InstrumentationTests(TestCase):
+    """ Test the timing of the hot paths """
+    fixtures = ['users', 'profiles']
+
+    def setUp(self):
+        userena_settings.USERENA_INSTRUMENTATION_SINKS = (
+            'userena.instrumentation.SignalSink',
+            'userena.instrumentation.MemoryStatsdSink')
+        self.timings = []
+        userena_signals.timing.connect(self.receive_timing)
+
+    def tearDown(self):
+        userena_settings.USERENA_INSTRUMENTATION_SINKS = ()
+        userena_settings.USERENA_PROFILE_CONDITIONAL_GET = False
+        userena_signals.timing.disconnect(self.receive_timing)
+
+    def receive_timing(self, sender, name, duration, queries, **kwargs):
+        self.timings.append((name, duration, queries))
+
+    def names(self):
+        return [timing[0] for timing in self.timings]
+
+    def test_manager(self):
+        """ Manager methods, and the emails they send, are timed """
+        logged_queries = len(connection.queries)
+        UserenaSignup.objects.create_user('alice', 'alice@example.com',
+                                          'swordfish')
+        self.failUnlessEqual(self.names(), ['userena.mail.render',
+                                            'userena.mail.send',
+                                            'userena.manager.create_user'])
+        name, duration, queries = self.timings[-1]
+        self.failUnless(duration > 0)
+        self.failUnless(queries > 0)
+        # The queries were only kept to count them.
+        self.failUnlessEqual(len(connection.queries), logged_queries)
+
+    def test_views(self):
+        """ Views, including class-based views, are timed """
+        self.client.login(username='john', password='blowfish')
+        url = reverse('userena_profile_detail', kwargs={'username': 'jane'})
+        response = self.client.get(url)
+        self.failUnlessEqual(self.names(), ['userena.view.profile_detail'])
+
+        # Answering with 304 is timed as well.
+        userena_settings.USERENA_PROFILE_CONDITIONAL_GET = True
+        response = self.client.get(url)
+        self.timings = []
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.failUnlessEqual(response.status_code, 304)
+        self.failUnlessEqual(self.names(), ['userena.view.profile_detail'])
+
+        self.timings = []
+        john, jane = get_user_model().objects.filter(pk__in=[1, 2]).order_by('pk')
+        Message.objects.send_message(jane, [john], 'Hello')
+        self.timings = []
+        self.client.get(reverse('userena_umessages_list'))
+        self.failUnlessEqual(self.names(), ['umessages.manager.count_unread_messages_by_sender',
+                                            'umessages.manager.count_unread_messages_for',
+                                            'umessages.view.message_list'])
+        # The view is timed until its template is rendered.
+        self.failUnless(self.timings[-1][2] > self.timings[0][2] + self.timings[1][2])
+
+    def test_statsd(self):
+        """ The statsd sink sends the duration and queries as timers """
+        sink = instrumentation.get_sinks()[1]
+        sink.packets = []
+        UserenaSignup.objects.create_user('alice', 'alice@example.com',
+                                          'swordfish', send_email=False)
+        self.failUnlessEqual(len(sink.packets), 1)
+        self.failUnless(re.match(r'^userena\.manager\.create_user:[0-9.]+\|ms\n'
+                                 r'userena\.manager\.create_user\.queries:[0-9]+\|ms$',
+                                 sink.packets[0]))
+
+    def test_logging(self):
+        """ The logging sink logs every timing """
+        userena_settings.USERENA_INSTRUMENTATION_SINKS = (
+            'userena.instrumentation.LoggingSink', )
+        handler = ListHandler()
+        instrumentation.logger.addHandler(handler)
+        level = instrumentation.logger.level
+        instrumentation.logger.setLevel(logging.INFO)
+        try:
+            UserenaSignup.objects.check_permissions()
+        finally:
+            instrumentation.logger.removeHandler(handler)
+            instrumentation.logger.setLevel(level)
+        self.failUnlessEqual(len(handler.messages), 1)
+        self.failUnless(re.match(r'^userena\.manager\.check_permissions took '
+                                 r'[0-9.]+ ms and [0-9]+ queries$', handler.messages[0]))
+
+    def test_disabled(self):
+        """ Nothing is recorded without sinks """
+        userena_settings.USERENA_INSTRUMENTATION_SINKS = ()
+        UserenaSignup.objects.create_user('alice', 'alice@example.com',
+                                          'swordfish')
+        self.failUnlessEqual(self.timings, [])
@@ -0,0 +1,118 @@
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from userena import settings as userena_settings
+from userena.mail import (get_email_bundle, html2text_cache, html_to_text,
+                          send_mass_mail)
+
+
+class CountingEmailBackend(EmailBackend):
+    """ Email backend that counts its connections and fails for some emails """
+    opened = []
+
+    def open(self):
+        if not getattr(self, 'is_open', False):
+            self.is_open = True
+            self.opened.append(self)
+
+    def close(self):
+        self.is_open = False
+
+    def send_messages(self, messages):
+        for message in messages:
+            if 'fail@example.com' in message.to:
+                raise IOError('Recipient refused')
+        return super(CountingEmailBackend, self).send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='userena.tests.test_mail.CountingEmailBackend')
+class SendMassMailTests(TestCase):
+    """ Test the sending of many emails with ``send_mass_mail`` """
+
+    def setUp(self):
+        CountingEmailBackend.opened = []
+
+    def datatuple(self, amount, fail=()):
+        return [('Subject %s' % i, 'Message %s' % i, None,
+                 ['fail@example.com' if i in fail else 'user%s@example.com' % i])
+                for i in range(amount)]
+
+    def test_one_connection(self):
+        """ All emails are sent over a single connection """
+        sent, failed = send_mass_mail(self.datatuple(5), email_from='from@example.com')
+        self.failUnlessEqual((sent, failed), (5, []))
+        self.failUnlessEqual(len(CountingEmailBackend.opened), 1)
+        self.failUnlessEqual([m.subject for m in mail.outbox],
+                             ['Subject %s' % i for i in range(5)])
+        self.failUnlessEqual(mail.outbox[0].from_email, 'from@example.com')
+
+    def test_connections(self):
+        """ The emails are divided over parallel connections """
+        sent, failed = send_mass_mail(self.datatuple(7), connections=3)
+        self.failUnlessEqual((sent, failed), (7, []))
+        self.failUnlessEqual(len(CountingEmailBackend.opened), 3)
+        self.failUnlessEqual(sorted(m.subject for m in mail.outbox),
+                             sorted('Subject %s' % i for i in range(7)))
+
+    def test_failures(self):
+        """ A failing email doesn't stop the others """
+        datatuple = self.datatuple(5, fail=(1, 3))
+        datatuple.append(('Empty', None, None, ['user@example.com']))
+        sent, failed = send_mass_mail(datatuple, connections=2)
+        self.failUnlessEqual(sent, 3)
+        self.failUnlessEqual([index for index, e in failed], [1, 3, 5])
+        self.failUnless(isinstance(failed[0][1], IOError))
+        self.failUnless(isinstance(failed[2][1], ValueError))
+        self.failUnlessEqual(len(mail.outbox), 3)
+
+
+class EmailBundleTests(TestCase):
+    """ Test the rendering of emails with an ``EmailBundle`` """
+    context = {'user': None, 'protocol': 'http', 'activation_days': 7,
+               'activation_key': 'f' * 40, 'without_usernames': False,
+               'site': {'domain': 'example.com', 'name': 'example.com'}}
+
+    def tearDown(self):
+        userena_settings.USERENA_HTML_EMAIL = False
+        userena_settings.USERENA_USE_PLAIN_TEMPLATE = True
+        html2text_cache.clear()
+
+    def test_bundle(self):
+        """ A bundle and its templates are created once """
+        bundle = get_email_bundle('userena/emails/activation_email')
+        self.failUnless(bundle is get_email_bundle('userena/emails/activation_email'))
+        self.failIf(bundle is get_email_bundle('userena/emails/confirmation_email', '_old'))
+
+        subject, message_plain, message_html = bundle.render(self.context)
+        template = bundle.get_template(bundle.subject_template_name)
+        self.failUnless(template is bundle.get_template(bundle.subject_template_name))
+        self.failIf('\n' in subject)
+        self.failUnless('f' * 40 in message_plain)
+        self.failUnlessEqual(message_html, None)
+
+        # Changed templates are picked up while debugging.
+        with self.settings(DEBUG=True):
+            self.failIf(template is bundle.get_template(bundle.subject_template_name))
+
+    def test_html_only(self):
+        """ The plain text of an HTML email is derived from the HTML """
+        userena_settings.USERENA_HTML_EMAIL = True
+        userena_settings.USERENA_USE_PLAIN_TEMPLATE = False
+        bundle = get_email_bundle('userena/emails/activation_email')
+        subject, message_plain, message_html = bundle.render(self.context)
+        self.failUnlessEqual(message_plain, None)
+
+        bundle.send(self.context, ['alice@example.com'])
+        self.failUnlessEqual(len(mail.outbox), 1)
+        self.failUnlessEqual(mail.outbox[0].body, html_to_text(message_html))
+        self.failUnlessEqual(mail.outbox[0].alternatives,
+                             [(message_html, 'text/html')])
+
+    def test_html_to_text_cache(self):
+        """ The plain text is cached by the hash of the HTML """
+        self.failUnlessEqual(html_to_text('<p>Hello</p>').strip(), 'Hello')
+        self.failUnlessEqual(len(html2text_cache), 1)
+        html_to_text('<p>Hello</p>')
+        self.failUnlessEqual(len(html2text_cache), 1)
@@ -0,0 +1,133 @@
+import datetime
+import re
+
+from django.core import mail
+from django.core.urlresolvers import resolve, reverse
+from django.test import TestCase
+from django.utils.six.moves.urllib.parse import urlparse
+
+from userena import settings as userena_settings
+from userena import urls as userena_urls
+from userena.contrib.umessages import urls as umessages_urls
+from userena.models import UserenaSignup
+from userena.tests.query_budgets import QUERY_BUDGETS, QueryBudgetMixin
+
+
+class QueryBudgetTests(TestCase):
+    """ Every view has a query budget """
+
+    def test_budget_for_every_url(self):
+        """ Every named URL of userena and umessages has a budget """
+        names = set(pattern.name for pattern in
+                    userena_urls.urlpatterns + umessages_urls.urlpatterns)
+        self.failUnlessEqual(names, set(QUERY_BUDGETS))
+
+
+class UserenaQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """ Query budgets of the views in ``userena/urls.py`` """
+    fixtures = ['users', 'profiles']
+
+    def setUp(self):
+        super(UserenaQueryBudgetTests, self).setUp()
+        self.inactive = UserenaSignup.objects.create_user('newbie',
+                                                          'newbie@example.com',
+                                                          'blowfish',
+                                                          send_email=False)
+
+    def signin(self):
+        self.client.login(username='john', password='blowfish')
+
+    def test_over_budget(self):
+        """ A view over its budget fails with the captured SQL """
+        budget = QUERY_BUDGETS['userena_disabled']
+        QUERY_BUDGETS['userena_disabled'] = 1
+        try:
+            self.assertRaisesRegexp(self.failureException,
+                                    'took 2 queries, its budget is 1:\n1\. .*SELECT',
+                                    self.assertQueryBudget, 'userena_disabled',
+                                    username='newbie')
+        finally:
+            QUERY_BUDGETS['userena_disabled'] = budget
+
+    def test_signup(self):
+        self.assertQueryBudget('userena_signup', method='post',
+                               data={'username': 'alice',
+                                     'email': 'alice@example.com',
+                                     'password1': 'swordfish',
+                                     'password2': 'swordfish',
+                                     'tos': 'on'})
+        self.assertQueryBudget('userena_signup_complete', username='john')
+
+    def test_signin(self):
+        self.assertQueryBudget('userena_signin', method='post',
+                               data={'identification': 'john',
+                                     'password': 'blowfish'})
+
+    def test_signout(self):
+        self.signin()
+        self.assertQueryBudget('userena_signout')
+
+    def test_password_reset(self):
+        self.assertQueryBudget('userena_password_reset', method='post',
+                               data={'email': 'john@example.com'})
+        self.assertQueryBudget('userena_password_reset_done')
+        self.assertQueryBudget('userena_password_reset_complete')
+
+    def test_password_reset_confirm(self):
+        self.client.post(reverse('userena_password_reset'),
+                         data={'email': 'john@example.com'})
+        confirm_url = re.search(r'\bhttps?://\S+', mail.outbox[0].body).group()
+        self.assertQueryBudget('userena_password_reset_confirm',
+                               **resolve(urlparse(confirm_url).path).kwargs)
+
+    def test_activate(self):
+        activation_key = self.inactive.userena_signup.activation_key
+        self.assertQueryBudget('userena_disabled', username='newbie')
+        self.assertQueryBudget('userena_activate', activation_key=activation_key)
+
+    def test_activate_retry(self):
+        userena_settings.USERENA_ACTIVATION_RETRY = True
+        try:
+            self.inactive.date_joined -= datetime.timedelta(
+                days=userena_settings.USERENA_ACTIVATION_DAYS + 1)
+            self.inactive.save()
+            response = self.assertQueryBudget(
+                'userena_activate_retry',
+                activation_key=self.inactive.userena_signup.activation_key)
+            self.assertTemplateUsed(response, 'userena/activate_retry_success.html')
+        finally:
+            userena_settings.USERENA_ACTIVATION_RETRY = False
+
+    def test_email_change(self):
+        self.signin()
+        self.assertQueryBudget('userena_email_change', username='john')
+        self.assertQueryBudget('userena_email_change_complete', username='john')
+        self.assertQueryBudget('userena_email_confirm_complete', username='john')
+
+    def test_email_confirm(self):
+        signup = UserenaSignup.objects.get(user__username='john')
+        signup.change_email('johnny@example.com')
+        self.assertQueryBudget('userena_email_confirm',
+                               confirmation_key=signup.email_confirmation_key)
+
+    def test_password_change(self):
+        self.signin()
+        self.assertQueryBudget('userena_password_change', username='john')
+        self.assertQueryBudget('userena_password_change_complete', username='john')
+
+    def test_profile_edit(self):
+        self.signin()
+        self.assertQueryBudget('userena_profile_edit', username='john')
+
+    def test_profile_detail(self):
+        self.signin()
+        self.assertQueryBudget('userena_profile_detail', username='contact0')
+
+    def test_profile_list(self):
+        userena_settings.USERENA_DISABLE_PROFILE_LIST = False
+        try:
+            self.signin()
+            self.assertQueryBudget('userena_profile_list')
+            self.assertQueryBudget('userena_profile_list_paginated', page=2)
+        finally:
+            userena_settings.USERENA_DISABLE_PROFILE_LIST = True
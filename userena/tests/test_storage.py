@@ -0,0 +1,47 @@
+import hashlib
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.test import TestCase
+
+from userena import settings as userena_settings
+from userena.storage import ContentHashFileSystemStorage, get_mugshot_storage
+
+
+class ContentHashStorageTests(TestCase):
+    """ Test the content-addressed mugshot storage """
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.storage = ContentHashFileSystemStorage(location=self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def test_save(self):
+        """ Files are named by their content and stored only once """
+        content_hash = hashlib.sha1(b'mugshot').hexdigest()
+
+        name = self.storage.save('mugshots/a1b2c3.PNG', ContentFile(b'mugshot'))
+        self.failUnlessEqual(name, 'mugshots/%s.png' % content_hash)
+
+        other_name = self.storage.save('mugshots/d4e5f6.png',
+                                       ContentFile(b'mugshot'))
+        self.failUnlessEqual(other_name, name)
+        self.failUnlessEqual(self.storage.listdir('mugshots')[1],
+                             ['%s.png' % content_hash])
+
+        # Other content gets another name.
+        self.failIfEqual(self.storage.save('mugshots/a1b2c3.png',
+                                           ContentFile(b'other')), name)
+
+    def test_get_mugshot_storage(self):
+        """ The storage is configured with ``USERENA_MUGSHOT_STORAGE`` """
+        self.failUnless(get_mugshot_storage() is None)
+
+        userena_settings.USERENA_MUGSHOT_STORAGE = \
+            'userena.storage.ContentHashFileSystemStorage'
+        self.failUnless(isinstance(get_mugshot_storage(),
+                                   ContentHashFileSystemStorage))
+        userena_settings.USERENA_MUGSHOT_STORAGE = None
@@ -0,0 +1,106 @@
+import threading
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.test.client import RequestFactory
+
+from userena import settings as userena_settings
+from userena import signals as userena_signals
+from userena import throttle
+from userena.cache import get_cache
+
+
+class ThrottleTests(TestCase):
+    """ Test the throttling of signin attempts """
+    fixtures = ['users']
+
+    def setUp(self):
+        userena_settings.USERENA_SIGNIN_THROTTLE = True
+        userena_settings.USERENA_SIGNIN_THROTTLE_IDENTIFICATION = (2, 300)
+        get_cache().clear()
+        throttle.reset_counters()
+        self.lockouts = []
+        userena_signals.signin_throttled.connect(self.lockout)
+
+    def tearDown(self):
+        userena_signals.signin_throttled.disconnect(self.lockout)
+        userena_settings.USERENA_SIGNIN_THROTTLE = False
+        userena_settings.USERENA_SIGNIN_THROTTLE_IDENTIFICATION = (5, 300)
+        userena_settings.USERENA_SIGNIN_THROTTLE_IP = (100, 300)
+        get_cache().clear()
+
+    def lockout(self, sender, kind, value, **kwargs):
+        self.lockouts.append((kind, value))
+
+    def test_take_token(self):
+        """ A bucket allows a burst and then the refill rate """
+        self.failUnless(throttle.take_token('ip', '127.0.0.1', (2, 300)))
+        self.failUnless(throttle.take_token('ip', '127.0.0.1', (2, 300)))
+        self.failIf(throttle.take_token('ip', '127.0.0.1', (2, 300)))
+        self.failIf(throttle.take_token('ip', '127.0.0.1', (2, 300)))
+        self.failUnless(throttle.take_token('ip', '127.0.0.2', (2, 300)))
+
+        # Only the first rejection is a lockout.
+        self.failUnlessEqual(self.lockouts, [('ip', '127.0.0.1')])
+        self.failUnlessEqual(throttle.get_counters(),
+                             {'allowed': 3, 'rejected': 2, 'lockouts': 1})
+
+    def test_take_token_parallel(self):
+        """ Parallel attempts are counted atomically """
+        results = []
+        def attempt():
+            results.append(throttle.take_token('ip', '127.0.0.1', (5, 300)))
+        threads = [threading.Thread(target=attempt) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.failUnlessEqual(results.count(True), 5)
+
+    def test_get_client_ip(self):
+        """ The address is read from the configured header """
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1',
+                                       HTTP_X_FORWARDED_FOR='1.2.3.4, 5.6.7.8')
+        self.failUnlessEqual(throttle.get_client_ip(request), '10.0.0.1')
+        userena_settings.USERENA_SIGNIN_THROTTLE_IP_HEADER = 'HTTP_X_FORWARDED_FOR'
+        try:
+            self.failUnlessEqual(throttle.get_client_ip(request), '5.6.7.8')
+        finally:
+            userena_settings.USERENA_SIGNIN_THROTTLE_IP_HEADER = 'REMOTE_ADDR'
+
+    def test_signin_identification(self):
+        """ Throttled identifications are rejected without a query """
+        data = {'identification': 'John', 'password': 'wrong'}
+        for attempt in range(2):
+            self.client.post(reverse('userena_signin'), data=data)
+
+        with self.assertNumQueries(0):
+            response = self.client.post(reverse('userena_signin'),
+                                        data={'identification': 'john',
+                                              'password': 'blowfish'})
+        self.assertFormError(response, 'form', None,
+                             'Too many signin attempts. Please try again later.')
+
+        # Other users can still sign in.
+        response = self.client.post(reverse('userena_signin'),
+                                    data={'identification': 'jane',
+                                          'password': 'blowfish'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_signin_successful(self):
+        """ Successful signins don't count for the identification """
+        data = {'identification': 'john', 'password': 'blowfish'}
+        for attempt in range(3):
+            response = self.client.post(reverse('userena_signin'), data=data)
+            self.assertEqual(response.status_code, 302)
+            self.client.logout()
+        self.failUnlessEqual(self.lockouts, [])
+
+    def test_signin_ip(self):
+        """ Too many attempts from one address get a 429 response """
+        userena_settings.USERENA_SIGNIN_THROTTLE_IP = (1, 300)
+        data = {'identification': 'john', 'password': 'wrong'}
+        self.client.post(reverse('userena_signin'), data=data)
+        response = self.client.post(reverse('userena_signin'), data=data)
+        self.assertEqual(response.status_code, 429)
+        self.failUnless(response.context['throttled'])
@@ -1,12 +1,15 @@
 # encoding: utf-8
 from __future__ import unicode_literals
 
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
+from django.utils.six import BytesIO
 from django.utils.translation import ugettext_lazy as _, override
 
 from userena import forms
 from userena import settings as userena_settings
 from userena.utils import get_user_model
+from PIL import Image
 
 
 class SignupFormTests(TestCase):
@@ -214,3 +217,57 @@ class ChangeEmailFormTests(TestCase):
 class EditAccountFormTest(TestCase):
     """ Test the ``EditAccountForm`` """
     pass
+
+
+class EditProfileFormTests(TestCase):
+    """ Test the ``EditProfileForm`` """
+
+    def _upload(self, size, format='PNG', name='mugshot.png'):
+        data = BytesIO()
+        Image.new('RGB', size, (255, 0, 0)).save(data, format)
+        return SimpleUploadedFile(name, data.getvalue())
+
+    def _form(self, upload):
+        return forms.EditProfileForm(data={'privacy': 'open'},
+                                     files={'mugshot': upload})
+
+    def test_mugshot_max_bytes(self):
+        """ A mugshot larger than ``USERENA_MUGSHOT_MAX_BYTES`` is invalid """
+        userena_settings.USERENA_MUGSHOT_MAX_BYTES = 10
+        form = self._form(self._upload((10, 10)))
+        self.failIf(form.is_valid())
+        self.failUnless('mugshot' in form.errors)
+        userena_settings.USERENA_MUGSHOT_MAX_BYTES = 10 * 1024 * 1024
+
+    def test_mugshot_max_dimensions(self):
+        """ The dimensions are checked without decoding the image """
+        userena_settings.USERENA_MUGSHOT_MAX_DIMENSION = 100
+        form = self._form(self._upload((101, 10)))
+        self.failIf(form.is_valid())
+        self.failUnless('mugshot' in form.errors)
+        userena_settings.USERENA_MUGSHOT_MAX_DIMENSION = 10000
+
+        userena_settings.USERENA_MUGSHOT_MAX_PIXELS = 1000
+        form = self._form(self._upload((40, 30)))
+        self.failIf(form.is_valid())
+        self.failUnless('mugshot' in form.errors)
+        userena_settings.USERENA_MUGSHOT_MAX_PIXELS = 50000000
+
+        form = self._form(self._upload((40, 30)))
+        self.failUnless(form.is_valid())
+
+    def test_mugshot_downscaled(self):
+        """ Large JPEG mugshots are decoded at a reduced size """
+        form = self._form(self._upload((2000, 1000), 'JPEG', 'mugshot.jpg'))
+        self.failUnless(form.is_valid())
+
+        mugshot = form.cleaned_data['mugshot']
+        self.failUnlessEqual(mugshot.name, 'mugshot.jpg')
+        image = Image.open(mugshot)
+        self.failUnlessEqual(image.size, (500, 250))
+
+        # Small images are left alone.
+        upload = self._upload((200, 100), 'JPEG', 'mugshot.jpg')
+        form = self._form(upload)
+        self.failUnless(form.is_valid())
+        self.failUnless(form.cleaned_data['mugshot'] is upload)
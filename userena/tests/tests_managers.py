@@ -1,12 +1,18 @@
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
 from django.test import TestCase
+from django.utils.six import BytesIO
 
 from userena.models import UserenaSignup
 from userena import settings as userena_settings
-from userena.utils import get_user_model, get_user_profile
+from userena.utils import get_user_model, get_user_profile, \
+    get_profile_model, mugshot_url_cache
 
 from guardian.shortcuts import get_perms
+from easy_thumbnails.alias import aliases
+from PIL import Image
 
-import datetime, re
+import datetime, re, shutil, tempfile
 
 User = get_user_model()
 
@@ -172,4 +178,52 @@ class UserenaManagersIssuesTests(TestCase):
         """
         user = UserenaSignup.objects.create_user("test", "test@t.com", "test", active=True, send_email=False)
         # printing of user should not raise any exception
-        print(user)
\ No newline at end of file
+        print(user)
+
+
+class UserenaBaseProfileManagerTests(TestCase):
+    """ Test the manager of the profiles """
+    fixtures = ['users', 'profiles']
+
+    def setUp(self):
+        self.field = get_profile_model()._meta.get_field('mugshot')
+        self.storage = self.field.storage
+        self.location = tempfile.mkdtemp()
+        self.field.storage = FileSystemStorage(location=self.location,
+                                               base_url='/media/')
+        self.thumbnail_storage = self.field.thumbnail_storage
+        self.field.thumbnail_storage = self.field.storage
+        aliases.set('list', {'size': (20, 20), 'crop': True})
+        userena_settings.USERENA_MUGSHOT_THUMBNAIL_ALIAS = 'list'
+        mugshot_url_cache.clear()
+
+    def tearDown(self):
+        userena_settings.USERENA_MUGSHOT_THUMBNAIL_ALIAS = None
+        aliases._aliases[''].pop('list')
+        self.field.storage = self.storage
+        self.field.thumbnail_storage = self.thumbnail_storage
+        shutil.rmtree(self.location)
+        mugshot_url_cache.clear()
+
+    def test_prefetch_mugshot_thumbnails(self):
+        """ The thumbnails of a page of profiles are looked up at once """
+        profile_model = get_profile_model()
+        for profile in profile_model.objects.all():
+            image = BytesIO()
+            Image.new('RGB', (40, 40), 'red').save(image, 'PNG')
+            profile.mugshot.save('%s.png' % profile.pk,
+                                 ContentFile(image.getvalue()))
+            # Generate the thumbnail.
+            url = profile.get_mugshot_url()
+            self.failUnless(url.startswith('/media/mugshots/'))
+            self.failIfEqual(url, profile.mugshot.url)
+        expected = [profile.get_mugshot_url()
+                    for profile in profile_model.objects.order_by('pk')]
+        mugshot_url_cache.clear()
+
+        profiles = list(profile_model.objects.order_by('pk'))
+        with self.assertNumQueries(2):
+            profile_model.objects.prefetch_mugshot_thumbnails(profiles)
+        with self.assertNumQueries(0):
+            self.failUnlessEqual([profile.get_mugshot_url() for profile in profiles],
+                                 expected)
@@ -12,7 +12,7 @@ from django.utils.six.moves.urllib_parse import urlparse, parse_qs
 from userena.models import UserenaSignup, upload_to_mugshot
 from userena import settings as userena_settings
 from userena.tests.profiles.models import Profile
-from userena.utils import get_user_model, get_user_profile
+from userena.utils import get_user_model, get_user_profile, mugshot_url_cache
 
 User = get_user_model()
 
@@ -170,6 +170,37 @@ class BaseProfileModelTest(TestCase):
         self.failUnlessEqual(profile.get_mugshot_url(),
                              settings.MEDIA_URL + 'fake_image.png')
 
+    def test_mugshot_url_cached(self):
+        """ The URL of an uploaded mugshot is only asked once from storage """
+        mugshot_url_cache.clear()
+        profile = Profile.objects.get(pk=1)
+        profile.mugshot = 'fake_image.png'
+        url = profile.get_mugshot_url()
+        self.failUnless(mugshot_url_cache.get('fake_image.png') is url)
+
+        # A new mugshot gets a new URL
+        profile.mugshot = 'other_image.png'
+        self.failUnlessEqual(profile.get_mugshot_url(),
+                             settings.MEDIA_URL + 'other_image.png')
+
+    def test_mugshot_url_signed(self):
+        """ Signed URL's are only cached with a timeout """
+        mugshot_url_cache.clear()
+        profile = Profile.objects.get(pk=1)
+        profile.mugshot = 'fake_image.png'
+        profile.mugshot.storage.querystring_auth = True
+        try:
+            profile.get_mugshot_url()
+            self.failUnless(mugshot_url_cache.get('fake_image.png') is None)
+
+            userena_settings.USERENA_MUGSHOT_CACHE_TIMEOUT = 60
+            url = profile.get_mugshot_url()
+            self.failUnless(mugshot_url_cache.get('fake_image.png') is url)
+        finally:
+            del profile.mugshot.storage.querystring_auth
+            userena_settings.USERENA_MUGSHOT_CACHE_TIMEOUT = None
+            mugshot_url_cache.clear()
+
     def test_stringification(self):
         """ Profile should return a human-readable name as an object """
         profile = Profile.objects.get(pk=1)
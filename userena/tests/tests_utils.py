@@ -4,7 +4,8 @@ from django.conf import settings
 from django.utils.six.moves.urllib_parse import urlparse, parse_qs
 
 from userena.utils import (get_gravatar, signin_redirect, get_profile_model,
-                           get_protocol, get_user_model)
+                           get_protocol, get_user_model, gravatar_cache,
+                           LRUCache)
 from userena import settings as userena_settings
 from userena.compat import SiteProfileNotAvailable
 
@@ -37,6 +38,42 @@ class UtilsTests(TestCase):
             parse_qs(template % {'size': 80, 'type': '404'})
         )
 
+    def test_get_gravatar_cached(self):
+        """ The same Gravatar is only built once """
+        gravatar_cache.clear()
+        url = get_gravatar('alice@example.com')
+        self.failUnlessEqual(len(gravatar_cache), 1)
+        self.failUnless(get_gravatar('alice@example.com') is url)
+
+        # A changed email or option is a new Gravatar.
+        get_gravatar('alice@example.org')
+        get_gravatar('alice@example.com', size=200)
+        self.failUnlessEqual(len(gravatar_cache), 3)
+
+    def test_lru_cache(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+
+        # Using ``a`` makes ``b`` the least recently used item.
+        self.failUnlessEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.failUnlessEqual(cache.get('b'), None)
+        self.failUnlessEqual(cache.get('a'), 1)
+        self.failUnlessEqual(cache.get('c'), 3)
+
+        # A size of zero disables the cache.
+        cache = LRUCache(maxsize=0)
+        cache.set('a', 1)
+        self.failUnlessEqual(cache.get('a', 'missing'), 'missing')
+
+        # Items with a timeout expire.
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1, timeout=0)
+        cache.set('b', 2, timeout=60)
+        self.failUnlessEqual(cache.get('a'), None)
+        self.failUnlessEqual(cache.get('b'), 2)
+
     def test_signin_redirect(self):
         """
         Test redirect function which should redirect the user after a
@@ -2,11 +2,15 @@ import re
 
 from datetime import datetime, timedelta
 from django.core.urlresolvers import reverse
+from django.http import Http404
 from django.core import mail
 from django.contrib.auth.forms import PasswordChangeForm
+from django.contrib.auth.models import AnonymousUser
 from django.test import TestCase
+from django.test.client import RequestFactory
 
 from userena import forms
+from userena import views
 from userena import settings as userena_settings
 from userena.utils import get_user_model, get_user_profile
 
@@ -17,6 +21,20 @@ class UserenaViewsTests(TestCase):
     """ Test the account views """
     fixtures = ['users', 'profiles']
 
+    def setUp(self):
+        self.paginate_by = views.ProfileListView.paginate_by
+        self.list_settings = dict(
+            (name, getattr(userena_settings, name))
+            for name in ('USERENA_DISABLE_PROFILE_LIST',
+                         'USERENA_PROFILE_LIST_CURSOR',
+                         'USERENA_PROFILE_LIST_MAX_PAGE',
+                         'USERENA_PROFILE_LIST_COUNT'))
+
+    def tearDown(self):
+        views.ProfileListView.paginate_by = self.paginate_by
+        for name, value in self.list_settings.items():
+            setattr(userena_settings, name, value)
+
     def test_valid_activation(self):
         """ A ``GET`` to the activation view """
         # First, register an account.
@@ -402,6 +420,102 @@ class UserenaViewsTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'userena/profile_detail.html')
 
+    def test_profile_detail_view_queries(self):
+        """ The user and profile are fetched in one query """
+        profile = get_user_profile(user=User.objects.get(username='john'))
+        profile.privacy = 'open'
+        profile.save()
+
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        with self.assertNumQueries(1):
+            response = views.profile_detail(request, 'JOHN')
+            response.render()
+        self.assertEqual(response.context_data['profile'], profile)
+
+        self.assertRaises(Http404, views.profile_detail, request, 'nobody')
+
+    def test_profile_detail_view_conditional(self):
+        """ Unchanged profiles are answered with ``304 Not Modified`` """
+        userena_settings.USERENA_PROFILE_CONDITIONAL_GET = True
+        url = reverse('userena_profile_detail', kwargs={'username': 'john'})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.failUnless(response.has_header('Last-Modified'))
+        self.failUnless('Cookie' in response['Vary'])
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        # Changing the profile changes the ETag.
+        etag = response['ETag']
+        profile = get_user_profile(user=User.objects.get(username='john'))
+        profile.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        # Another viewer gets another ETag.
+        self.client.login(username='jane', password='blowfish')
+        self.failIfEqual(self.client.get(url)['ETag'], response['ETag'])
+        userena_settings.USERENA_PROFILE_CONDITIONAL_GET = False
+
+    def test_profile_detail_view_conditional_permission(self):
+        """ Missing and hidden profiles aren't answered with a 304 """
+        userena_settings.USERENA_PROFILE_CONDITIONAL_GET = True
+        since = 'Fri, 01 Jan 2100 00:00:00 GMT'
+        response = self.client.get(reverse('userena_profile_detail',
+                                           kwargs={'username': 'nobody'}),
+                                   HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 404)
+
+        profile = get_user_profile(user=User.objects.get(username='john'))
+        profile.privacy = 'closed'
+        profile.save()
+        url = reverse('userena_profile_detail', kwargs={'username': 'john'})
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 403)
+
+        # Signed in viewers are only answered by the ETag.
+        self.client.login(username='john', password='blowfish')
+        response = self.client.get(url)
+        self.failIf(response.has_header('Last-Modified'))
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 200)
+        userena_settings.USERENA_PROFILE_CONDITIONAL_GET = False
+
+    def test_profile_list_view_conditional(self):
+        """ The profile list is only rendered again when a profile changes """
+        userena_settings.USERENA_PROFILE_CONDITIONAL_GET = True
+        userena_settings.USERENA_DISABLE_PROFILE_LIST = False
+        url = reverse('userena_profile_list')
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Other pages have other ETags.
+        self.failIfEqual(self.client.get(url, {'page': 1})['ETag'], etag)
+
+        user = User.objects.get(username='jane')
+        user.first_name = 'Janet'
+        user.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        userena_settings.USERENA_PROFILE_CONDITIONAL_GET = False
+        userena_settings.USERENA_DISABLE_PROFILE_LIST = True
+
+    def test_profile_edit_view_permission(self):
+        """ The profile is resolved once for the permission check and view """
+        request = RequestFactory().get('/')
+        request.user = User.objects.get(username='jane')
+        response = views.profile_edit(request, username='john')
+        self.assertEqual(response.status_code, 403)
+
+        request = RequestFactory().get('/')
+        request.user = User.objects.get(username='john')
+        with self.assertNumQueries(2):
+            response = views.profile_edit(request, username='john')
+        self.assertEqual(response.status_code, 200)
+
     def test_profile_edit_view(self):
         """ A ``GET`` to the edit view of a users account """
         self.client.login(username='john', password='blowfish')
@@ -446,6 +560,84 @@ class UserenaViewsTests(TestCase):
         response = self.client.get(reverse('userena_profile_list'))
         self.assertEqual(response.status_code, 404)
 
+    def test_profile_list_view_cursor(self):
+        """ A ``GET`` to the list view paginated with a cursor """
+        userena_settings.USERENA_DISABLE_PROFILE_LIST = False
+        userena_settings.USERENA_PROFILE_LIST_CURSOR = True
+        views.ProfileListView.paginate_by = 1
+
+        response = self.client.get(reverse('userena_profile_list'))
+        page = response.context['page_obj']
+        self.assertEqual([p.pk for p in response.context['profile_list']], [1])
+        self.assertEqual(page.next_cursor, 1)
+        self.assertContains(response, '?after=1')
+
+        response = self.client.get(reverse('userena_profile_list'),
+                                   data={'after': page.next_cursor})
+        page = response.context['page_obj']
+        self.assertEqual([p.pk for p in response.context['profile_list']], [2])
+        self.failIf(page.has_next())
+
+        # Page numbers still work for shallow pages
+        response = self.client.get(reverse('userena_profile_list_paginated',
+                                           kwargs={'page': 2}))
+        self.assertEqual([p.pk for p in response.context['profile_list']], [2])
+
+        # An invalid cursor is not found
+        response = self.client.get(reverse('userena_profile_list'),
+                                   data={'after': 'x'})
+        self.assertEqual(response.status_code, 404)
+
+        # Deep pages are not served
+        userena_settings.USERENA_PROFILE_LIST_MAX_PAGE = 1
+        response = self.client.get(reverse('userena_profile_list_paginated',
+                                           kwargs={'page': 2}))
+        self.assertEqual(response.status_code, 404)
+
+        # Without cursor pagination all pages are served
+        userena_settings.USERENA_PROFILE_LIST_CURSOR = False
+        response = self.client.get(reverse('userena_profile_list_paginated',
+                                           kwargs={'page': 2}))
+        self.assertEqual(response.status_code, 200)
+
+    def test_profile_list_view_without_count(self):
+        """ A ``GET`` to the list view without counting the profiles """
+        userena_settings.USERENA_DISABLE_PROFILE_LIST = False
+        userena_settings.USERENA_PROFILE_LIST_COUNT = 'none'
+        views.ProfileListView.paginate_by = 1
+
+        response = self.client.get(reverse('userena_profile_list'))
+        self.assertEqual(response.status_code, 200)
+        self.failUnless(response.context['page_obj'].has_next())
+        self.assertEqual(response.context['paginator'].num_pages, None)
+
+        response = self.client.get(reverse('userena_profile_list_paginated',
+                                           kwargs={'page': 2}))
+        self.failIf(response.context['page_obj'].has_next())
+
+        response = self.client.get(reverse('userena_profile_list_paginated',
+                                           kwargs={'page': 3}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_profile_list_view_fields(self):
+        """ The list view only loads the fields used by the template """
+        view = views.ProfileListView()
+        view.request = RequestFactory().get(reverse('userena_profile_list'))
+        view.request.user = AnonymousUser()
+
+        profile = view.get_queryset()[0]
+        with self.assertNumQueries(0):
+            profile.user.username, profile.user.email
+            profile.mugshot, profile.privacy
+        with self.assertNumQueries(1):
+            profile.location
+
+        userena_settings.USERENA_PROFILE_LIST_FIELDS = ('location',)
+        profile = view.get_queryset()[0]
+        with self.assertNumQueries(0):
+            profile.location
+        userena_settings.USERENA_PROFILE_LIST_FIELDS = ()
+
     def test_password_reset_view_success(self):
         """ A ``POST`` to the password reset view with email that exists"""
         response = self.client.post(reverse('userena_password_reset'),
@@ -0,0 +1,194 @@
+"""
+Throttling of signin attempts.
+
+Every identification and every IP address has a counter of attempts in the
+cache defined by ``USERENA_CACHE_ALIAS``. The counters are sliding windows
+of the periods in ``USERENA_SIGNIN_THROTTLE_IDENTIFICATION`` and
+``USERENA_SIGNIN_THROTTLE_IP``. They are only changed with ``add``, ``incr``
+and ``decr`` of the cache, so parallel attempts can't exceed the limit.
+Attempts over the limit are rejected before the user is looked up and the
+password is hashed.
+
+An IP address counts all its attempts. An identification only counts its
+failed attempts, so signing in from several devices never locks a user out.
+Its counter is checked before the attempt and increased after it failed, so
+attempts that are checked at the same time can each fail once more.
+
+"""
+import threading
+import time
+
+from userena import settings as userena_settings
+from userena import signals as userena_signals
+from userena.cache import get_cache
+from userena.compat import md5_constructor
+
+THROTTLE_KEY = 'userena:throttle:%s:%s'
+
+_counters = {'allowed': 0, 'rejected': 0, 'lockouts': 0}
+_counters_lock = threading.Lock()
+
+
+def _count(name):
+    with _counters_lock:
+        _counters[name] += 1
+
+
+def get_counters():
+    """
+    Returns a dictionary with the amount of ``allowed`` and ``rejected``
+    attempts and the amount of ``lockouts`` in this process, for exporting
+    to your monitoring.
+
+    """
+    with _counters_lock:
+        return dict(_counters)
+
+
+def reset_counters():
+    """ Sets all counters back to zero. """
+    with _counters_lock:
+        for name in _counters:
+            _counters[name] = 0
+
+
+def _incr(cache, key, delta, timeout):
+    """ Adds ``delta`` to the counter ``key``, which is created if missing. """
+    cache.add(key, 0, timeout)
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # The counter was evicted in between.
+        cache.add(key, delta, timeout)
+        return delta
+
+
+def _windows(kind, value, period):
+    """
+    Returns the key of the counters of ``value``, the keys of the current
+    and the previous period and the weight of the previous period.
+
+    """
+    key = THROTTLE_KEY % (kind, md5_constructor(value.lower().encode('utf-8')).hexdigest())
+    now = time.time()
+    window = int(now // period)
+    weight = 1 - (now - window * period) / float(period)
+    return key, '%s:%d' % (key, window), '%s:%d' % (key, window - 1), weight
+
+
+def _reject(cache, key, kind, value, period):
+    """
+    Counts a rejected attempt. The first of a period sends the
+    ``signin_throttled`` signal.
+
+    """
+    _count('rejected')
+    if cache.add(key + ':locked', True, period):
+        _count('lockouts')
+        userena_signals.signin_throttled.send(sender=None, kind=kind,
+                                              value=value)
+
+
+def take_token(kind, value, rate):
+    """
+    Counts an attempt for ``value`` if it's still allowed.
+
+    The attempts of the current and the previous period are counted
+    separately. The previous period counts for the part of it that still
+    falls within the last ``period`` seconds. A rejected attempt isn't
+    counted, so the attempts become allowed again after a period.
+
+    The first rejected attempt of a period sends the ``signin_throttled``
+    signal.
+
+    :param kind:
+        String with the kind of counter, ``identification`` or ``ip``.
+
+    :param value:
+        String with the identification or IP address.
+
+    :param rate:
+        Tuple with the amount of attempts allowed within the amount of
+        seconds.
+
+    :return: Boolean ``True`` if the attempt is allowed.
+
+    """
+    attempts, period = rate
+    cache = get_cache()
+    key, current_key, previous_key, weight = _windows(kind, value, period)
+
+    count = _incr(cache, current_key, 1, period * 2)
+    previous = cache.get(previous_key) or 0
+    if previous * weight + count <= attempts:
+        _count('allowed')
+        return True
+
+    try:
+        cache.decr(current_key)
+    except ValueError:
+        pass
+    _reject(cache, key, kind, value, period)
+    return False
+
+
+def has_token(kind, value, rate):
+    """
+    Returns ``True`` if an attempt for ``value`` is allowed, like
+    :func:`take_token`, but without counting it.
+
+    """
+    attempts, period = rate
+    cache = get_cache()
+    key, current_key, previous_key, weight = _windows(kind, value, period)
+
+    counts = cache.get_many([current_key, previous_key])
+    if counts.get(previous_key, 0) * weight + counts.get(current_key, 0) + 1 <= attempts:
+        _count('allowed')
+        return True
+    _reject(cache, key, kind, value, period)
+    return False
+
+
+def get_client_ip(request):
+    """
+    Returns the IP address of the client of ``request``, read from the
+    ``request.META`` key in ``USERENA_SIGNIN_THROTTLE_IP_HEADER``. Of a
+    comma-separated list, like ``X-Forwarded-For``, the last address is
+    used, which is the one added by your own proxy.
+
+    """
+    value = request.META.get(userena_settings.USERENA_SIGNIN_THROTTLE_IP_HEADER)
+    if not value:
+        return None
+    return value.split(',')[-1].strip() or None
+
+
+def allow_signin(identification=None, ip=None):
+    """
+    Returns ``True`` if a signin attempt for ``identification`` from ``ip``
+    is allowed. Always ``True`` when ``USERENA_SIGNIN_THROTTLE`` is disabled.
+
+    The attempt is counted for ``ip``. For ``identification`` it's only
+    checked, call :func:`signin_failed` when the attempt failed.
+
+    """
+    if not userena_settings.USERENA_SIGNIN_THROTTLE:
+        return True
+    if ip and not take_token('ip', ip, userena_settings.USERENA_SIGNIN_THROTTLE_IP):
+        return False
+    if identification and not has_token('identification', identification,
+                                        userena_settings.USERENA_SIGNIN_THROTTLE_IDENTIFICATION):
+        return False
+    return True
+
+
+def signin_failed(identification):
+    """
+    Counts a failed signin attempt for ``identification``, when
+    ``USERENA_SIGNIN_THROTTLE`` is enabled.
+
+    """
+    if userena_settings.USERENA_SIGNIN_THROTTLE and identification:
+        take_token('identification', identification,
+                   userena_settings.USERENA_SIGNIN_THROTTLE_IDENTIFICATION)
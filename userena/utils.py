@@ -1,5 +1,6 @@
 from django.conf import settings
 from django.db.models import get_model
+from django.db.models.signals import class_prepared
 from django.utils.six import text_type
 from django.utils.six.moves.urllib.parse import urlencode
 
@@ -7,7 +8,13 @@ from userena import settings as userena_settings
 from userena.compat import SiteProfileNotAvailable
 from userena.compat import sha_constructor, md5_constructor
 
-import urllib, random, datetime
+import urllib, random, datetime, threading, time
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    # Python 2.6 requires library
+    from ordereddict import OrderedDict
 
 try:
     from django.utils.text import truncate_words
@@ -20,6 +27,73 @@ except ImportError:
         return Truncator(s).words(num, truncate=truncate)
     truncate_words = allow_lazy(truncate_words, text_type)
 
+class LRUCache(object):
+    """
+    A small thread-safe, in-process cache that holds at most ``maxsize``
+    items and drops the least recently used item when it's full.
+
+    :param maxsize:
+        Integer with the maximum amount of items. ``0`` disables the cache.
+
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """ Returns the value for ``key`` or ``default`` when not cached. """
+        with self._lock:
+            try:
+                value, expires = self._data.pop(key)
+            except KeyError:
+                return default
+            if expires is not None and expires <= time.time():
+                return default
+            self._data[key] = (value, expires)
+            return value
+
+    def set(self, key, value, timeout=None):
+        """
+        Caches ``value`` under ``key``. With a ``timeout`` in seconds the
+        item expires after that time.
+
+        """
+        if self.maxsize <= 0:
+            return
+        expires = time.time() + timeout if timeout is not None else None
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+gravatar_cache = LRUCache(userena_settings.USERENA_MUGSHOT_CACHE_SIZE)
+mugshot_url_cache = LRUCache(userena_settings.USERENA_MUGSHOT_CACHE_SIZE)
+
+def cache_mugshot_url(key, url, storage):
+    """
+    Caches the ``url`` of a mugshot or identicon in ``storage`` for
+    ``USERENA_MUGSHOT_CACHE_TIMEOUT`` seconds.
+
+    Storages that sign their URL's with an expiring query string, like the
+    S3 storages of ``django-storages`` with ``querystring_auth``, are only
+    cached when the timeout is set, because otherwise the cached URL's would
+    expire.
+
+    """
+    timeout = userena_settings.USERENA_MUGSHOT_CACHE_TIMEOUT
+    if timeout is None and getattr(storage, 'querystring_auth', False):
+        return
+    mugshot_url_cache.set(key, url, timeout)
+
 def get_gravatar(email, size=80, default='identicon'):
     """ Get's a Gravatar for a email address.
 
@@ -51,8 +125,18 @@ def get_gravatar(email, size=80, default='identicon'):
 
     :return: The URI pointing to the Gravatar.
 
+    The URI's are kept in a :class:`LRUCache` of
+    ``USERENA_MUGSHOT_CACHE_SIZE`` items, so rendering the same mugshots
+    doesn't hash the email address every time.
+
     """
-    if userena_settings.USERENA_MUGSHOT_GRAVATAR_SECURE:
+    secure = userena_settings.USERENA_MUGSHOT_GRAVATAR_SECURE
+    cache_key = (email, size, default, secure)
+    gravatar_url = gravatar_cache.get(cache_key)
+    if gravatar_url is not None:
+        return gravatar_url
+
+    if secure:
         base_url = 'https://secure.gravatar.com/avatar/'
     else: base_url = '//www.gravatar.com/avatar/'
 
@@ -64,6 +148,7 @@ def get_gravatar(email, size=80, default='identicon'):
         's': str(size),
         'd': default
     })
+    gravatar_cache.set(cache_key, gravatar_url)
     return gravatar_url
 
 def signin_redirect(redirect=None, user=None):
@@ -152,6 +237,104 @@ def get_user_profile(user):
         return profile
     return profile_model.objects.create(user=user)
 
+def get_profile_or_404(request, username):
+    """
+    Returns the profile of the user with ``username``, or raises
+    :class:`Http404` if there is no such user.
+
+    The user and the profile are fetched in one joined query, or from the
+    profile cache when ``USERENA_PROFILE_CACHE_TIMEOUT`` is set. The result
+    is memoized on the ``request``, so decorators and views that resolve the
+    same profile share it.
+
+    :param request:
+        The current :class:`HttpRequest`.
+
+    :param username:
+        String containing the username, matched case-insensitive.
+
+    """
+    from django.http import Http404
+    from userena.cache import get_profile_by_username
+    profiles = request.__dict__.setdefault('_userena_profiles', {})
+    key = username.lower()
+    if key not in profiles:
+        profile = get_profile_by_username(username)
+        if profile is None:
+            raise Http404
+        profiles[key] = profile
+    return profiles[key]
+
+def get_profile_perms(request, profile):
+    """
+    Returns the list of object permissions the user of ``request`` has on
+    ``profile``, memoized on the ``request``.
+
+    """
+    from guardian.core import ObjectPermissionChecker
+    perms = request.__dict__.setdefault('_userena_profile_perms', {})
+    if profile.pk not in perms:
+        checker = ObjectPermissionChecker(request.user)
+        perms[profile.pk] = _merge_perms(checker.get_perms(profile),
+                                         get_owner_perms(request.user, profile))
+    return perms[profile.pk]
+
+def get_owner_perms(user, obj):
+    """
+    Returns the list of permissions in ``ASSIGNED_PERMISSIONS`` that ``user``
+    has on ``obj`` because it's their own user or profile. These are answered
+    by the ``OwnerPermissionBackend`` without a database query. Without
+    ``USERENA_IMPLICIT_OWNER_PERMISSIONS`` owners have no implicit
+    permissions, only the rows of guardian count.
+
+    :param user:
+        A Django :class:`User` instance.
+
+    :param obj:
+        A :class:`User` or profile instance.
+
+    """
+    from userena.managers import ASSIGNED_PERMISSIONS
+    if not userena_settings.USERENA_IMPLICIT_OWNER_PERMISSIONS:
+        return []
+    if user is None or not user.is_authenticated() or not user.is_active:
+        return []
+    if isinstance(obj, get_user_model()):
+        model, owner_id = 'user', obj.pk
+    elif isinstance(obj, get_profile_model()):
+        model, owner_id = 'profile', obj.user_id
+    else: return []
+    if owner_id is None or owner_id != user.pk:
+        return []
+    return [perm[0] for perm in ASSIGNED_PERMISSIONS[model]]
+
+def check_owner_permission_backend():
+    """
+    Raises ``ImproperlyConfigured`` when ``USERENA_IMPLICIT_OWNER_PERMISSIONS``
+    is enabled without the ``OwnerPermissionBackend`` in
+    ``AUTHENTICATION_BACKENDS``. Owners would otherwise silently lose the
+    permissions on their own user and profile.
+
+    """
+    from django.core.exceptions import ImproperlyConfigured
+    if (userena_settings.USERENA_IMPLICIT_OWNER_PERMISSIONS and
+        'userena.backends.OwnerPermissionBackend' not in settings.AUTHENTICATION_BACKENDS):
+        raise ImproperlyConfigured("USERENA_IMPLICIT_OWNER_PERMISSIONS requires "
+                                   "'userena.backends.OwnerPermissionBackend' "
+                                   "in AUTHENTICATION_BACKENDS.")
+
+def _merge_perms(perms, extra_perms):
+    return list(perms) + [perm for perm in extra_perms if perm not in perms]
+
+def get_perms(user, obj):
+    """
+    Like :func:`guardian.shortcuts.get_perms`, but includes the permissions
+    the user has as owner of ``obj``, see :func:`get_owner_perms`.
+
+    """
+    from guardian.shortcuts import get_perms as get_guardian_perms
+    return _merge_perms(get_guardian_perms(user, obj), get_owner_perms(user, obj))
+
 def get_protocol():
     """
     Returns a string with the current protocol.
@@ -193,3 +376,35 @@ try:
 except ImportError:
     def get_user_model():
         return get_model(*user_model_label.rsplit('.', 1))
+
+def _prepared_models():
+    """ Returns the models which are already defined. """
+    try:
+        from django.apps import apps
+        app_models = apps.all_models
+    except ImportError:
+        # Django < 1.7
+        from django.db.models.loading import cache
+        app_models = cache.app_models
+    return [model for models in list(app_models.values())
+            for model in list(models.values())]
+
+def connect_user_and_profile(signal, receiver, dispatch_uid):
+    """
+    Connects ``receiver`` to the model ``signal`` of only the user model and
+    the profile model, and their proxies. Models which aren't defined yet are
+    connected as soon as they are.
+
+    """
+    labels = set(label.lower() for label in
+                 (user_model_label, getattr(settings, 'AUTH_PROFILE_MODULE', None) or ''))
+
+    def connect(sender, **kwargs):
+        model = getattr(sender._meta, 'concrete_model', None) or sender
+        label = '%s.%s' % (model._meta.app_label, model._meta.object_name)
+        if label.lower() in labels:
+            signal.connect(receiver, sender=sender, dispatch_uid=dispatch_uid)
+
+    class_prepared.connect(connect, weak=False)
+    for model in _prepared_models():
+        connect(model)
@@ -7,17 +7,27 @@ from django.views.generic import TemplateView
 from django.views.generic.list import ListView
 from django.contrib import messages
 from django.core.exceptions import PermissionDenied
+from django.core.paginator import InvalidPage
 from django.utils.translation import ugettext as _
 from django.http import Http404, HttpResponseRedirect
+from django.utils.decorators import method_decorator
 
 from userena.forms import (SignupForm, SignupFormOnlyEmail, AuthenticationForm,
                            ChangeEmailForm, EditProfileForm)
 from userena.models import UserenaSignup
-from userena.decorators import secure_required
+from userena.cache import (profile_detail_etag, profile_detail_last_modified,
+                           profile_list_etag, profile_list_last_modified)
+from userena.cdn import patch_profile_cache_headers
+from userena.decorators import (secure_required, profile_permission_required,
+                                profile_condition)
+from userena.paginator import (CursorPaginator, EstimatedCountPaginator,
+                               UncountedPaginator)
+from userena.throttle import allow_signin, get_client_ip
 from userena.utils import (signin_redirect, get_profile_model, get_user_model,
-                           get_user_profile)
+                           get_user_profile, get_profile_or_404)
 from userena import signals as userena_signals
 from userena import settings as userena_settings
+from userena.instrumentation import TimedViewMixin, timed
 
 from guardian.decorators import permission_required_or_403
 
@@ -36,13 +46,23 @@ class ExtraContextTemplateView(TemplateView):
     # this view is used in POST requests, e.g. signup when the form is not valid
     post = TemplateView.get
 
-class ProfileListView(ListView):
+class ProfileListView(TimedViewMixin, ListView):
     """ Lists all profiles """
     context_object_name='profile_list'
     page=1
     paginate_by=50
     template_name=userena_settings.USERENA_PROFILE_LIST_TEMPLATE
     extra_context=None
+    page_kwarg='page'
+    cursor_kwarg='after'
+    list_fields=('user', 'user__username', 'user__email', 'mugshot',
+                 'privacy')
+    timing_name='userena.view.profile_list'
+
+    @method_decorator(profile_condition(etag_func=profile_list_etag,
+                                        last_modified_func=profile_list_last_modified))
+    def dispatch(self, request, *args, **kwargs):
+        return super(ProfileListView, self).dispatch(request, *args, **kwargs)
 
     def get_context_data(self, **kwargs):
         # Call the base implementation first to get a context
@@ -58,6 +78,11 @@ class ProfileListView(ListView):
 
         if not self.extra_context: self.extra_context = dict()
 
+        # Resolve the mugshot thumbnails of the page in one go.
+        if userena_settings.USERENA_MUGSHOT_THUMBNAIL_ALIAS:
+            get_profile_model().objects.prefetch_mugshot_thumbnails(
+                context['object_list'])
+
         context['page'] = page
         context['paginate_by'] = self.paginate_by
         context['extra_context'] = self.extra_context
@@ -66,9 +91,74 @@ class ProfileListView(ListView):
 
     def get_queryset(self):
         profile_model = get_profile_model()
-        queryset = profile_model.objects.get_visible_profiles(self.request.user).select_related()
-        return queryset
+        queryset = profile_model.objects.get_visible_profiles(self.request.user)
+        queryset = queryset.select_related('user').only(*self.get_list_fields())
+        return queryset.order_by('pk')
+
+    def get_list_fields(self):
+        """
+        Returns the profile and user fields that are loaded for the list.
+
+        Only the columns used by ``userena/profile_list.html`` are selected.
+        Fields used by your own template can be added with the
+        ``USERENA_PROFILE_LIST_FIELDS`` setting.
+
+        """
+        return (tuple(self.list_fields) +
+                tuple(userena_settings.USERENA_PROFILE_LIST_FIELDS))
+
+    def get_paginator(self, queryset, per_page, orphans=0,
+                      allow_empty_first_page=True, **kwargs):
+        """
+        Returns the paginator for the ``USERENA_PROFILE_LIST_COUNT`` mode.
+
+        ``exact`` counts all visible profiles, ``estimate`` uses the row
+        estimate of the database and ``none`` doesn't count at all.
+
+        """
+        count_mode = userena_settings.USERENA_PROFILE_LIST_COUNT
+        if count_mode == 'none':
+            paginator_class = UncountedPaginator
+        elif count_mode == 'estimate':
+            paginator_class = EstimatedCountPaginator
+        else: paginator_class = self.paginator_class
+        return paginator_class(queryset, per_page, orphans=orphans,
+                               allow_empty_first_page=allow_empty_first_page,
+                               **kwargs)
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Paginates with page numbers or, when ``USERENA_PROFILE_LIST_CURSOR``
+        is enabled, with a cursor supplied by the ``after`` GET parameter.
+
+        Page numbers keep working in cursor mode, but only up to
+        ``USERENA_PROFILE_LIST_MAX_PAGE`` to avoid deep ``OFFSET`` scans.
+
+        """
+        if not userena_settings.USERENA_PROFILE_LIST_CURSOR:
+            return super(ProfileListView, self).paginate_queryset(queryset,
+                                                                  page_size)
+
+        page = self.kwargs.get(self.page_kwarg) or \
+               self.request.GET.get(self.page_kwarg) or 1
+        cursor = self.request.GET.get(self.cursor_kwarg)
+        if cursor is None and str(page) != '1':
+            max_page = userena_settings.USERENA_PROFILE_LIST_MAX_PAGE
+            try:
+                if max_page and int(page) > max_page:
+                    raise Http404
+            except ValueError: pass
+            return super(ProfileListView, self).paginate_queryset(queryset,
+                                                                  page_size)
+
+        paginator = CursorPaginator(queryset, page_size)
+        try:
+            page = paginator.page(cursor)
+        except InvalidPage:
+            raise Http404
+        return (paginator, page, page.object_list, page.has_other_pages())
 
+@timed('userena.view.signup')
 @secure_required
 def signup(request, signup_form=SignupForm,
            template_name='userena/signup_form.html', success_url=None,
@@ -145,6 +235,7 @@ def signup(request, signup_form=SignupForm,
     return ExtraContextTemplateView.as_view(template_name=template_name,
                                             extra_context=extra_context)(request)
 
+@timed('userena.view.activate')
 @secure_required
 def activate(request, activation_key,
              template_name='userena/activate_fail.html',
@@ -220,6 +311,7 @@ def activate(request, activation_key,
         return ExtraContextTemplateView.as_view(template_name=template_name,
                                                 extra_context=extra_context)(request)
 
+@timed('userena.view.activate_retry')
 @secure_required
 def activate_retry(request, activation_key,
                    template_name='userena/activate_retry_success.html',
@@ -263,6 +355,7 @@ def activate_retry(request, activation_key,
     except UserenaSignup.DoesNotExist:
         return redirect(reverse('userena_activate',args=(activation_key,)))
 
+@timed('userena.view.email_confirm')
 @secure_required
 def email_confirm(request, confirmation_key,
                   template_name='userena/email_confirm_fail.html',
@@ -310,6 +403,7 @@ def email_confirm(request, confirmation_key,
         return ExtraContextTemplateView.as_view(template_name=template_name,
                                             extra_context=extra_context)(request)
 
+@timed('userena.view.direct_to_user_template')
 def direct_to_user_template(request, username, template_name,
                             extra_context=None):
     """
@@ -348,6 +442,7 @@ def direct_to_user_template(request, username, template_name,
     return ExtraContextTemplateView.as_view(template_name=template_name,
                                             extra_context=extra_context)(request)
 
+@timed('userena.view.disabled_account')
 def disabled_account(request, username, template_name, extra_context=None):
     """
     Checks if the account is disabled, if so, returns the disabled account template.
@@ -386,6 +481,7 @@ def disabled_account(request, username, template_name, extra_context=None):
     return ExtraContextTemplateView.as_view(template_name=template_name,
                                             extra_context=extra_context)(request)
 
+@timed('userena.view.signin')
 @secure_required
 def signin(request, auth_form=AuthenticationForm,
            template_name='userena/signin_form.html',
@@ -432,15 +528,21 @@ def signin(request, auth_form=AuthenticationForm,
 
     """
     form = auth_form()
+    throttled = False
 
     if request.method == 'POST':
         form = auth_form(request.POST, request.FILES)
-        if form.is_valid():
+        # Too many attempts from this address are rejected without validating
+        # the form, which would hash the password.
+        throttled = not allow_signin(ip=get_client_ip(request))
+        if not throttled and form.is_valid():
             identification, password, remember_me = (form.cleaned_data['identification'],
                                                      form.cleaned_data['password'],
                                                      form.cleaned_data['remember_me'])
-            user = authenticate(identification=identification,
-                                password=password)
+            user = getattr(form, 'user_cache', None)
+            if user is None:
+                user = authenticate(identification=identification,
+                                    password=password)
             if user.is_active:
                 login(request, user)
                 if remember_me:
@@ -465,10 +567,15 @@ def signin(request, auth_form=AuthenticationForm,
     extra_context.update({
         'form': form,
         'next': request.REQUEST.get(redirect_field_name),
+        'throttled': throttled,
     })
-    return ExtraContextTemplateView.as_view(template_name=template_name,
-                                            extra_context=extra_context)(request)
+    response = ExtraContextTemplateView.as_view(template_name=template_name,
+                                                extra_context=extra_context)(request)
+    if throttled:
+        response.status_code = 429
+    return response
 
+@timed('userena.view.signout')
 @secure_required
 def signout(request, next_page=userena_settings.USERENA_REDIRECT_ON_SIGNOUT,
             template_name='userena/signout.html', *args, **kwargs):
@@ -490,6 +597,7 @@ def signout(request, next_page=userena_settings.USERENA_REDIRECT_ON_SIGNOUT,
     userena_signals.account_signout.send(sender=None, user=request.user)
     return Signout(request, next_page, template_name, *args, **kwargs)
 
+@timed('userena.view.email_change')
 @secure_required
 @permission_required_or_403('change_user', (get_user_model(), 'username', 'username'))
 def email_change(request, username, email_form=ChangeEmailForm,
@@ -561,6 +669,7 @@ def email_change(request, username, email_form=ChangeEmailForm,
     return ExtraContextTemplateView.as_view(template_name=template_name,
                                             extra_context=extra_context)(request)
 
+@timed('userena.view.password_change')
 @secure_required
 @permission_required_or_403('change_user', (get_user_model(), 'username', 'username'))
 def password_change(request, username, template_name='userena/password_form.html',
@@ -625,8 +734,9 @@ def password_change(request, username, template_name='userena/password_form.html
     extra_context['profile'] = get_user_profile(user=user)
     return ExtraContextTemplateView.as_view(template_name=template_name,
                                             extra_context=extra_context)(request)
+@timed('userena.view.profile_edit')
 @secure_required
-@permission_required_or_403('change_profile', (get_profile_model(), 'user__username', 'username'))
+@profile_permission_required('change_profile')
 def profile_edit(request, username, edit_profile_form=EditProfileForm,
                  template_name='userena/profile_form.html', success_url=None,
                  extra_context=None, **kwargs):
@@ -671,9 +781,8 @@ def profile_edit(request, username, edit_profile_form=EditProfileForm,
         Instance of the ``Profile`` that is edited.
 
     """
-    user = get_object_or_404(get_user_model(), username__iexact=username)
-
-    profile = get_user_profile(user=user)
+    profile = get_profile_or_404(request, username)
+    user = profile.user
 
     user_initial = {'first_name': user.first_name,
                     'last_name': user.last_name}
@@ -704,6 +813,20 @@ def profile_edit(request, username, edit_profile_form=EditProfileForm,
     extra_context['profile'] = profile
     return ExtraContextTemplateView.as_view(template_name=template_name,
                                             extra_context=extra_context)(request)
+def check_profile_detail(request, username, *args, **kwargs):
+    """
+    Raises :class:`Http404` or :class:`PermissionDenied` when the user of
+    ``request`` may not view the profile of ``username``.
+
+    """
+    profile = get_profile_or_404(request, username)
+    if not profile.can_view_profile(request.user):
+        raise PermissionDenied
+
+@timed('userena.view.profile_detail')
+@profile_condition(etag_func=profile_detail_etag,
+                   last_modified_func=profile_detail_last_modified,
+                   check_func=check_profile_detail)
 def profile_detail(request, username,
     template_name=userena_settings.USERENA_PROFILE_DETAIL_TEMPLATE,
     extra_context=None, **kwargs):
@@ -727,16 +850,16 @@ def profile_detail(request, username,
         Instance of the currently viewed ``Profile``.
 
     """
-    user = get_object_or_404(get_user_model(), username__iexact=username)
-    profile = get_user_profile(user=user)
-    if not profile.can_view_profile(request.user):
-        raise PermissionDenied
+    check_profile_detail(request, username)
+    profile = get_profile_or_404(request, username)
     if not extra_context: extra_context = dict()
     extra_context['profile'] = profile
     extra_context['hide_email'] = userena_settings.USERENA_HIDE_EMAIL
-    return ExtraContextTemplateView.as_view(template_name=template_name,
-                                            extra_context=extra_context)(request)
+    response = ExtraContextTemplateView.as_view(template_name=template_name,
+                                                extra_context=extra_context)(request)
+    return patch_profile_cache_headers(request, response, profile)
 
+@timed('userena.view.profile_list')
 def profile_list(request, page=1, template_name='userena/profile_list.html',
                  paginate_by=50, extra_context=None, **kwargs): # pragma: no cover
     """